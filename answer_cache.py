@@ -0,0 +1,177 @@
+# answer_cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+)
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
+
+
+class SemanticAnswerCache:
+    """
+    每个主题一份的语义答案缓存 (SQLite 持久化，重启后仍有效)。
+    - 以问题向量的余弦相似度查找，超过 threshold 视为同一问题，直接返回之前的回答与参考来源
+    - 条目记录生成时的主题版本号与 Embedding 模型，主题重新入库后旧答案全部作废
+    - 超过 max_entries 时淘汰最久未命中的条目 (LRU)
+    """
+
+    def __init__(
+        self,
+        theme: str,
+        db_path: str = ANSWER_CACHE_PATH,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.theme = theme
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                theme TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_theme ON answers (theme, last_used)")
+        self._conn.commit()
+        # 内存中的向量矩阵，按 (版本, 模型) 加载
+        self._loaded_key = None
+        self._ids: List[int] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def _load(self, version: int, model: str):
+        """切换到当前版本：删除旧版本/其他模型的条目并把向量读入内存"""
+        if self._loaded_key == (version, model):
+            return
+        deleted = self._conn.execute(
+            "DELETE FROM answers WHERE theme = ? AND (version != ? OR model != ?)", (self.theme, version, model)
+        ).rowcount
+        self._conn.commit()
+        if deleted:
+            print(f"🧽 [AnswerCache] 主题 {self.theme} 已更新，清除 {deleted} 条旧答案")
+        rows = self._conn.execute("SELECT id, embedding FROM answers WHERE theme = ?", (self.theme,)).fetchall()
+        self._ids = [row[0] for row in rows]
+        vectors = [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+        self._matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self._loaded_key = (version, model)
+
+    def lookup(self, embedding: List[float], version: int, model: str) -> Optional[Dict]:
+        """返回最相似且超过阈值的缓存条目 (含 query / answer / sources / similarity)，未命中返回 None"""
+        if not embedding:
+            return None
+        with self._lock:
+            self._load(version, model)
+            if not self._ids or self._matrix.shape[1] != len(embedding):
+                self.misses += 1
+                return None
+            sims = self._matrix @ _unit(embedding)
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = self._ids[best]
+            row = self._conn.execute(
+                "SELECT query, answer, sources FROM answers WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                self._loaded_key = None
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            self._conn.commit()
+            self.hits += 1
+            return {
+                "query": row[0],
+                "answer": row[1],
+                "sources": json.loads(row[2]),
+                "similarity": similarity,
+            }
+
+    def put(self, query: str, embedding: List[float], answer: str, sources: List[Dict], version: int, model: str):
+        if not embedding or not answer:
+            return
+        vector = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            self._load(version, model)
+            cursor = self._conn.execute(
+                "INSERT INTO answers (theme, version, model, query, embedding, answer, sources, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.theme, version, model, query, vector.tobytes(), answer,
+                 json.dumps(sources, ensure_ascii=False, default=float), now, now),
+            )
+            self._ids.append(cursor.lastrowid)
+            self._matrix = np.vstack([self._matrix, vector]) if self._matrix.size else vector[None, :]
+
+            overflow = len(self._ids) - self.max_entries
+            if overflow > 0:
+                # 淘汰最久未命中的条目
+                self._conn.execute(
+                    "DELETE FROM answers WHERE id IN "
+                    "(SELECT id FROM answers WHERE theme = ? ORDER BY last_used ASC LIMIT ?)",
+                    (self.theme, overflow),
+                )
+                self._loaded_key = None
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_caches: Dict[str, SemanticAnswerCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(theme: str) -> SemanticAnswerCache:
+    """进程内每个主题共享一个实例"""
+    with _caches_lock:
+        if theme not in _caches:
+            _caches[theme] = SemanticAnswerCache(theme)
+        return _caches[theme]
+
+
+def answer_cache_stats() -> Dict[str, Dict]:
+    """本进程内各主题答案缓存的命中率"""
+    with _caches_lock:
+        return {theme: cache.stats() for theme, cache in _caches.items()}
@@ -0,0 +1,60 @@
+# api_retry.py
+import time
+import random
+import threading
+from typing import Callable, Optional
+
+
+class RateLimiter:
+    """线程安全的限速器：保证相邻两次请求的间隔不小于 60 / rpm 秒"""
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    """429 / 5xx / 网络超时类错误值得重试，其余 (如 400 参数错误) 直接失败"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "Timeout", "ConnectionError")
+
+
+def call_with_backoff(
+    func: Callable,
+    *args,
+    max_retries: int = 5,
+    rate_limiter: Optional[RateLimiter] = None,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+):
+    """带指数退避 (含随机抖动) 的调用，不可重试的错误或重试耗尽时抛出最后一次异常"""
+    attempt = 0
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            return func(*args)
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+            time.sleep(delay * (0.5 + random.random() / 2))
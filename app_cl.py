@@ -1,12 +1,16 @@
 import chainlit as cl
 import textwrap
-import base64
 import os
 import asyncio
-import subprocess
 import shutil
 from rag_agent import RAGAgent
 from chat_manager import ChatManager
+from image_utils import prepare_image
+from ingest_worker import get_ingest_worker
+from clients import run_storage
+from query_cache import query_cache_stats
+from answer_cache import answer_cache_stats
+from embedding_provider import EmbeddingModelMismatch
 import urllib.parse
 import re
 
@@ -14,6 +18,7 @@ import re
 
 # [新增] 挂载静态目录，让前端能访问 static/images 下的图片
 from chainlit.server import app
+from fastapi import HTTPException
 from fastapi.staticfiles import StaticFiles
 # 1. 导入 config 中定义好的跨平台路径
 from config import STATIC_DIR 
@@ -51,7 +56,6 @@ WELCOME_HTML = textwrap.dedent("""
 
 # === 配置区 ===
 BASE_DATA_PATH = os.path.join(".", "data")
-PROCESS_SCRIPT_PATH = os.path.join(".", "process_data.py")
 
 os.makedirs(BASE_DATA_PATH, exist_ok=True)
 
@@ -60,6 +64,28 @@ os.makedirs(STATIC_DIR, exist_ok=True)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# 入库任务状态查询接口 (前端或脚本可轮询)
+@app.get("/ingest/jobs")
+async def list_ingest_jobs(theme: str = None):
+    return get_ingest_worker().list_jobs(theme)
+
+# 查询侧缓存命中率
+@app.get("/stats/query_cache")
+async def get_query_cache_stats():
+    return query_cache_stats()
+
+# 语义答案缓存命中率 (按主题)
+@app.get("/stats/answer_cache")
+async def get_answer_cache_stats():
+    return answer_cache_stats()
+
+@app.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    status = get_ingest_worker().get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return status
+
 # === 辅助函数 ===
 def clean_html(html_str):
     """
@@ -90,8 +116,75 @@ async def clear_screen():
             pass # 忽略已删除的消息
     cl.user_session.set("msg_ids", []) # 清空记录
 
+def format_job_progress(status):
+    """把入库任务的进度快照格式化为一行提示"""
+    progress = status.get("progress", {})
+    parts = []
+    if progress.get("files_total"):
+        parts.append(f"文件 {progress.get('files_done', 0)}/{progress['files_total']}")
+    if progress.get("images_total"):
+        parts.append(f"图片 {progress.get('images_done', 0)}/{progress['images_total']}")
+    if progress.get("chunks_written"):
+        parts.append(f"已写入 {progress['chunks_written']} 条")
+    return "，".join(parts) or "排队中"
+
+async def watch_ingest_job(job_id, msg, interval=2.0):
+    """轮询后台入库任务，把进度更新到消息上，直到任务结束"""
+    worker = get_ingest_worker()
+    last_content = None
+    while True:
+        status = worker.get_status(job_id)
+        if status is None:
+            return
+        if status["status"] == "done":
+            msg.content = f"🖼️ **图片分析已完成**（{format_job_progress(status)}），图片内容现在也可以检索了。"
+        elif status["status"] == "failed":
+            msg.content = f"❌ 后台图片分析失败: {status.get('error')}"
+        else:
+            msg.content = f"🖼️ 后台图片分析中… {format_job_progress(status)}"
+        if msg.content != last_content:
+            last_content = msg.content
+            try:
+                await msg.update()
+            except Exception as e:
+                print(f"DEBUG: 更新图片任务进度失败: {e}")
+                return
+        if status["status"] in ("done", "failed"):
+            return
+        await asyncio.sleep(interval)
+
+async def send_cached_answer(cached, chat_manager, chat_history):
+    """直接发送语义答案缓存中的回答，并标注命中缓存"""
+    images = []
+    source_elements = []
+    seen_images = set()
+    for idx, doc in enumerate(cached["sources"]):
+        meta = doc["metadata"]
+        raw_img_path = meta.get("image_path")
+        if (idx < 5
+            and raw_img_path
+            and str(raw_img_path).strip()
+            and raw_img_path not in seen_images
+            and os.path.exists(raw_img_path)):
+            images.append(cl.Image(path=raw_img_path, name=f"参考图_{len(seen_images)+1}", display="inline"))
+            seen_images.add(raw_img_path)
+        content_preview = f"文件: {meta.get('filename')}\n页码: {meta.get('page_number', 'N/A')}\n\n{doc['content']}"
+        source_elements.append(cl.Text(name=f"参考来源 {idx+1}", content=content_preview, display="side"))
+
+    answer = cached["answer"]
+    marker = f"> ⚡ 命中答案缓存：与此前的问题「{cached['query']}」高度相似（相似度 {cached['similarity']:.2f}），直接返回已有回答。\n\n"
+    msg = cl.Message(content=marker + answer, elements=images + source_elements)
+    await msg.send()
+    track_msg_id(msg.id)
+
+    # 历史中只记录回答本身，不含缓存标记
+    chat_manager.append_message("assistant", answer)
+    chat_history.append({"role": "assistant", "content": answer})
+    cl.user_session.set("restored_history", chat_history)
+
 async def update_settings_panel(chat_manager, current_theme):
-    history_chats = chat_manager.list_chats()
+    # 会话文件的读写在存储线程池中执行，不阻塞事件循环
+    history_chats = await run_storage(chat_manager.list_chats)
     chat_options = [c["filename"] for c in history_chats]
     if chat_manager.current_filename:
         current_selection = chat_manager.current_filename
@@ -182,7 +275,7 @@ async def on_settings_update(settings):
     # ==========================================
     if delete_session_target != "(不删除)":
         is_deleting_current = (delete_session_target == chat_manager.current_filename)
-        success = chat_manager.delete_chat(delete_session_target)
+        success = await run_storage(chat_manager.delete_chat, delete_session_target)
         
         if success:
             await cl.Message(content=f"🗑️ 已删除会话: `{delete_session_target}`").send()
@@ -237,7 +330,7 @@ async def on_settings_update(settings):
         # C. 处理“加载历史会话”
         else:
             chat_manager.current_filename = selected_filename
-            messages = chat_manager.load_chat_by_filename(selected_filename)
+            messages = await run_storage(chat_manager.load_chat_by_filename, selected_filename)
             
             if messages is not None: 
                 restored_history = [{"role": m["role"], "content": m["content"]} for m in messages]
@@ -264,7 +357,7 @@ async def on_settings_update(settings):
     # 3. 重命名逻辑
     # ==========================================
     if new_name and new_name != chat_manager.current_chat_name:
-        success = chat_manager.rename_chat(new_name)
+        success = await run_storage(chat_manager.rename_chat, new_name)
         if success:
             await cl.Message(content=f"✅ 重命名成功: `{chat_manager.current_filename}`").send()
             # 重命名肯定要刷新
@@ -324,13 +417,14 @@ async def main(message: cl.Message):
 
     if chat_manager.current_filename is None:
         # 用户发了第一句话，现在才真正创建文件
-        chat_manager.create_new_chat()
+        await run_storage(chat_manager.create_new_chat)
         
         # 顺便更新一下侧边栏，让下拉框从 "✨ 新建对话" 跳变到新生成的文件名
         # 这样用户就知道会话已经保存了
         await update_settings_panel(chat_manager, current_theme)
     
     image_base64 = None
+    image_mime = "image/jpeg"
     image_analysis_content = ""
     docs_uploaded = False
 
@@ -344,26 +438,30 @@ async def main(message: cl.Message):
             processing_msg = cl.Message(content=f"📥 文件已保存，正在快速处理文本...")
             await processing_msg.send()
 
+            uploaded_paths = []
             for doc in doc_files:
                 dest_path = os.path.join(theme_path, doc.name)
                 with open(doc.path, "rb") as f_src:
                     with open(dest_path, "wb") as f_dst:
                         f_dst.write(f_src.read())
+                uploaded_paths.append(dest_path)
             
             # ==================================================
             # 阶段 1: 快速文本模式 (阻塞等待，用户需等待几秒)
             # ==================================================
-            # 注意：加上 --text_only 参数
-            cmd_text = ["python", PROCESS_SCRIPT_PATH, "--theme", current_theme, "--incremental", "--text_only"]
-            
-            # 使用同步方法的包装器
-            def run_text_sync():
-                return subprocess.run(cmd_text, capture_output=True, text=True)
-            
-            # 使用 cl.make_async 将其转为非阻塞调用，但这里我们要 await 结果
-            result_text = await cl.make_async(run_text_sync)()
-
-            if result_text.returncode == 0:
+            # 提交给常驻入库 worker，客户端与集合保持常驻，无需冷启动子进程
+            # 只处理本次上传的文件，耗时与新文件大小相关，与课程已有资料的多少无关
+            worker = get_ingest_worker()
+            text_job = worker.submit(current_theme, incremental=True, text_only=True, file_paths=uploaded_paths)
+
+            try:
+                await asyncio.wrap_future(text_job.future)
+                text_ok = True
+            except Exception as e:
+                text_ok = False
+                text_error = str(e)
+
+            if text_ok:
                 # 文本成功！更新UI告诉用户可以开始玩了
                 processing_msg.content = f"✅ **文本处理已完成！**\n(图片分析任务已在后台启动，您可以先针对文本内容提问...)"
                 await processing_msg.update()
@@ -371,29 +469,18 @@ async def main(message: cl.Message):
                 # ==================================================
                 # 阶段 2: 图片/OCR 模式 (Fire-and-Forget 后台任务)
                 # ==================================================
-                async def run_background_images():
-                    # 必须加 --incremental (防止清空刚才的文本) 和 --image_only
-                    cmd_img = ["python", PROCESS_SCRIPT_PATH, "--theme", current_theme, "--incremental", "--image_only"]
-                    
-                    print(f"DEBUG: 启动后台图片处理: {current_theme}")
-                    
-                    def run_img_sync():
-                        return subprocess.run(cmd_img, capture_output=True, text=True)
-                    
-                    # 异步运行，不等待
-                    res = await cl.make_async(run_img_sync)()
-                    
-                    if res.returncode == 0:
-                        print(f"DEBUG: 后台图片处理完成: {current_theme}")
-                    else:
-                        print(f"DEBUG: 后台图片处理失败: {res.stderr}")
-
-                # 关键：创建一个后台任务，不要 await 它！
-                asyncio.create_task(run_background_images())
+                # 后台通道独立于文本通道，不会阻塞后续上传的文本处理
+                print(f"DEBUG: 启动后台图片处理: {current_theme}")
+                image_job = worker.submit(current_theme, incremental=True, image_only=True, file_paths=uploaded_paths)
+
+                # 轮询任务进度，而不是让用户猜图片分析何时结束
+                image_status_msg = cl.Message(content="🖼️ 后台图片分析排队中…")
+                await image_status_msg.send()
+                asyncio.create_task(watch_ingest_job(image_job.id, image_status_msg))
                 
             else:
                 # 文本处理都失败了，报错
-                processing_msg.content = f"❌ 文本处理失败:\n{result_text.stderr}"
+                processing_msg.content = f"❌ 文本处理失败:\n{text_error}"
                 await processing_msg.update()
             
             docs_uploaded = True
@@ -401,8 +488,8 @@ async def main(message: cl.Message):
         for element in message.elements:
             if "image" in element.mime:
                 try:
-                    with open(element.path, "rb") as image_file:
-                        image_base64 = base64.b64encode(image_file.read()).decode('utf-8')
+                    # 缩放、压缩并识别正确的 MIME 类型 (与入库共用同一预处理)
+                    image_base64, image_mime = await cl.make_async(prepare_image)(element.path)
                     break 
                 except: pass
 
@@ -416,7 +503,7 @@ async def main(message: cl.Message):
     if image_base64:
         async with cl.Step(name="👁️ 视觉语义分析", type="tool") as step:
             step.input = "分析中..."
-            analysis_result = await cl.make_async(agent.understand_image)(image_base64)
+            analysis_result = await agent.aunderstand_image(image_base64, image_mime=image_mime)
             step.output = analysis_result
             image_analysis_content = analysis_result
 
@@ -424,6 +511,17 @@ async def main(message: cl.Message):
     if image_analysis_content:
         final_query += f"\n详细背景：{image_analysis_content}"
 
+    # 本轮提问之前的对话，用于问题重写
+    prior_history = chat_history[:-1]
+
+    # 语义答案缓存：相似问题直接返回之前的回答，跳过检索与生成 (带图片的提问依赖图片本身，不走缓存)
+    # 追问要等重写成独立问题后再查，见下方
+    if not image_base64 and not prior_history:
+        cached = await agent.alookup_cached_answer(final_query)
+        if cached:
+            await send_cached_answer(cached, chat_manager, chat_history)
+            return
+
     # async with cl.Step(name="SCARAG 思考中...", type="tool") as step:
     #     step.input = final_query
     #     context_str, results = await cl.make_async(agent.retrieve_context)(final_query)              
@@ -464,7 +562,14 @@ async def main(message: cl.Message):
 
     async with cl.Step(name="SCARAG 思考中...", type="tool") as step:
         step.input = final_query
-        context_str, results = await cl.make_async(agent.retrieve_context)(final_query)              
+        try:
+            # 追问时问题重写与预检索并行进行
+            search_query, context_str, results = await agent.aretrieve_with_rewrite(final_query, prior_history)
+        except EmbeddingModelMismatch as e:
+            # 集合与当前 Embedding 模型不一致，拒绝检索并提示重建
+            step.output = str(e)
+            await cl.Message(content=f"❌ {e}").send()
+            return
 
         # === 核心修复：可视化检索结果 ===
         elements = []
@@ -503,6 +608,8 @@ async def main(message: cl.Message):
                 detail_text += "\n"
 
         step.output = f"检索到 {len(results)} 条资料"
+        if search_query != final_query:
+            step.output = f"问题重写: {search_query}\n{step.output}"
 
         if not detail_text.strip():
             detail_text = "未检索到相关文档内容，将尝试使用通用知识回答。"
@@ -511,6 +618,12 @@ async def main(message: cl.Message):
         elements.insert(0, cl.Text(name="检索详情", content=detail_text, display="inline"))
         step.elements = elements
 
+    if not image_base64 and prior_history:
+        cached = await agent.alookup_cached_answer(search_query)
+        if cached:
+            await send_cached_answer(cached, chat_manager, chat_history)
+            return
+
     source_elements = []
     for idx, doc in enumerate(results):
         meta = doc['metadata']
@@ -543,16 +656,18 @@ async def main(message: cl.Message):
     track_msg_id(final_answer_msg.id)
 
     # 4. 生成与流式输出
-    full_answer = await cl.make_async(agent.generate_response)(
+    # 模型每返回一段增量文本就立即转发到界面，首字延迟即模型本身的首 token 延迟
+    answer_parts = []
+    async for delta in agent.agenerate_response_stream(
         query=message.content,
         context=context_str,
         chat_history=chat_history,
-        image_base64=image_base64
-    )
-
-    for char in full_answer:
-        await final_answer_msg.stream_token(char)
-        await asyncio.sleep(0.002)
+        image_base64=image_base64,
+        image_mime=image_mime,
+    ):
+        answer_parts.append(delta)
+        await final_answer_msg.stream_token(delta)
+    full_answer = "".join(answer_parts)
     
     # 5. 【关键修改】合并图片和侧边栏引用，避免覆盖
     # 这样图片会保留在消息下方，引用会出现在侧边栏
@@ -562,4 +677,7 @@ async def main(message: cl.Message):
 
     chat_manager.append_message("assistant", full_answer)
     chat_history.append({"role": "assistant", "content": full_answer})
+
+    if not image_base64:
+        await agent.acache_answer(search_query, full_answer, results)
     cl.user_session.set("restored_history", chat_history)
\ No newline at end of file
@@ -0,0 +1,112 @@
+# bench_text_splitter.py
+"""
+TextSplitter 微基准：对比旧版按字符切分 (多次正则 + insert(0) 回溯重叠) 与当前按 token 切分的耗时。
+
+语法: python bench_text_splitter.py [--sentences N] [--repeat R]
+"""
+import re
+import time
+import random
+import argparse
+
+from text_splitter import TextSplitter, count_tokens_batch, _get_encoder
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+
+def legacy_split_text(text: str, chunk_size: int, chunk_overlap: int):
+    """旧版实现 (按字符计数)，仅用于对比"""
+    sentence_endings = r'([。！？.!?]+[\"\']?(\s|$))'
+    parts = re.split(sentence_endings, text)
+    sentences = []
+    current_sent = ""
+    for part in parts:
+        if part is None:
+            continue
+        current_sent += part
+        if re.search(r'[。！？.!?]', part) or len(part.strip()) == 0:
+            if current_sent.strip():
+                sentences.append(current_sent)
+            current_sent = ""
+    if current_sent.strip():
+        sentences.append(current_sent)
+
+    chunks = []
+    current_chunk_sentences = []
+    current_len = 0
+    for sentence in sentences:
+        sent_len = len(sentence)
+        if current_len + sent_len > chunk_size:
+            if current_chunk_sentences:
+                chunks.append("".join(current_chunk_sentences))
+            overlap_buffer = []
+            overlap_len = 0
+            for old_sent in reversed(current_chunk_sentences):
+                if overlap_len + len(old_sent) <= chunk_overlap:
+                    overlap_buffer.insert(0, old_sent)
+                    overlap_len += len(old_sent)
+                else:
+                    break
+            current_chunk_sentences = overlap_buffer
+            current_len = overlap_len
+        current_chunk_sentences.append(sentence)
+        current_len += sent_len
+    if current_chunk_sentences:
+        chunks.append("".join(current_chunk_sentences))
+    return chunks
+
+
+def build_corpus(num_sentences: int, seed: int = 0) -> str:
+    """生成中英文混排的课程讲义式文本，包含段落、超长无标点行和小数"""
+    rng = random.Random(seed)
+    zh = ["栈是一种后进先出的线性表", "二叉树的遍历分为前序、中序和后序", "哈希表通过散列函数定位元素",
+          "快速排序的平均时间复杂度为 O(n log n)", "图的最短路径可以用 Dijkstra 算法求解"]
+    en = ["A heap keeps the smallest element at the root", "Amortized cost of push is O(1)",
+          "The load factor is usually kept below 0.75", "Use BFS when edges are unweighted"]
+    parts = []
+    for i in range(num_sentences):
+        if rng.random() < 0.6:
+            parts.append(rng.choice(zh) + rng.choice(["。", "！", "？", "；"]))
+        else:
+            parts.append(rng.choice(en) + rng.choice([". ", "! ", "? "]))
+        if i % 25 == 24:
+            parts.append("\n\n")
+        if i % 500 == 499:
+            parts.append("x" * 3000 + "\n")  # 无标点的超长行 (表格/代码)
+    return "".join(parts)
+
+
+def timeit(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=200_000, help="语料句子数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数 (取最快一次)")
+    args = parser.parse_args()
+
+    text = build_corpus(args.sentences)
+    splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    mode = "tiktoken" if _get_encoder() is not None else "估算"
+    print(f"📄 语料: {len(text):,} 字符，token 计数方式: {mode}")
+
+    legacy_time = timeit(lambda: legacy_split_text(text, CHUNK_SIZE, CHUNK_OVERLAP), args.repeat)
+    new_time = timeit(lambda: splitter.split_text(text), args.repeat)
+
+    legacy_chunks = legacy_split_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+    new_chunks = splitter.split_text(text)
+    legacy_max = max(count_tokens_batch(legacy_chunks))
+    new_max = max(count_tokens_batch(new_chunks))
+
+    print(f"旧版 (字符): {legacy_time:.3f}s, {len(legacy_chunks)} 块, 最大块 {legacy_max} tokens")
+    print(f"新版 (token): {new_time:.3f}s, {len(new_chunks)} 块, 最大块 {new_max} tokens (上限 {CHUNK_SIZE})")
+    print(f"⚡ 加速比: {legacy_time / new_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
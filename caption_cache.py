@@ -0,0 +1,80 @@
+# caption_cache.py
+import os
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Optional
+
+from config import CAPTION_CACHE_PATH
+
+
+def image_file_hash(image_path: str) -> str:
+    """图片文件内容的 sha256"""
+    h = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class CaptionCache:
+    """
+    视觉描述的磁盘缓存 (SQLite)。
+    键为 (图片内容哈希, 视觉模型名, 提示词版本)，任一变化都会视为未命中。
+    """
+
+    def __init__(self, db_path: str = CAPTION_CACHE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS captions (
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                caption TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (image_hash, model, prompt_version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, image_hash: str, model: str, prompt_version: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT caption FROM captions WHERE image_hash = ? AND model = ? AND prompt_version = ?",
+                (image_hash, model, prompt_version),
+            ).fetchone()
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, image_hash: str, model: str, prompt_version: str, caption: str) -> None:
+        if not caption:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?)",
+                (image_hash, model, prompt_version, caption, datetime.now().isoformat()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
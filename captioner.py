@@ -0,0 +1,215 @@
+# captioner.py
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional, Tuple
+
+from tqdm import tqdm
+
+from config import (
+    VISION_CONCURRENCY,
+    VISION_RPM,
+    VISION_MAX_RETRIES,
+    VISION_MODEL_NAME,
+    CAPTION_RETRY_DIR,
+)
+from manifest import file_hash, file_key
+from api_retry import RateLimiter, call_with_backoff
+from caption_cache import CaptionCache, image_file_hash
+from image_triage import ImageTriage
+from image_utils import prepare_image
+from rag_agent import RAGAgent, VISION_PROMPT_VERSION
+
+
+class CaptionRetryList:
+    """持久化的失败图片列表，下次运行图片阶段时会被重新处理"""
+
+    def __init__(self, theme: str, retry_dir: str = CAPTION_RETRY_DIR):
+        os.makedirs(retry_dir, exist_ok=True)
+        self.path = os.path.join(retry_dir, f"{theme}.json")
+
+    def has_entries(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> List[Dict]:
+        """读取仍然有效的待重试图片块 (源文件已删除或内容已变化的条目会被丢弃)"""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"⚠️ 重试列表读取失败: {e}")
+            return []
+
+        current_hashes = {}
+        valid = []
+        for chunk in entries:
+            filepath = chunk.get("filepath", "")
+            if filepath not in current_hashes:
+                current_hashes[filepath] = file_hash(filepath) if os.path.exists(filepath) else None
+            if current_hashes[filepath] and current_hashes[filepath] == chunk.get("file_hash"):
+                valid.append(chunk)
+        return valid
+
+    def save(self, chunks: List[Dict]):
+        if not chunks:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ImageCaptioner:
+    """
+    并发图片描述：线程池限制并发数，RateLimiter 限制每分钟请求数，
+    429/5xx 按指数退避重试，最终失败的图片交给调用方写入重试列表。
+    """
+
+    def __init__(
+        self,
+        caption_func: Callable[[Dict], str],
+        concurrency: int = VISION_CONCURRENCY,
+        rpm: int = VISION_RPM,
+        max_retries: int = VISION_MAX_RETRIES,
+    ):
+        self.caption_func = caption_func
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rpm)
+        self.max_retries = max_retries
+
+    def run(self, chunks: List[Dict]) -> Tuple[List[Tuple[Dict, str]], List[Dict]]:
+        """返回 ([(图片块, 描述)], [失败的图片块])，成功结果保持输入顺序"""
+        results: List[Optional[str]] = [None] * len(chunks)
+        failed_idx = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                executor.submit(
+                    call_with_backoff,
+                    self.caption_func,
+                    chunk,
+                    max_retries=self.max_retries,
+                    rate_limiter=self.rate_limiter,
+                ): i
+                for i, chunk in enumerate(chunks)
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc="分析图片", unit="张"):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"处理图片 {chunks[i].get('image_path')} 失败: {e}")
+                    failed_idx.add(i)
+
+        succeeded = [(chunks[i], results[i]) for i in range(len(chunks)) if i not in failed_idx]
+        failed = [chunks[i] for i in sorted(failed_idx)]
+        return succeeded, failed
+
+
+class ImageCaptionStage:
+    """
+    入库流水线中的图片描述阶段，可被多次调用 (每个文件一次)，缓存、Agent 与统计在调用间共享：
+    0. (triage=True) 先在本地过滤装饰性图片，跳过的图片记录在过滤报告中
+    1. 已描述过的图片 (同内容、同模型、同提示词版本) 直接从缓存读取，不再调用 API
+    2. 未命中的图片并发请求视觉模型 (限并发、限速、429/5xx 指数退避)
+    3. 最终失败的图片在 close() 时写入重试列表，下次运行图片阶段时自动重试
+    """
+
+    def __init__(self, theme_name: str, triage: bool = True, agent=None, cache: Optional[CaptionCache] = None):
+        self.theme_name = theme_name
+        # 外部传入的缓存由调用方负责关闭 (常驻入库进程在任务间复用)
+        self._owns_cache = cache is None
+        self.cache = cache or CaptionCache()
+        self.retry_list = CaptionRetryList(theme_name)
+        self.triage = ImageTriage() if triage else None
+        self.agent = agent # 为 None 时仅在缓存未命中时才实例化，全部命中时不产生任何 API 开销
+        self.failed: List[Dict] = []
+        self.skipped: List[Dict] = []
+        self.triage_total = 0
+        self._seen_keys = set()
+
+    @staticmethod
+    def _key(chunk: Dict) -> Tuple[str, str]:
+        return file_key(chunk["filepath"]), chunk["chunk_id"]
+
+    def _get_agent(self):
+        if self.agent is None:
+            self.agent = RAGAgent(initial_theme=self.theme_name) # 实例化以使用其中的 vision_client
+        return self.agent
+
+    def _apply_description(self, chunk: Dict, description: str) -> Dict:
+        # 更新内容：加上文件名作为前缀，增强检索相关性
+        pages = ", ".join(str(p) for p in chunk.get("page_refs", [chunk["page_number"]]))
+        chunk["content"] = f"【图片内容描述】(文件: {chunk['filename']}, 页码: {pages})\n{description}"
+        chunk.pop("image_hash", None)
+        return chunk
+
+    def _caption(self, chunk: Dict) -> str:
+        # 注意：这里我们复用 understand_image，但提示词是针对通用搜索优化的
+        image_base64, image_mime = prepare_image(chunk["image_path"])
+        description = self._get_agent().understand_image(image_base64, raise_on_error=True, image_mime=image_mime)
+        if not description:
+            raise ValueError("视觉模型返回了空描述")
+        self.cache.put(chunk["image_hash"], VISION_MODEL_NAME, VISION_PROMPT_VERSION, description)
+        return description
+
+    def process(self, image_chunks: List[Dict]) -> List[Dict]:
+        """为一组图片块生成描述，返回描述成功的图片块"""
+        for chunk in image_chunks:
+            self._seen_keys.add(self._key(chunk))
+        image_chunks = [c for c in image_chunks if os.path.exists(c["image_path"])]
+
+        # 0. 装饰性图片过滤
+        if self.triage and image_chunks:
+            self.triage_total += len(image_chunks)
+            image_chunks, skipped = self.triage.split(image_chunks)
+            self.skipped.extend(skipped)
+
+        # 1. 先查缓存
+        processed = []
+        pending = []
+        for chunk in image_chunks:
+            chunk["image_hash"] = image_file_hash(chunk["image_path"])
+            description = self.cache.get(chunk["image_hash"], VISION_MODEL_NAME, VISION_PROMPT_VERSION)
+            if description is None:
+                pending.append(chunk)
+            elif description:
+                processed.append(self._apply_description(chunk, description))
+
+        # 2. 并发调用视觉模型
+        if pending:
+            succeeded, failed = ImageCaptioner(self._caption).run(pending)
+            for chunk, description in succeeded:
+                processed.append(self._apply_description(chunk, description))
+            for chunk in failed:
+                chunk.pop("image_hash", None)
+            self.failed.extend(failed)
+
+        return processed
+
+    def process_retries(self) -> List[Dict]:
+        """重试上次失败的图片 (本次已处理过的同一图片块以本次为准)"""
+        retry_chunks = [c for c in self.retry_list.load() if self._key(c) not in self._seen_keys]
+        if not retry_chunks:
+            return []
+        print(f"🔁 重试上次失败的 {len(retry_chunks)} 张图片")
+        return self.process(retry_chunks)
+
+    def close(self):
+        """写入重试列表与过滤报告，打印缓存统计"""
+        # 本次没有处理到的旧条目 (其他文件的失败图片、运行中断前未重试的) 保留，处理过的以本次结果为准
+        kept = [c for c in self.retry_list.load() if self._key(c) not in self._seen_keys]
+        self.retry_list.save(kept + self.failed)
+        if self.failed:
+            print(f"⚠️ {len(self.failed)} 张图片描述失败，已加入重试列表")
+        if self.triage and self.triage_total:
+            self.triage.write_report(self.theme_name, self.triage_total, self.skipped)
+        stats = self.cache.stats()
+        if stats["hits"] or stats["misses"]:
+            print(f"🗂️ 图片描述缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} (命中率 {stats['hit_rate']:.0%})")
+        if self._owns_cache:
+            self.cache.close()
@@ -2,11 +2,171 @@
 import os
 import json
 import uuid
+import queue
+import atexit
+import threading
 from datetime import datetime
 from typing import List, Dict, Optional
 
 # 你的对话存储目录
 CHAT_DIR =os.path.join(".", "chat")
+# 每个会话由 "<名称>.json" 快照与 "<名称>.jsonl" 追加日志组成，日志累计该条数后合并进快照
+COMPACT_EVERY = 50
+
+
+def _log_path(filename: str) -> str:
+    return os.path.join(CHAT_DIR, os.path.splitext(filename)[0] + ".jsonl")
+
+
+def _atomic_write_json(path: str, data: Dict):
+    """先写临时文件再原子替换，进程中途退出也不会留下半截的 JSON"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(filename: str) -> Optional[Dict]:
+    filepath = os.path.join(CHAT_DIR, filename)
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_log(filename: str) -> List[Dict]:
+    path = _log_path(filename)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # 异常退出时最后一行可能不完整
+                continue
+    return entries
+
+
+def _load_merged(filename: str) -> Optional[Dict]:
+    """快照 + 追加日志中尚未合并的消息 (按序号去重，合并过程中断也不会重复)"""
+    data = _read_snapshot(filename)
+    if data is None:
+        return None
+    merged_seq = data.get("seq", 0)
+    for entry in _read_log(filename):
+        if entry.get("seq", 0) > merged_seq:
+            data["messages"].append({k: v for k, v in entry.items() if k != "seq"})
+            data["updated_at"] = entry.get("timestamp", data.get("updated_at"))
+            merged_seq = entry["seq"]
+    data["seq"] = merged_seq
+    return data
+
+
+class ChatLogWriter:
+    """
+    会话日志的后台写线程 (进程内共享)。append_message 只把消息放入队列，立即返回；
+    写线程逐条追加到 .jsonl，每条消息的写入成本与对话长度无关，也不会阻塞事件循环。
+    所有文件操作在 lock 下进行，多个标签页同时写同一会话也不会交错或丢失。
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._queue: queue.Queue = queue.Queue()
+        self._seq: Dict[str, int] = {}       # 文件名 -> 最后一条消息的序号
+        self._uncompacted: Dict[str, int] = {}   # 文件名 -> 快照之后追加的条数
+        self._queued: Dict[str, int] = {}        # 文件名 -> 已入队尚未落盘的条数
+        self._queued_cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, filename: str, entry: Dict):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+                self._thread.start()
+        with self._queued_cond:
+            self._queued[filename] = self._queued.get(filename, 0) + 1
+        self._queue.put((filename, entry))
+
+    def flush(self, filename: Optional[str] = None):
+        """等待该会话 (为 None 时为全部会话) 已入队的消息落盘，只等待目标会话，不受其他会话的写入影响"""
+        with self._queued_cond:
+            if filename is None:
+                self._queued_cond.wait_for(lambda: not self._queued)
+            else:
+                self._queued_cond.wait_for(lambda: not self._queued.get(filename))
+
+    def forget(self, filename: str):
+        with self.lock:
+            self._seq.pop(filename, None)
+            self._uncompacted.pop(filename, None)
+
+    def _run(self):
+        while True:
+            filename, entry = self._queue.get()
+            try:
+                self._append(filename, entry)
+            except Exception as e:
+                print(f"❌ 会话写入失败 ({filename}): {e}")
+            finally:
+                with self._queued_cond:
+                    self._queued[filename] -= 1
+                    if not self._queued[filename]:
+                        del self._queued[filename]
+                    self._queued_cond.notify_all()
+
+    def _load_state(self, filename: str):
+        if filename in self._seq:
+            return
+        data = _read_snapshot(filename) or {}
+        merged_seq = data.get("seq", 0)
+        log_seqs = [e.get("seq", 0) for e in _read_log(filename)]
+        self._seq[filename] = max([merged_seq] + log_seqs)
+        self._uncompacted[filename] = sum(1 for seq in log_seqs if seq > merged_seq)
+        # 上次异常退出留下的半行补上换行，避免与新记录粘连
+        log_path = _log_path(filename)
+        if os.path.exists(log_path) and os.path.getsize(log_path):
+            with open(log_path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def _append(self, filename: str, entry: Dict):
+        with self.lock:
+            # 会话已被删除或重命名
+            if not os.path.exists(os.path.join(CHAT_DIR, filename)):
+                return
+            self._load_state(filename)
+            self._seq[filename] += 1
+            line = json.dumps(dict(entry, seq=self._seq[filename]), ensure_ascii=False)
+            with open(_log_path(filename), 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+            self._uncompacted[filename] += 1
+            if self._uncompacted[filename] >= COMPACT_EVERY:
+                self.compact(filename)
+
+    def compact(self, filename: str):
+        """把追加日志合并进快照 (原子替换) 后删除日志"""
+        with self.lock:
+            data = _load_merged(filename)
+            if data is None:
+                return
+            _atomic_write_json(os.path.join(CHAT_DIR, filename), data)
+            if os.path.exists(_log_path(filename)):
+                os.remove(_log_path(filename))
+            self._seq[filename] = data["seq"]
+            self._uncompacted[filename] = 0
+
+
+_writer = ChatLogWriter()
+# 进程退出前把队列中的消息写完
+atexit.register(_writer.flush)
+
 
 class ChatManager:
     def __init__(self):
@@ -46,12 +206,17 @@ class ChatManager:
                 try:
                     with open(os.path.join(CHAT_DIR, filename), 'r', encoding='utf-8') as f:
                         data = json.load(f)
-                        chats.append({
-                            "id": data.get("id"),
-                            "name": data.get("name", "Untitled"),
-                            "filename": filename,
-                            "updated_at": data.get("updated_at", data.get("created_at", ""))
-                        })
+                    updated_at = data.get("updated_at", data.get("created_at", ""))
+                    # 快照之后追加的消息只在日志里，以日志的修改时间为准
+                    log_path = _log_path(filename)
+                    if os.path.exists(log_path):
+                        updated_at = max(updated_at, datetime.fromtimestamp(os.path.getmtime(log_path)).isoformat())
+                    chats.append({
+                        "id": data.get("id"),
+                        "name": data.get("name", "Untitled"),
+                        "filename": filename,
+                        "updated_at": updated_at
+                    })
                 except:
                     continue
         chats.sort(key=lambda x: x["updated_at"], reverse=True)
@@ -59,49 +224,61 @@ class ChatManager:
 
     def load_chat_by_filename(self, filename: str) -> List[Dict]:
         """通过文件名加载会话"""
-        filepath = os.path.join(CHAT_DIR, filename)
-        if not os.path.exists(filepath):
+        _writer.flush(filename)
+        with _writer.lock:
+            data = _load_merged(filename)
+        if data is None:
             return []
             
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            self.current_chat_id = data.get("id")
-            self.current_chat_name = data.get("name")
-            self.current_filename = filename
-            return data.get("messages", [])
+        self.current_chat_id = data.get("id")
+        self.current_chat_name = data.get("name")
+        self.current_filename = filename
+        return data.get("messages", [])
 
     def rename_chat(self, new_name: str):
         """重命名"""
         if not self.current_filename:
             return False
         
-        data = self._load_current_file_data()
-        if not data:
-            return False
+        _writer.flush(self.current_filename)
+        with _writer.lock:
+            data = self._load_current_file_data()
+            if not data:
+                return False
 
-        data["name"] = new_name
-        self.current_chat_name = new_name
-        
-        new_filename = self._get_safe_filename(new_name)
-        old_filepath = os.path.join(CHAT_DIR, self.current_filename)
-        new_filepath = os.path.join(CHAT_DIR, new_filename)
-        
-        try:
-            os.rename(old_filepath, new_filepath)
-            self.current_filename = new_filename
-            self._save_file(data, filename=new_filename)
-            return True
-        except Exception as e:
-            print(f"重命名失败: {e}")
-            return False
+            data["name"] = new_name
+            self.current_chat_name = new_name
+            
+            old_filename = self.current_filename
+            new_filename = self._get_safe_filename(new_name)
+            
+            try:
+                # 新文件写入合并后的完整内容，再删除旧的快照与日志
+                self._save_file(data, filename=new_filename)
+                if new_filename != old_filename:
+                    os.remove(os.path.join(CHAT_DIR, old_filename))
+                if os.path.exists(_log_path(old_filename)):
+                    os.remove(_log_path(old_filename))
+                _writer.forget(old_filename)
+                _writer.forget(new_filename)
+                self.current_filename = new_filename
+                return True
+            except Exception as e:
+                print(f"重命名失败: {e}")
+                return False
 
     # 🆕 新增：删除指定会话
     def delete_chat(self, filename: str) -> bool:
         """删除指定的会话文件"""
         filepath = os.path.join(CHAT_DIR, filename)
+        _writer.flush(filename)
         try:
             if os.path.exists(filepath):
-                os.remove(filepath)
+                with _writer.lock:
+                    os.remove(filepath)
+                    if os.path.exists(_log_path(filename)):
+                        os.remove(_log_path(filename))
+                    _writer.forget(filename)
                 
                 # 如果删除的是当前正在进行的会话，重置为新会话
                 if filename == self.current_filename:
@@ -113,34 +290,24 @@ class ChatManager:
         return False
 
     def append_message(self, role: str, content: str):
-        """追加消息"""
+        """追加消息 (交给后台写线程追加到日志，立即返回)"""
         if not self.current_filename:
             self.create_new_chat()
             
-        data = self._load_current_file_data()
-        if data:
-            msg_entry = {
-                "role": role,
-                "content": content,
-                "timestamp": datetime.now().isoformat()
-            }
-            data["messages"].append(msg_entry)
-            data["updated_at"] = datetime.now().isoformat()
-            self._save_file(data, filename=self.current_filename)
+        msg_entry = {
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now().isoformat()
+        }
+        _writer.submit(self.current_filename, msg_entry)
 
     def _load_current_file_data(self) -> Optional[Dict]:
         if not self.current_filename:
             return None
-        filepath = os.path.join(CHAT_DIR, self.current_filename)
-        if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return None
+        return _load_merged(self.current_filename)
 
     def _save_file(self, data: Dict, filename: str):
-        filepath = os.path.join(CHAT_DIR, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _atomic_write_json(os.path.join(CHAT_DIR, filename), data)
 
     def _get_safe_filename(self, name: str) -> str:
         safe_name = "".join([c for c in name if c.isalnum() or c in (' ', '-', '_', '.')]).strip()
@@ -0,0 +1,106 @@
+# clients.py
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional, TypeVar
+
+import httpx
+import chromadb
+from chromadb.config import Settings
+from openai import OpenAI, AsyncOpenAI
+
+from config import (
+    ASYNC_HTTP_MAX_CONNECTIONS,
+    ASYNC_HTTP_TIMEOUT,
+    STORAGE_EXECUTOR_WORKERS,
+    SYNC_HTTP_MAX_CONNECTIONS,
+    CHROMA_MEMORY_LIMIT_MB,
+)
+
+T = TypeVar("T")
+
+# 进程内共享的同步客户端：每个 (Key, Base URL) 一个 OpenAI 客户端 (自带连接池)，每个数据库路径一个 Chroma 客户端
+_sync_clients: Dict[tuple, OpenAI] = {}
+_chroma_clients: Dict[str, "chromadb.api.ClientAPI"] = {}
+_sync_lock = threading.Lock()
+
+# 进程内共享的异步 HTTP 连接池，所有 AsyncOpenAI 客户端复用
+_async_http_client: Optional[httpx.AsyncClient] = None
+_async_clients: Dict[tuple, AsyncOpenAI] = {}
+_async_lock = threading.Lock()
+
+# Chroma / SQLite 等本地存储访问专用的有界线程池，避免占满事件循环的默认线程池
+_storage_executor = ThreadPoolExecutor(max_workers=STORAGE_EXECUTOR_WORKERS, thread_name_prefix="storage")
+
+
+def get_openai(api_key: str, api_base: str) -> OpenAI:
+    """按 (Key, Base URL) 返回共享的同步 OpenAI 客户端，会话之间复用同一个连接池"""
+    key = (api_key, api_base)
+    with _sync_lock:
+        if key not in _sync_clients:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=SYNC_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=SYNC_HTTP_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(ASYNC_HTTP_TIMEOUT, connect=10.0),
+            )
+            _sync_clients[key] = OpenAI(api_key=api_key, base_url=api_base, http_client=http_client)
+        return _sync_clients[key]
+
+
+def _chroma_settings() -> Settings:
+    if CHROMA_MEMORY_LIMIT_MB > 0:
+        try:
+            # 已加载的集合索引总量超过上限时按 LRU 卸载
+            return Settings(
+                anonymized_telemetry=False,
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_MB * 1024 * 1024,
+            )
+        except Exception:
+            # 旧版本 Chroma 不支持分段缓存设置
+            pass
+    return Settings(anonymized_telemetry=False)
+
+
+def get_chroma_client(db_path: str):
+    """按数据库路径返回共享的 Chroma PersistentClient"""
+    key = os.path.abspath(db_path)
+    with _sync_lock:
+        if key not in _chroma_clients:
+            os.makedirs(db_path, exist_ok=True)
+            _chroma_clients[key] = chromadb.PersistentClient(path=db_path, settings=_chroma_settings())
+        return _chroma_clients[key]
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    with _async_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(ASYNC_HTTP_TIMEOUT, connect=10.0),
+            )
+        return _async_http_client
+
+
+def get_async_openai(api_key: str, api_base: str) -> AsyncOpenAI:
+    """按 (Key, Base URL) 返回共享的 AsyncOpenAI 客户端，底层共用同一个连接池"""
+    http_client = get_async_http_client()
+    key = (api_key, api_base)
+    with _async_lock:
+        if key not in _async_clients:
+            _async_clients[key] = AsyncOpenAI(api_key=api_key, base_url=api_base, http_client=http_client)
+        return _async_clients[key]
+
+
+async def run_storage(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在本地存储线程池中执行阻塞调用 (Chroma 查询、SQLite 读写等)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_storage_executor, partial(fn, *args, **kwargs))
@@ -11,6 +11,23 @@ OPENAI_API_BASE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 TEXT_MODEL_NAME = "qwen-max" 
 OPENAI_EMBEDDING_MODEL = "text-embedding-v4"
 
+# 入库时 Embedding 请求的打包与并发 (按服务商限额调整)
+EMBEDDING_BATCH_MAX_ITEMS = 10      # 单次请求最多文本条数 (text-embedding-v4 上限为 10)
+EMBEDDING_BATCH_MAX_TOKENS = 32000  # 单次请求的 token 总数上限
+EMBEDDING_CONCURRENCY = 8           # 同时进行的 Embedding 请求数
+EMBEDDING_RPM = 1200                # 每分钟最多请求数 (0 表示不限速)
+EMBEDDING_MAX_RETRIES = 5           # 429/5xx 时的最大重试次数 (指数退避)
+
+# Embedding 后端: "openai" (上面的远程模型) 或 "local" (本地 CPU 上的 sentence-transformers 模型)
+# 切换后需要全量重建主题：集合会记录构建它的模型，模型不一致时拒绝检索和写入
+EMBEDDING_PROVIDER = "openai"
+LOCAL_EMBEDDING_MODEL = "BAAI/bge-small-zh-v1.5"
+LOCAL_EMBEDDING_BACKEND = "torch"        # "torch" / "onnx" / "openvino"
+LOCAL_EMBEDDING_ONNX_FILE = None         # 量化权重，如 "onnx/model_qint8_avx512_vnni.onnx"
+LOCAL_EMBEDDING_THREADS = os.cpu_count() or 1
+LOCAL_EMBEDDING_BATCH_SIZE = 64
+LOCAL_EMBEDDING_QUERY_PREFIX = "为这个句子生成表示以用于检索相关文章："  # bge 中文模型的查询指令
+
 
 # ==========================================
 # 2. 视觉模型配置 (有图片时使用)
@@ -22,6 +39,23 @@ VISION_API_BASE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 # 视觉模型名称 (有图片输入时使用)
 VISION_MODEL_NAME = "qwen-vl-plus"
 
+# 上传视觉模型前的图片预处理 (入库与聊天共用)
+VISION_MAX_EDGE = 1280            # 长边超过该像素数时等比缩放
+VISION_JPEG_QUALITY = 85          # 重新编码为 JPEG 时的质量
+VISION_PASSTHROUGH_BYTES = 500_000  # 尺寸合规且小于该字节数的图片原样发送
+
+# 入库时图片描述的并发与限速
+VISION_CONCURRENCY = 4   # 同时进行的视觉请求数
+VISION_RPM = 60          # 每分钟最多请求数 (按服务商限额调整)
+VISION_MAX_RETRIES = 5   # 429/5xx 时的最大重试次数 (指数退避)
+
+# 装饰性图片过滤 (图标、项目符号、纯色背景、渐变条等不送视觉模型)
+TRIAGE_MIN_EDGE = 48       # 短边小于该像素数视为图标
+TRIAGE_MAX_ASPECT = 8.0    # 长宽比超过该值视为分隔线/渐变条
+TRIAGE_MIN_BYTES = 4096    # 低熵且文件小于该字节数视为装饰
+TRIAGE_MIN_ENTROPY = 3.0   # 灰度直方图熵 (bit)
+TRIAGE_MIN_STDDEV = 6.0    # RGB 平均标准差，低于该值视为纯色
+
 
 # ==========================================
 # 3. 其他常规配置
@@ -30,18 +64,95 @@ VISION_MODEL_NAME = "qwen-vl-plus"
 DATA_DIR = os.path.join(".", "data")
 # [新增] 提取图片的存储根目录
 IMAGES_DIR = os.path.join(".", "static", "images")
+# 保留图片原始编码字节 (JPEG 仍为 JPEG)，仅对浏览器/视觉模型无法直接使用的格式转码为 PNG
+KEEP_ORIGINAL_IMAGES = True
 
 # "." 代表当前运行目录
 STATIC_DIR = os.path.join(".", "static")
 
+# 入库状态目录 (清单、缓存等中间状态)
+INGEST_STATE_DIR = os.path.join(".", "ingest_state")
+# 每个主题的文件哈希清单 (用于增量入库)
+MANIFEST_DIR = os.path.join(INGEST_STATE_DIR, "manifests")
+# 入库过程中断点写盘的最小间隔 (秒)；文件完成时总是立即写盘
+MANIFEST_CHECKPOINT_INTERVAL = 5.0
+# 图片视觉描述缓存 (按图片内容哈希 + 模型 + 提示词版本)
+CAPTION_CACHE_PATH = os.path.join(INGEST_STATE_DIR, "caption_cache.sqlite3")
+# Embedding 缓存 (按模型 + 规范化文本哈希，跨主题共享)
+EMBEDDING_CACHE_PATH = os.path.join(INGEST_STATE_DIR, "embedding_cache.sqlite3")
+# 图片描述失败后的重试列表 (下次运行图片阶段时自动重试)
+CAPTION_RETRY_DIR = os.path.join(INGEST_STATE_DIR, "caption_retry")
+# 装饰性图片过滤报告
+TRIAGE_REPORT_DIR = os.path.join(INGEST_STATE_DIR, "triage")
+# Embedding 重试耗尽后仍失败的批次 (下次入库时优先重试)
+EMBEDDING_RETRY_DIR = os.path.join(INGEST_STATE_DIR, "embed_retry")
+# 入库任务记录 (进程重启后自动恢复未完成的任务)
+INGEST_JOBS_DIR = os.path.join(INGEST_STATE_DIR, "jobs")
+
+# 各主题数据版本号 (入库时递增，用于使查询缓存失效)
+THEME_VERSION_DIR = os.path.join(INGEST_STATE_DIR, "versions")
+
 # 向量数据库配置
 VECTOR_DB_PATH = os.path.join(".", "vector_db")
 COLLECTION_NAME = "data_structure"
 
-# 文本处理配置
+# 文本处理配置 (单位均为 Embedding 模型的 token)
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
+# PDF/PPTX 单页超过该长度时按 CHUNK_SIZE 二次切分
+PAGE_MAX_TOKENS = 1000
+# 计数用的 tiktoken 编码；离线无法加载时退化为按字符估算
+TOKENIZER_ENCODING = "cl100k_base"
 MAX_TOKENS = 2000
 
 # RAG配置
 TOP_K = 5
+
+# 检索结果重排序: "bm25" (本地词法打分，毫秒级) / "cross_encoder" (本地 CPU 模型) / "llm" (大模型挑选，多一轮调用)
+RERANKER = "bm25"
+RERANK_LEXICAL_WEIGHT = 0.5          # bm25 重排序中词法分数的权重 (其余为初筛的 RRF 融合分或向量相似度)
+BM25_K1 = 1.5
+BM25_B = 0.75
+CROSS_ENCODER_MODEL = "BAAI/bge-reranker-base"
+CROSS_ENCODER_BATCH_SIZE = 16
+CROSS_ENCODER_MAX_LENGTH = 512
+
+# 混合检索：向量检索与词法倒排索引 (BM25，存放在 VECTOR_DB_PATH/lexical/) 的结果按 RRF 融合
+# 课程术语、缩写 (PCB、LRU)、函数名等精确匹配由词法检索补足
+HYBRID_SEARCH = True
+RRF_K = 60   # RRF 平滑常数：得分为 1 / (RRF_K + 名次)
+
+# 多轮对话中问题重写与检索并行：重写的同时先用原问题预检索，重写结果与原问题几乎一致时直接复用
+SPECULATIVE_RETRIEVAL = True
+SPECULATIVE_REUSE_SIMILARITY = 0.8   # 原问题与重写后问题的词重合度 (Jaccard) 不低于该值视为一致
+REWRITE_TIMEOUT = 8.0                # 重写超时 (秒)，超时后直接使用原问题的检索结果
+SPECULATIVE_WORKERS = 8              # 执行重写/预检索的线程数 (进程内共享)
+
+# 异步接口 (Chainlit 使用)：所有 AsyncOpenAI 客户端共用一个 HTTP 连接池
+ASYNC_HTTP_MAX_CONNECTIONS = 100     # 同时进行的上游请求数上限
+ASYNC_HTTP_TIMEOUT = 120.0           # 单次请求超时 (秒)
+STORAGE_EXECUTOR_WORKERS = 8         # Chroma / SQLite 访问专用线程数
+
+# 进程内共享资源 (所有会话共用 HTTP 连接池、Chroma 客户端与已打开的主题集合)
+SYNC_HTTP_MAX_CONNECTIONS = 50       # 每个 API 端点的同步连接池大小
+VECTOR_STORE_CACHE_SIZE = 8          # 保持打开的主题集合数 (LRU 淘汰)
+CHROMA_MEMORY_LIMIT_MB = 2048        # Chroma 已加载索引的内存上限 (超出时按 LRU 卸载)，0 表示不限制
+
+# 查询侧内存缓存 (问题 -> 向量、(主题, 问题, k) -> 检索结果)
+QUERY_CACHE_SIZE = 1024   # 每个缓存最多条目数 (LRU 淘汰)
+QUERY_CACHE_TTL = 600     # 条目有效期 (秒)
+
+# 语义答案缓存 (每个主题一份，相似问题直接返回之前的回答；主题重新入库后自动作废)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_PATH = os.path.join(INGEST_STATE_DIR, "answer_cache.sqlite3")
+ANSWER_CACHE_THRESHOLD = 0.95      # 问题向量余弦相似度不低于该值视为同一问题
+ANSWER_CACHE_MAX_ENTRIES = 500     # 每个主题最多条目数 (LRU 淘汰)
+ANSWER_CACHE_MIN_QUERY_CHARS = 6   # 过短的问题 (如"继续"、"为什么") 多依赖上下文，不走缓存
+
+# 文档加载并行配置
+# 加载进程数 (<=1 时退化为串行加载)
+LOAD_WORKERS = os.cpu_count() or 1
+# 大 PDF 按页切分为多个任务，每个任务处理的页数
+PDF_PAGES_PER_TASK = 40
+# 流式入库时各阶段之间队列的长度 (单位: 文件)，决定内存上限
+PIPELINE_QUEUE_SIZE = 4
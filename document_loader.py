@@ -1,127 +1,258 @@
 import os
-from typing import List, Dict, Optional
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Iterator, Optional, Tuple
 
 import docx2txt
 from PyPDF2 import PdfReader
 from pptx import Presentation
 
 import io
+import time
+import hashlib
 import fitz  # PyMuPDF
 from PIL import Image
 from pptx.enum.shapes import MSO_SHAPE_TYPE
-from config import DATA_DIR, IMAGES_DIR
+from config import DATA_DIR, IMAGES_DIR, PDF_PAGES_PER_TASK, KEEP_ORIGINAL_IMAGES
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """图片内容哈希，用作内容寻址的文件名"""
+    return hashlib.sha256(image_bytes).hexdigest()[:32]
+
+
+def merge_image_refs(documents: List[Dict]) -> List[Dict]:
+    """合并同一文件内指向同一张图片的图片块 (大 PDF 分段并行提取后可能重复)"""
+    merged = []
+    seen: Dict[Tuple[str, str], Dict] = {}
+    for doc in documents:
+        if not doc.get("is_image"):
+            merged.append(doc)
+            continue
+        key = (doc["filepath"], doc["image_path"])
+        if key in seen:
+            pages = seen[key]["page_refs"]
+            pages.extend(p for p in doc.get("page_refs", []) if p not in pages)
+            continue
+        seen[key] = doc
+        merged.append(doc)
+    return merged
+
+
+def _load_task(
+    data_dir: str, file_path: str, theme: str, page_range: Optional[Tuple[int, int]], keep_original_images: bool
+) -> Tuple[List[Dict], Dict]:
+    """子进程入口：必须是模块级函数才能被 ProcessPoolExecutor 序列化，同时带回图片统计"""
+    loader = DocumentLoader(data_dir=data_dir, keep_original_images=keep_original_images)
+    docs = loader.load_document(file_path, theme=theme, page_range=page_range)
+    return docs, loader.image_stats
+
+
+def _new_image_stats() -> Dict:
+    return {"saved": 0, "reused": 0, "converted": 0, "bytes_in": 0, "bytes_out": 0, "encode_seconds": 0.0}
+
+
+# 浏览器和视觉模型都能直接使用的格式，保留原始字节即可
+WEB_SAFE_IMAGE_EXTS = {"png", "jpeg", "jpg", "gif", "webp"}
+
 
 class DocumentLoader:
-    def __init__(self, data_dir: str = DATA_DIR):
+    def __init__(self, data_dir: str = DATA_DIR, keep_original_images: bool = KEEP_ORIGINAL_IMAGES):
         self.data_dir = data_dir
         self.supported_formats = [".pdf", ".pptx", ".docx", ".txt"]
+        # True: 保留原始编码字节 (仅对 CMYK/JBIG2/JPX/TIFF 等格式转码); False: 全部重新编码为 PNG
+        self.keep_original_images = keep_original_images
+        self.image_stats = _new_image_stats()
+
+    def _needs_conversion(self, image_bytes: bytes, ext: Optional[str], colorspace: Optional[int]) -> bool:
+        """判断原始图片能否直接给浏览器 / 视觉模型使用"""
+        if not ext or ext.lower() not in WEB_SAFE_IMAGE_EXTS:
+            return True
+        if ext.lower() in ("jpeg", "jpg"):
+            if colorspace is not None:
+                return colorspace == 4 # CMYK
+            try:
+                # Image.open 只解析文件头，不解码像素
+                return Image.open(io.BytesIO(image_bytes)).mode == "CMYK"
+            except Exception:
+                return True
+        return False
+
+    def _save_image(self, image_bytes, theme, ext: Optional[str] = None, colorspace: Optional[int] = None):
+        """辅助函数：按内容哈希保存图片到本地
 
-    def _save_image(self, image_bytes, theme, filename, index):
-        """辅助函数：保存图片到本地"""
+        文件名即内容哈希，同一主题下相同图片只落盘一次 (跨文件去重)。
+        keep_original_images=True 时保留原始字节和扩展名，只对浏览器/视觉模型无法直接使用的格式用 PIL 转码为 PNG
+        """
         if not image_bytes:
             return None
         
         # 创建主题文件夹
         save_dir = os.path.join(IMAGES_DIR, theme)
         os.makedirs(save_dir, exist_ok=True)
+
+        convert = not self.keep_original_images or self._needs_conversion(image_bytes, ext, colorspace)
+        out_ext = "png" if convert else ("jpg" if ext.lower() == "jpeg" else ext.lower())
         
-        # 生成唯一文件名
-        img_filename = f"{os.path.splitext(filename)[0]}_img_{index}.png"
+        # 内容寻址文件名
+        img_filename = f"{image_digest(image_bytes)}.{out_ext}"
         img_path = os.path.join(save_dir, img_filename)
+        if os.path.exists(img_path):
+            self.image_stats["reused"] += 1
+            return img_path
         
+        # 先写临时文件再改名，避免并行进程写同一张图时读到半截文件
+        tmp_path = f"{img_path}.{os.getpid()}.tmp"
+        start = time.perf_counter()
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            # 转换为RGB防止报错
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            image.save(img_path, format="PNG")
-            return img_path
+            if convert:
+                image = Image.open(io.BytesIO(image_bytes))
+                # 转换为RGB防止报错
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.save(tmp_path, format="PNG")
+                self.image_stats["converted"] += 1
+            else:
+                with open(tmp_path, "wb") as f:
+                    f.write(image_bytes)
+            os.replace(tmp_path, img_path)
         except Exception as e:
             print(f"图片保存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             return None
+        finally:
+            self.image_stats["encode_seconds"] += time.perf_counter() - start
+
+        self.image_stats["saved"] += 1
+        self.image_stats["bytes_in"] += len(image_bytes)
+        self.image_stats["bytes_out"] += os.path.getsize(img_path)
+        return img_path
+
+    def print_image_stats(self):
+        """打印本次图片落盘统计 (可通过 KEEP_ORIGINAL_IMAGES 开关对比前后耗时与磁盘占用)"""
+        stats = self.image_stats
+        if not (stats["saved"] or stats["reused"]):
+            return
+        mode = "保留原始字节" if self.keep_original_images else "全部转码 PNG"
+        print(
+            f"🖼️ 图片落盘 ({mode}): 新增 {stats['saved']} 张 (转码 {stats['converted']} 张), 复用 {stats['reused']} 张, "
+            f"原始 {stats['bytes_in'] / 1e6:.2f} MB -> 磁盘 {stats['bytes_out'] / 1e6:.2f} MB, "
+            f"编码耗时 {stats['encode_seconds']:.2f}s"
+        )
+
+    def _add_image_ref(self, results: List[Dict], seen: Dict[str, Dict], saved_path: str, page_number: int):
+        """同一文档内重复出现的图片只生成一个图片块，只追加页码引用"""
+        if saved_path in seen:
+            pages = seen[saved_path]["page_refs"]
+            if page_number not in pages:
+                pages.append(page_number)
+            return
+        # 创建一个特殊的“图片块”，内容先留空，后续由Vision模型填充描述
+        chunk = {
+            "content": "[IMAGE_PENDING_DESCRIPTION]", # 占位符
+            "image_path": saved_path,
+            "page_number": page_number,
+            "page_refs": [page_number],
+            "is_image": True # 标记这是一个图片块
+        }
+        seen[saved_path] = chunk
+        results.append(chunk)
+
+    def load_pdf(self, file_path: str, theme: str, page_range: Optional[Tuple[int, int]] = None) -> List[Dict]:
+        """提取PDF文本和图片
 
-    def load_pdf(self, file_path: str, theme: str) -> List[Dict]:
-        """提取PDF文本和图片"""
+        page_range: 可选的 [start, end) 页码区间 (从 0 开始)，用于大 PDF 的分段并行提取
+        """
         results = []
-        filename = os.path.basename(file_path)
+        # xref -> 已保存路径，同一文档内重复引用的图片只解码一次
+        xref_paths: Dict[int, Optional[str]] = {}
+        seen_images: Dict[str, Dict] = {}
         
         try:
             doc = fitz.open(file_path)
-            for i, page in enumerate(doc):
-                # 1. 提取文本
+            start, end = page_range if page_range else (0, doc.page_count)
+            for i in range(start, min(end, doc.page_count)):
+                page = doc[i]
+
+                # 1. 提取图片
+                page_images = []
+                for img in page.get_images(full=True):
+                    xref = img[0]
+                    if xref not in xref_paths:
+                        base_image = doc.extract_image(xref)
+                        xref_paths[xref] = self._save_image(
+                            base_image["image"], theme,
+                            ext=base_image.get("ext"), colorspace=base_image.get("colorspace"),
+                        )
+                    saved_path = xref_paths[xref]
+                    if saved_path and saved_path not in page_images:
+                        page_images.append(saved_path)
+
+                # 2. 提取文本 (记录本页引用的图片)
                 text = page.get_text()
                 if text.strip():
                     results.append({
                         "content": f"--- 第 {i+1} 页 ---\n{text}\n",
                         "image_path": None,
-                        "page_number": i + 1
+                        "page_number": i + 1,
+                        "images": page_images,
                     })
                 
-                # 2. 提取图片
-                image_list = page.get_images(full=True)
-                for img_index, img in enumerate(image_list):
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    
-                    saved_path = self._save_image(image_bytes, theme, filename, f"p{i+1}_{img_index}")
-                    
-                    if saved_path:
-                        # 创建一个特殊的“图片块”，内容先留空，后续由Vision模型填充描述
-                        results.append({
-                            "content": "[IMAGE_PENDING_DESCRIPTION]", # 占位符
-                            "image_path": saved_path,
-                            "page_number": i + 1,
-                            "is_image": True # 标记这是一个图片块
-                        })
+                for saved_path in page_images:
+                    self._add_image_ref(results, seen_images, saved_path, i + 1)
                         
         except Exception as e:
             print(f"Error reading PDF {file_path}: {e}")
+            # 交给调用方按加载失败处理，避免只读出一部分的文件被记为已完成
+            raise
         return results
 
     def load_pptx(self, file_path: str, theme: str) -> List[Dict]:
         """提取PPT文本和图片"""
         results = []
-        filename = os.path.basename(file_path)
+        seen_images: Dict[str, Dict] = {}
         
         try:
             prs = Presentation(file_path)
             for i, slide in enumerate(prs.slides):
                 slide_texts = []
+                slide_images = []
                 # 遍历形状
-                for shape_idx, shape in enumerate(slide.shapes):
+                for shape in slide.shapes:
                     # 1. 提取文本
                     if hasattr(shape, "text") and shape.text:
                         slide_texts.append(shape.text)
                     
                     # 2. 提取图片
                     if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
-                        image_bytes = shape.image.blob
-                        saved_path = self._save_image(image_bytes, theme, filename, f"s{i+1}_{shape_idx}")
+                        saved_path = self._save_image(shape.image.blob, theme, ext=shape.image.ext)
                         if saved_path:
-                            results.append({
-                                "content": "[IMAGE_PENDING_DESCRIPTION]",
-                                "image_path": saved_path,
-                                "page_number": i + 1,
-                                "is_image": True
-                            })
+                            if saved_path not in slide_images:
+                                slide_images.append(saved_path)
+                            self._add_image_ref(results, seen_images, saved_path, i + 1)
 
                 page_content = "\n".join(slide_texts)
                 if page_content.strip():
                     results.append({
                         "content": f"--- 幻灯片 {i+1} ---\n{page_content}\n",
                         "image_path": None,
-                        "page_number": i + 1
+                        "page_number": i + 1,
+                        "images": slide_images,
                     })
                     
         except Exception as e:
             print(f"Error reading PPTX {file_path}: {e}")
+            raise
         return results
 
     # docx 和 txt 类似修改，这里省略 docx 的图片提取以节省篇幅，逻辑同上
 
-    def load_document(self, file_path: str, theme: str = "default") -> List[Dict]:
-        """入口函数"""
+    def load_document(
+        self, file_path: str, theme: str = "default", page_range: Optional[Tuple[int, int]] = None
+    ) -> List[Dict]:
+        """入口函数 (page_range 仅对 PDF 生效)"""
         ext = os.path.splitext(file_path)[1].lower()
         filename = os.path.basename(file_path)
         base_meta = {
@@ -132,7 +263,7 @@ class DocumentLoader:
         
         raw_chunks = []
         if ext == ".pdf":
-            raw_chunks = self.load_pdf(file_path, theme)
+            raw_chunks = self.load_pdf(file_path, theme, page_range=page_range)
         elif ext == ".pptx":
             raw_chunks = self.load_pptx(file_path, theme)
         elif ext == ".txt":
@@ -149,7 +280,124 @@ class DocumentLoader:
             
         return documents
 
-    def load_all_documents(self, specific_dir: str = None) -> List[Dict]:
+    def list_files(self, target_dir: str) -> List[str]:
+        """列出目录下所有支持的文件 (排序后返回，保证加载顺序确定)"""
+        file_paths = []
+        for root, dirs, files in os.walk(target_dir):
+            dirs.sort()
+            for file in sorted(files):
+                ext = os.path.splitext(file)[1].lower()
+                if ext in self.supported_formats:
+                    file_paths.append(os.path.join(root, file))
+        return file_paths
+
+    def _build_tasks(self, file_paths: List[str]) -> List[Tuple[str, Optional[Tuple[int, int]]]]:
+        """将文件拆分为加载任务：大 PDF 按 PDF_PAGES_PER_TASK 页切分，其余文件一个任务"""
+        tasks = []
+        for file_path in file_paths:
+            if file_path.lower().endswith(".pdf"):
+                try:
+                    with fitz.open(file_path) as doc:
+                        page_count = doc.page_count
+                except Exception as e:
+                    # 仍作为一个整体任务提交，加载失败时由 iter_files 产出失败标记
+                    print(f"Error reading PDF {file_path}: {e}")
+                    page_count = 0
+                if page_count > PDF_PAGES_PER_TASK:
+                    for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                        tasks.append((file_path, (start, start + PDF_PAGES_PER_TASK)))
+                    continue
+            tasks.append((file_path, None))
+        return tasks
+
+    def iter_files(
+        self,
+        file_paths: List[str],
+        theme: str,
+        num_workers: int = 1,
+        stop_event: Optional[threading.Event] = None,
+    ) -> Iterator[Tuple[str, Optional[List[Dict]]]]:
+        """逐个文件产出 (文件路径, 文档块)，供流式入库使用
+
+        num_workers > 1 时使用进程池并行解析，同时在途的任务数有上限，
+        产出顺序与 file_paths 一致，内存占用与语料总量无关。
+        加载失败的文件 (任一分段失败即算) 产出 (文件路径, None)，调用方不应将其记为已完成。
+        stop_event 被设置后不再加载后续文件，未开始的解析任务直接取消
+        """
+        def stopped() -> bool:
+            return stop_event is not None and stop_event.is_set()
+
+        tasks = self._build_tasks(file_paths) if num_workers > 1 else []
+
+        if len(tasks) <= 1:
+            for file_path in file_paths:
+                if stopped():
+                    return
+                print(f"正在加载: {file_path}")
+                try:
+                    # 传入 theme 用于图片分类存储
+                    docs = self.load_document(file_path, theme=theme)
+                except Exception as e:
+                    print(f"Error loading {file_path}: {e}")
+                    docs = None
+                yield file_path, docs
+            return
+
+        print(f"⚡ 并行加载 {len(file_paths)} 个文件 ({len(tasks)} 个任务, {num_workers} 个进程)")
+        max_in_flight = num_workers * 2
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            task_iter = iter(tasks)
+            in_flight = deque()
+
+            def submit_next():
+                task = next(task_iter, None)
+                if task is not None:
+                    file_path, page_range = task
+                    in_flight.append((file_path, page_range, executor.submit(
+                        _load_task, self.data_dir, file_path, theme, page_range, self.keep_original_images
+                    )))
+
+            for _ in range(max_in_flight):
+                submit_next()
+
+            # 按提交顺序收集结果，同一文件的多个分段任务合并后再产出
+            current_file, current_docs = None, []
+            while in_flight:
+                if stopped():
+                    # 退出 with 时进程池只等待已在运行的任务
+                    for _, _, pending in in_flight:
+                        pending.cancel()
+                    return
+                file_path, page_range, future = in_flight.popleft()
+                submit_next()
+                try:
+                    docs, task_stats = future.result()
+                    for key, value in task_stats.items():
+                        self.image_stats[key] += value
+                    print(f"已加载: {file_path}" + (f" (页 {page_range[0]+1}-{page_range[1]})" if page_range else ""))
+                except Exception as e:
+                    print(f"Error loading {file_path}: {e}")
+                    docs = None
+                if file_path != current_file:
+                    if current_file is not None:
+                        yield current_file, None if current_docs is None else merge_image_refs(current_docs)
+                    current_file, current_docs = file_path, []
+                if docs is None:
+                    current_docs = None
+                elif current_docs is not None:
+                    current_docs.extend(docs)
+            if current_file is not None:
+                yield current_file, None if current_docs is None else merge_image_refs(current_docs)
+
+    def load_files(self, file_paths: List[str], theme: str, num_workers: int = 1) -> List[Dict]:
+        """加载给定的文件列表 (一次性返回全部文档块)"""
+        documents = []
+        for _, docs in self.iter_files(file_paths, theme, num_workers=num_workers):
+            if docs is not None:
+                documents.extend(docs)
+        return documents
+
+    def load_all_documents(self, specific_dir: str = None, num_workers: int = 1) -> List[Dict]:
         """加载指定目录下的文档"""
         target_dir = specific_dir if specific_dir else self.data_dir
         # 获取主题名称 (文件夹名)
@@ -158,15 +406,4 @@ class DocumentLoader:
         if not os.path.exists(target_dir):
             return []
 
-        documents = []
-        for root, _, files in os.walk(target_dir):
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext in self.supported_formats:
-                    file_path = os.path.join(root, file)
-                    print(f"正在加载: {file_path}")
-                    # 传入 theme 用于图片分类存储
-                    doc_chunks = self.load_document(file_path, theme=theme_name)
-                    documents.extend(doc_chunks)
-
-        return documents
\ No newline at end of file
+        return self.load_files(self.list_files(target_dir), theme_name, num_workers=num_workers)
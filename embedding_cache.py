@@ -0,0 +1,125 @@
+# embedding_cache.py
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from datetime import datetime
+from typing import List, Optional
+
+from config import EMBEDDING_CACHE_PATH
+
+# SQLite 单条语句的参数个数有上限，批量查询时分段
+_QUERY_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    """缓存键使用的规范化文本：去掉首尾空白并把连续空白合并为一个空格"""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding 的磁盘缓存 (SQLite)，向量以 float32 二进制存储。
+    键为 (Embedding 模型名, 规范化文本的哈希)，与主题无关：
+    全量重建、同一份资料出现在多个主题中时都不会重复调用 Embedding API。
+    """
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 多个 VectorStore 实例可能同时写入同一个缓存文件
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_many(self, texts: List[str], model: str) -> List[Optional[List[float]]]:
+        """按输入顺序返回向量，未命中的位置为 None"""
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            unique = list(set(hashes))
+            for start in range(0, len(unique), _QUERY_CHUNK):
+                part = unique[start : start + _QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    (model, *part),
+                ).fetchall()
+                found.update(rows)
+        result = [self._decode(found[h]) if h in found else None for h in hashes]
+        hit_count = sum(v is not None for v in result)
+        self.hits += hit_count
+        self.misses += len(result) - hit_count
+        return result
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        return self.get_many([text], model)[0]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]], model: str) -> None:
+        rows = [
+            (model, text_hash(t), len(v), self._encode(v), datetime.now().isoformat())
+            for t, v in zip(texts, vectors)
+            if v
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def put(self, text: str, vector: List[float], model: str) -> None:
+        self.put_many([text], [vector], model)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_embedding_cache() -> EmbeddingCache:
+    """进程内共享的默认 Embedding 缓存 (同一个 SQLite 连接)"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
@@ -0,0 +1,148 @@
+# embedding_provider.py
+import asyncio
+import threading
+from typing import List, Dict, Optional
+
+from clients import get_openai, get_async_openai
+from config import (
+    EMBEDDING_PROVIDER,
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_BATCH_MAX_ITEMS,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_RPM,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_BACKEND,
+    LOCAL_EMBEDDING_ONNX_FILE,
+    LOCAL_EMBEDDING_THREADS,
+    LOCAL_EMBEDDING_BATCH_SIZE,
+    LOCAL_EMBEDDING_QUERY_PREFIX,
+)
+
+
+class EmbeddingModelMismatch(RuntimeError):
+    """集合由另一个 Embedding 模型构建，向量空间不兼容"""
+
+
+class EmbeddingProvider:
+    """
+    Embedding 后端接口。VectorStore 只通过这里计算向量：
+    - name: 模型标识，作为 Embedding 缓存的键，并记录在 Chroma 集合的元数据中
+    - embed(texts): 批量计算向量；aembed 为异步版本 (默认在线程中执行 embed)
+    - 打包/并发参数供 VectorStore.add_documents 使用
+    """
+
+    name: str = ""
+    max_batch_items: int = 1
+    max_batch_tokens: int = 8192
+    concurrency: int = 1
+    rpm: int = 0
+    # 查询文本前缀 (部分检索模型要求给问题加指令前缀)
+    query_prefix: str = ""
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI 兼容接口 (DashScope 等) 的远程 Embedding"""
+
+    def __init__(self, api_key: str = OPENAI_API_KEY, api_base: str = OPENAI_API_BASE, model: str = OPENAI_EMBEDDING_MODEL):
+        self.client = get_openai(api_key, api_base)
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        # 沿用原来的模型名作为标识，已有的 Embedding 缓存与集合无需迁移
+        self.name = model
+        self.max_batch_items = EMBEDDING_BATCH_MAX_ITEMS
+        self.max_batch_tokens = EMBEDDING_BATCH_MAX_TOKENS
+        self.concurrency = EMBEDDING_CONCURRENCY
+        self.rpm = EMBEDDING_RPM
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        return [data.embedding for data in response.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        response = await get_async_openai(self.api_key, self.api_base).embeddings.create(input=texts, model=self.model)
+        return [data.embedding for data in response.data]
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    本地 CPU 上运行的 sentence-transformers 模型，查询不再经过网络。
+    backend="onnx" 时使用 ONNX Runtime，可通过 onnx_file 指定量化权重
+    (例如 "onnx/model_qint8_avx512_vnni.onnx")；批内计算由多个 CPU 线程并行完成。
+    """
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        backend: str = LOCAL_EMBEDDING_BACKEND,
+        onnx_file: Optional[str] = LOCAL_EMBEDDING_ONNX_FILE,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        query_prefix: str = LOCAL_EMBEDDING_QUERY_PREFIX,
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("本地 Embedding 需要安装 sentence-transformers: pip install sentence-transformers") from e
+
+        kwargs = {"device": "cpu"}
+        if backend != "torch":
+            kwargs["backend"] = backend
+            if onnx_file:
+                kwargs["model_kwargs"] = {"file_name": onnx_file}
+        if threads and backend == "torch":
+            import torch
+            torch.set_num_threads(threads)
+
+        print(f"🧮 [Embedding] 正在加载本地模型: {model_name} ({backend})")
+        self.model = SentenceTransformer(model_name, **kwargs)
+        self.batch_size = batch_size
+        # 权重文件不同 (如量化版) 时向量也不同，需要区分标识
+        self.name = f"local:{model_name}" + (f":{onnx_file}" if backend != "torch" and onnx_file else "")
+        # 本地推理本身已经多线程，VectorStore 侧单线程送批即可
+        self.max_batch_items = batch_size
+        self.max_batch_tokens = batch_size * 8192
+        self.concurrency = 1
+        self.rpm = 0
+        self.query_prefix = query_prefix
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+
+_providers: Dict[tuple, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(
+    provider: str = EMBEDDING_PROVIDER,
+    api_key: str = OPENAI_API_KEY,
+    api_base: str = OPENAI_API_BASE,
+) -> EmbeddingProvider:
+    """按 config.EMBEDDING_PROVIDER 返回进程内共享的 Embedding 后端 (本地模型只加载一次)"""
+    key = (provider, api_key, api_base) if provider == "openai" else (provider,)
+    with _providers_lock:
+        if key not in _providers:
+            if provider == "openai":
+                _providers[key] = OpenAIEmbeddingProvider(api_key=api_key, api_base=api_base)
+            elif provider == "local":
+                _providers[key] = LocalEmbeddingProvider()
+            else:
+                raise ValueError(f"未知的 EMBEDDING_PROVIDER: {provider} (可选 openai / local)")
+        return _providers[key]
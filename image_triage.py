@@ -0,0 +1,130 @@
+# image_triage.py
+import os
+import json
+import math
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Tuple
+
+from PIL import Image, ImageStat
+
+from config import (
+    TRIAGE_MIN_EDGE,
+    TRIAGE_MAX_ASPECT,
+    TRIAGE_MIN_BYTES,
+    TRIAGE_MIN_ENTROPY,
+    TRIAGE_MIN_STDDEV,
+    TRIAGE_REPORT_DIR,
+)
+
+# 计算熵和色彩方差前先缩略，避免对大图做全尺寸统计
+_THUMB_SIZE = (128, 128)
+
+
+def _histogram_entropy(histogram: List[int]) -> float:
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    entropy = 0.0
+    for count in histogram:
+        if count:
+            p = count / total
+            entropy -= p * math.log2(p)
+    return entropy
+
+
+def image_metrics(image_path: str) -> Dict:
+    """本地计算图片的廉价特征：尺寸、字节数、灰度熵、RGB 标准差"""
+    with Image.open(image_path) as image:
+        width, height = image.size
+        thumb = image.convert("RGB")
+        thumb.thumbnail(_THUMB_SIZE)
+    stddev = ImageStat.Stat(thumb).stddev
+    return {
+        "width": width,
+        "height": height,
+        "bytes": os.path.getsize(image_path),
+        "entropy": round(_histogram_entropy(thumb.convert("L").histogram()), 3),
+        "stddev": round(sum(stddev) / len(stddev), 3),
+    }
+
+
+class ImageTriage:
+    """
+    视觉描述前的装饰性图片过滤：图标、项目符号、纯色背景、渐变条等
+    不值得调用视觉模型，直接跳过并记录到报告中。
+    """
+
+    def __init__(
+        self,
+        min_edge: int = TRIAGE_MIN_EDGE,
+        max_aspect: float = TRIAGE_MAX_ASPECT,
+        min_bytes: int = TRIAGE_MIN_BYTES,
+        min_entropy: float = TRIAGE_MIN_ENTROPY,
+        min_stddev: float = TRIAGE_MIN_STDDEV,
+    ):
+        self.min_edge = min_edge
+        self.max_aspect = max_aspect
+        self.min_bytes = min_bytes
+        self.min_entropy = min_entropy
+        self.min_stddev = min_stddev
+
+    def classify(self, metrics: Dict) -> List[str]:
+        """返回判定为装饰性图片的原因列表，空列表表示需要送去视觉模型"""
+        reasons = []
+        width, height = metrics["width"], metrics["height"]
+        if min(width, height) < self.min_edge:
+            reasons.append("too_small")
+        if max(width, height) / max(1, min(width, height)) > self.max_aspect:
+            reasons.append("strip")
+        if metrics["stddev"] < self.min_stddev:
+            reasons.append("flat_color")
+        # 低熵单独出现可能是简洁的线框图，只有同时文件很小时才视为装饰
+        if metrics["entropy"] < self.min_entropy and metrics["bytes"] < self.min_bytes:
+            reasons.append("low_information")
+        return reasons
+
+    def split(self, chunks: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """将图片块分为 (需要描述, 跳过) 两组，跳过的条目附带原因和特征值"""
+        keep, skipped = [], []
+        for chunk in chunks:
+            try:
+                metrics = image_metrics(chunk["image_path"])
+            except Exception as e:
+                # 无法分析的图片交给视觉模型处理，不在这里丢弃
+                print(f"⚠️ 图片特征计算失败 {chunk.get('image_path')}: {e}")
+                keep.append(chunk)
+                continue
+            reasons = self.classify(metrics)
+            if reasons:
+                skipped.append({
+                    "image_path": chunk["image_path"],
+                    "filename": chunk.get("filename", ""),
+                    "page_refs": chunk.get("page_refs", [chunk.get("page_number", 0)]),
+                    "reasons": reasons,
+                    "metrics": metrics,
+                })
+            else:
+                keep.append(chunk)
+        return keep, skipped
+
+    def write_report(self, theme: str, total: int, skipped: List[Dict], report_dir: str = TRIAGE_REPORT_DIR) -> str:
+        """写入本次过滤报告并打印摘要"""
+        os.makedirs(report_dir, exist_ok=True)
+        reason_counts = Counter(r for item in skipped for r in item["reasons"])
+        report = {
+            "theme": theme,
+            "created_at": datetime.now().isoformat(),
+            "total": total,
+            "skipped_count": len(skipped),
+            "reason_counts": dict(reason_counts),
+            "skipped": skipped,
+        }
+        path = os.path.join(report_dir, f"{theme}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        summary = ", ".join(f"{k}: {v}" for k, v in reason_counts.most_common())
+        print(f"🧹 装饰性图片过滤: 跳过 {len(skipped)} / {total} 张" + (f" ({summary})" if summary else ""))
+        print(f"   报告已写入: {path}")
+        return path
@@ -0,0 +1,74 @@
+# image_utils.py
+import io
+import base64
+from typing import Tuple, Union
+
+from PIL import Image
+
+from config import VISION_MAX_EDGE, VISION_JPEG_QUALITY, VISION_PASSTHROUGH_BYTES
+
+# 视觉模型可以直接接收的格式
+MIME_BY_FORMAT = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("utf-8")
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def prepare_image(
+    source: Union[str, bytes],
+    max_edge: int = VISION_MAX_EDGE,
+    quality: int = VISION_JPEG_QUALITY,
+    passthrough_bytes: int = VISION_PASSTHROUGH_BYTES,
+) -> Tuple[str, str]:
+    """
+    上传视觉模型前的图片预处理 (入库与聊天共用)，返回 (base64, MIME 类型)。
+    - 尺寸不超过 max_edge、体积不超过 passthrough_bytes 且格式可直接使用的图片原样发送
+    - 否则将长边缩放到 max_edge 以内，无透明通道的重新编码为 JPEG (quality)，有透明通道的编码为 PNG
+    """
+    if isinstance(source, (bytes, bytearray)):
+        raw = bytes(source)
+    else:
+        with open(source, "rb") as f:
+            raw = f.read()
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        fmt = image.format
+        width, height = image.size
+    except Exception:
+        # PIL 无法识别的数据原样发送，交给模型端处理
+        return _b64(raw), "image/jpeg"
+
+    too_large = max(width, height) > max_edge
+    if fmt in MIME_BY_FORMAT and image.mode != "CMYK" and not too_large and len(raw) <= passthrough_bytes:
+        return _b64(raw), MIME_BY_FORMAT[fmt]
+
+    if too_large:
+        if fmt == "JPEG":
+            # JPEG 可在解码阶段直接按比例缩小，省去全尺寸解码
+            image.draft("RGB", (max_edge, max_edge))
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if _has_alpha(image):
+        image.convert("RGBA").save(buffer, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+        mime = "image/jpeg"
+    data = buffer.getvalue()
+
+    # 未缩放且重新编码反而更大时，保留原图
+    if not too_large and fmt in MIME_BY_FORMAT and image.mode != "CMYK" and len(data) >= len(raw):
+        return _b64(raw), MIME_BY_FORMAT[fmt]
+    return _b64(data), mime
@@ -0,0 +1,355 @@
+# ingest_pipeline.py
+import os
+import time
+import queue
+import threading
+from typing import List, Dict, Optional, Callable
+
+from document_loader import DocumentLoader
+from text_splitter import TextSplitter
+from vector_store import VectorStore
+from captioner import ImageCaptionStage
+from manifest import IngestManifest, IMAGE_CHUNK_PREFIX, file_hash, chunk_key
+from config import CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_DB_PATH, PIPELINE_QUEUE_SIZE, KEEP_ORIGINAL_IMAGES
+
+# 队列结束标记
+_DONE = object()
+
+
+class _StageError:
+    """子线程异常的包装，传回主线程后重新抛出"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class IngestPipeline:
+    """
+    流式入库流水线：加载 -> 切分 -> 图片描述 -> Embedding -> 写入
+
+    - 加载线程逐文件解析，通过有界队列交给主线程，主线程切分并生成图片描述
+    - 写入线程逐文件调用 Embedding 并 upsert 到 Chroma，写完即在清单中标记该文件完成
+    - 队列长度有上限，内存占用只与单个文件的大小有关，与语料总量无关；
+      中途崩溃时已写入的文件不会丢失，下次增量运行会跳过它们
+    - 每个 Embedding 批次写入后都会在清单中记录断点，未写完的文件恢复时只补写剩余的块
+    - 进度保存在 self.progress 中，并通过 progress_callback 通知调用方 (任务状态查询)
+    """
+
+    def __init__(
+        self,
+        theme_name: str,
+        target_dir: str,
+        vector_store: Optional[VectorStore] = None,
+        num_workers: int = 1,
+        triage: bool = True,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        keep_original_images: bool = KEEP_ORIGINAL_IMAGES,
+        manifest: Optional[IngestManifest] = None,
+        caption_agent=None,
+        caption_cache=None,
+        progress_callback: Optional[Callable[[Dict], None]] = None,
+    ):
+        self.theme_name = theme_name
+        self.target_dir = target_dir
+        self.loader = DocumentLoader(data_dir=target_dir, keep_original_images=keep_original_images)
+        self.splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        self.vector_store = vector_store or VectorStore(db_path=VECTOR_DB_PATH, collection_name=theme_name)
+        self.manifest = manifest or IngestManifest(theme_name)
+        # 常驻入库进程会传入共享的视觉 Agent 与描述缓存，避免每个任务重新初始化
+        self.caption_agent = caption_agent
+        self.caption_cache = caption_cache
+        self.num_workers = num_workers
+        self.triage = triage
+        self.queue_size = queue_size
+        self.stats = {"files": 0, "skipped_files": 0, "chunks": 0, "failed_files": 0}
+        self.progress_callback = progress_callback
+        self.progress = {
+            "phase": "pending",  # pending -> planning -> running -> done
+            "files_total": 0,
+            "files_done": 0,
+            "chunks_written": 0,
+            "chunks_resumed": 0,
+            "images_total": 0,
+            "images_done": 0,
+        }
+
+    def _report(self, **updates):
+        """更新进度并通知回调 (回调异常不影响入库)"""
+        self.progress.update(updates)
+        if self.progress_callback is not None:
+            try:
+                self.progress_callback(dict(self.progress))
+            except Exception as e:
+                print(f"⚠️ 进度回调失败: {e}")
+
+    def _plan(self, stages: List[str], file_paths: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """对比清单，返回 {文件路径: {"hash": 哈希, "stages": 待执行阶段}}
+
+        file_paths 为 None 时扫描整个主题目录 (并清理已删除文件)；否则只处理给定文件
+        """
+        if file_paths is None:
+            file_paths = self.loader.list_files(self.target_dir)
+
+            for missing_path in self.manifest.missing_files(file_paths):
+                filename = self.manifest.get_filename(missing_path)
+                print(f"🗑️ 文件已删除，清理旧数据: {filename}")
+                self.vector_store.delete_file(missing_path)
+                self.manifest.remove(missing_path)
+        else:
+            supported = []
+            for file_path in file_paths:
+                if not os.path.isfile(file_path):
+                    print(f"⚠️ 文件不存在，已跳过: {file_path}")
+                elif os.path.splitext(file_path)[1].lower() not in self.loader.supported_formats:
+                    print(f"⚠️ 不支持的文件格式，已跳过: {file_path}")
+                else:
+                    supported.append(file_path)
+            file_paths = supported
+
+        plan = {}
+        for file_path in file_paths:
+            digest = file_hash(file_path)
+            if self.manifest.is_changed(file_path, digest):
+                if self.manifest.get_hash(file_path) is not None:
+                    # 内容变化：旧数据整体替换，而不是追加
+                    print(f"♻️ 文件已变化，替换旧数据: {os.path.basename(file_path)}")
+                # 清单中没有记录也要清理：旧版本入库的数据 (随机 ID) 不在清单中，否则会与新数据重复
+                self.vector_store.delete_file(file_path)
+                self.manifest.reset(file_path, digest)
+            todo = [s for s in stages if not self.manifest.is_done(file_path, digest, s)]
+            if todo:
+                plan[file_path] = {"hash": digest, "stages": todo}
+        self.manifest.save()
+
+        self.stats["skipped_files"] = len(file_paths) - len(plan)
+        self._report(files_total=len(plan))
+        if self.stats["skipped_files"]:
+            print(f"⏭️ 跳过 {self.stats['skipped_files']} 个未变化的文件")
+        return plan
+
+    def _load_worker(self, file_paths: List[str], out_q: queue.Queue, stop_event: threading.Event):
+        try:
+            files = self.loader.iter_files(
+                file_paths, self.theme_name, num_workers=self.num_workers, stop_event=stop_event
+            )
+            for file_path, docs in files:
+                out_q.put((file_path, docs))
+        except Exception as e:
+            out_q.put(_StageError(e))
+        finally:
+            out_q.put(_DONE)
+
+    def _on_batch(self, batch: List[Dict]):
+        """断点：记录已写入的块，中断后恢复时跳过"""
+        by_file: Dict[str, List[Dict]] = {}
+        for chunk in batch:
+            if chunk.get("filepath") and chunk.get("file_hash"):
+                by_file.setdefault(chunk["filepath"], []).append(chunk)
+        for file_path, file_chunks in by_file.items():
+            self.manifest.mark_written(file_path, file_chunks[0]["file_hash"], [chunk_key(c) for c in file_chunks])
+        if by_file:
+            self.manifest.save_checkpoint()
+        self._report(chunks_written=self.progress["chunks_written"] + len(batch))
+
+    def _write_worker(self, in_q: queue.Queue, plan: Dict[str, Dict], errors: List[Exception]):
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                return
+            file_path, chunks = item
+            if chunks is None:
+                # 加载失败的文件不标记完成，下次增量运行会重试
+                self.stats["failed_files"] += 1
+                print(f"⚠️ 加载失败，下次增量运行时将重试: {os.path.basename(file_path)}")
+                continue
+            try:
+                failed = self.vector_store.add_documents(chunks, show_progress=False, on_batch=self._on_batch) if chunks else []
+            except Exception as e:
+                errors.append(e)
+                failed = chunks
+            self.stats["chunks"] += len(chunks) - len(failed)
+            # file_path 为 None 表示重试列表中的图片，不对应清单条目
+            if file_path is None:
+                continue
+            if failed:
+                # 写入失败的文件不标记完成，下次增量运行会重试
+                self.stats["failed_files"] += 1
+                print(f"⚠️ 写入失败，下次增量运行时将重试: {os.path.basename(file_path)}")
+                continue
+            for stage in plan[file_path]["stages"]:
+                self.manifest.mark_done(file_path, plan[file_path]["hash"], stage)
+            self.manifest.save()
+            self.stats["files"] += 1
+            self._report(files_done=self.stats["files"])
+            print(f"💾 已写入 {len(chunks)} 条: {os.path.basename(file_path)}")
+
+    def _build_chunks(self, file_path: str, docs: List[Dict], plan: Dict[str, Dict], caption_stage) -> List[Dict]:
+        """单个文件：切分文本、为图片生成描述"""
+        entry = plan[file_path]
+        for doc in docs:
+            doc["file_hash"] = entry["hash"]
+
+        # 上次中断前已写入的块直接跳过
+        written = self.manifest.written_chunks(file_path, entry["hash"])
+        resumed = 0
+
+        chunks = []
+        if "text" in entry["stages"]:
+            text_docs = [d for d in docs if not d.get("is_image")]
+            text_chunks = self.splitter.split_documents(text_docs, show_progress=False)
+            remaining = [c for c in text_chunks if chunk_key(c) not in written]
+            resumed += len(text_chunks) - len(remaining)
+            chunks.extend(remaining)
+
+        if "images" in entry["stages"] and caption_stage is not None:
+            # 图片序号按文件独立编号，保证块 ID 不受其他文件影响
+            image_docs = [d for d in docs if d.get("is_image")]
+            for idx, img_doc in enumerate(image_docs):
+                img_doc["chunk_id"] = f"{IMAGE_CHUNK_PREFIX}{idx}"
+            remaining = [d for d in image_docs if chunk_key(d) not in written]
+            resumed += len(image_docs) - len(remaining)
+            if remaining:
+                self._report(images_total=self.progress["images_total"] + len(remaining))
+                chunks.extend(caption_stage.process(remaining))
+                self._report(images_done=self.progress["images_done"] + len(remaining))
+
+        if resumed:
+            print(f"⏯️ 从断点恢复，跳过已写入的 {resumed} 个块: {os.path.basename(file_path)}")
+            self._report(chunks_resumed=self.progress["chunks_resumed"] + resumed)
+        return chunks
+
+    @staticmethod
+    def _clean(chunks: List[Dict]) -> List[Dict]:
+        # 清洗 metadata 防止 None 报错
+        for chunk in chunks:
+            chunk.pop("is_image", None)
+            if chunk.get("image_path") is None:
+                chunk["image_path"] = ""
+        return chunks
+
+    def run(
+        self,
+        incremental: bool = True,
+        text_only: bool = False,
+        image_only: bool = False,
+        file_paths: Optional[List[str]] = None,
+    ) -> Dict:
+        """执行一次入库，返回统计信息
+
+        file_paths: 只处理这些文件 (例如刚上传的文件)，耗时只与这些文件的大小有关，与课程总量无关；
+                    为 None 时处理整个主题目录
+        """
+        start_time = time.perf_counter()
+        if image_only:
+            print("➕ 后台图片处理模式：强制使用增量更新...")
+            incremental = True
+
+        if file_paths is not None and not incremental:
+            print("➕ 指定文件模式：强制使用增量更新...")
+            incremental = True
+
+        if incremental:
+            # 增量写入不能混用两种 Embedding 模型，模型不一致时要求全量重建
+            self.vector_store.check_embedding_model()
+
+        if not incremental:
+            print(f"🧹 全量模式：清空主题【{self.theme_name}】的数据...")
+            self.vector_store.clear_collection() # 这只会清空当前主题，不会影响其他主题
+            self.manifest.clear()
+        else:
+            print("➕ 增量模式：仅处理新增或变化的文件...")
+
+        # 本次需要执行的阶段
+        stages = []
+        if not image_only:
+            stages.append("text")
+        if not text_only:
+            stages.append("images")
+        if "text" not in stages:
+            print("⏩ [Text Mode] 跳过文本处理")
+        if "images" not in stages:
+            print("⏩ [Vision Mode] 跳过图片处理 (将在后台运行)")
+
+        self._report(phase="planning")
+        plan = self._plan(stages, file_paths)
+        # 上次重试耗尽的 Embedding 批次先补写，成功的块记入断点，后面加载文件时不再重复写入
+        self.stats["chunks"] += self.vector_store.retry_failed_batches(on_batch=self._on_batch)
+        self.manifest.save()
+        caption_stage = None
+        if "images" in stages:
+            caption_stage = ImageCaptionStage(
+                self.theme_name, triage=self.triage, agent=self.caption_agent, cache=self.caption_cache
+            )
+        # 上次描述失败的图片即使文件未变化也需要重试
+        has_retries = caption_stage is not None and caption_stage.retry_list.has_entries()
+        if not plan and not has_retries:
+            if caption_stage:
+                caption_stage.close()
+            self._report(phase="done")
+            print("✅ 没有需要处理的文件")
+            return self.stats
+
+        docs_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_errors: List[Exception] = []
+        # 主线程中途出错时通知加载线程停止，否则它会一直阻塞在 docs_q.put 上 (连同其进程池)
+        stop_event = threading.Event()
+        loader_done = False
+
+        loader_thread = threading.Thread(target=self._load_worker, args=(list(plan), docs_q, stop_event), daemon=True)
+        writer_thread = threading.Thread(target=self._write_worker, args=(write_q, plan, write_errors), daemon=True)
+        loader_thread.start()
+        writer_thread.start()
+        self._report(phase="running")
+
+        try:
+            while True:
+                item = docs_q.get()
+                if item is _DONE:
+                    loader_done = True
+                    break
+                if isinstance(item, _StageError):
+                    raise item.error
+                file_path, docs = item
+                if docs is None:
+                    # 失败标记交给写入线程统计，保证失败计数只在一个线程里修改
+                    write_q.put((file_path, None))
+                    continue
+                chunks = self._build_chunks(file_path, docs, plan, caption_stage)
+                write_q.put((file_path, self._clean(chunks)))
+
+            if caption_stage is not None:
+                retried = caption_stage.process_retries()
+                if retried:
+                    write_q.put((None, self._clean(retried)))
+        finally:
+            if not loader_done:
+                stop_event.set()
+                # 排空队列，让阻塞在 put 上的加载线程看到停止标记后退出
+                while docs_q.get() is not _DONE:
+                    pass
+            loader_thread.join()
+            write_q.put(_DONE)
+            writer_thread.join()
+            # 未完成文件的最后一段断点
+            self.manifest.save()
+            if caption_stage is not None:
+                caption_stage.close()
+
+        self.loader.print_image_stats()
+        cache_stats = self.vector_store.embedding_cache.stats()
+        if cache_stats["hits"] + cache_stats["misses"]:
+            print(
+                f"🧠 Embedding 缓存: 命中 {cache_stats['hits']} / {cache_stats['hits'] + cache_stats['misses']} "
+                f"({cache_stats['hit_rate']:.0%})"
+            )
+        self.stats["elapsed_seconds"] = round(time.perf_counter() - start_time, 2)
+        self._report(phase="done")
+        print(f"⏱️ 入库耗时 {self.stats['elapsed_seconds']:.2f}s")
+        if write_errors:
+            print(f"⚠️ 写入过程中出现 {len(write_errors)} 个错误: {write_errors[0]}")
+        if self.stats["failed_files"]:
+            print(f"⚠️ {self.stats['failed_files']} 个文件加载或写入失败，下次增量运行时将重试")
+        else:
+            print(f"✅ 处理完成！共处理 {self.stats['files']} 个文件，写入 {self.stats['chunks']} 条数据")
+        return self.stats
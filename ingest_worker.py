@@ -0,0 +1,288 @@
+# ingest_worker.py
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from config import DATA_DIR, VECTOR_DB_PATH, INGEST_JOBS_DIR
+from vector_store import get_vector_store
+from manifest import IngestManifest
+from caption_cache import CaptionCache
+from ingest_pipeline import IngestPipeline
+
+# 保留的历史任务条数
+MAX_JOB_HISTORY = 200
+# 进度落盘的最小间隔 (秒)，状态变化时总是立即落盘
+PROGRESS_SAVE_INTERVAL = 2.0
+
+
+class IngestJob:
+    """
+    一次入库任务。future 在任务结束时给出统计信息 (或异常)。
+    任务记录持久化在 ingest_state/jobs/<id>.json，进程重启后未完成的任务会自动恢复，
+    配合清单中的断点，只补做剩余的文件、页面、图片和 Embedding 批次。
+    """
+
+    def __init__(
+        self,
+        theme: str,
+        incremental: bool = True,
+        text_only: bool = False,
+        image_only: bool = False,
+        file_paths: Optional[List[str]] = None,
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.theme = theme
+        self.file_paths = file_paths
+        self.incremental = incremental
+        self.text_only = text_only
+        self.image_only = image_only
+        self.status = "queued"  # queued -> running -> done / failed
+        self.progress: Dict = {}
+        self.resumed = False
+        self.stats: Dict = {}
+        self.error: Optional[str] = None
+        self.submitted_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self.future: Future = Future()
+        self.jobs_dir = INGEST_JOBS_DIR
+        self._saved_at = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "theme": self.theme,
+            "file_paths": self.file_paths,
+            "incremental": self.incremental,
+            "text_only": self.text_only,
+            "image_only": self.image_only,
+            "status": self.status,
+            "resumed": self.resumed,
+            "progress": dict(self.progress),
+            "stats": self.stats,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IngestJob":
+        job = cls(
+            data["theme"],
+            incremental=data.get("incremental", True),
+            text_only=data.get("text_only", False),
+            image_only=data.get("image_only", False),
+            file_paths=data.get("file_paths"),
+        )
+        job.id = data["id"]
+        job.status = data.get("status", "queued")
+        job.progress = data.get("progress", {})
+        job.stats = data.get("stats", {})
+        job.error = data.get("error")
+        job.submitted_at = data.get("submitted_at", job.submitted_at)
+        job.finished_at = data.get("finished_at")
+        return job
+
+    def save(self, force: bool = True):
+        """写入任务记录；force=False 时按 PROGRESS_SAVE_INTERVAL 节流"""
+        now = time.monotonic()
+        if not force and now - self._saved_at < PROGRESS_SAVE_INTERVAL:
+            return
+        self._saved_at = now
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = os.path.join(self.jobs_dir, f"{self.id}.json")
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 任务记录保存失败 {self.id}: {e}")
+
+    def update_progress(self, progress: Dict):
+        self.progress = progress
+        self.save(force=progress.get("phase") == "done")
+
+
+class IngestWorker:
+    """
+    常驻的进程内入库 worker，替代每次上传都 subprocess 启动 process_data.py。
+
+    - 两条任务通道：文本通道 (上传后需要尽快可检索) 与后台通道 (图片描述等耗时任务)，
+      互不阻塞，各由一个常驻线程串行处理
+    - 入库清单、视觉 Agent、描述缓存在任务间保持常驻；VectorStore 每个任务从进程内注册表获取
+    - 任务记录落盘，启动时自动恢复上次未完成的任务；get_job / list_jobs 供界面轮询进度
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, db_path: str = VECTOR_DB_PATH, jobs_dir: str = INGEST_JOBS_DIR):
+        self.data_dir = data_dir
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir
+        self._queues = {"text": queue.Queue(), "background": queue.Queue()}
+        self._jobs: Dict[str, IngestJob] = {}
+        self._manifests: Dict[str, IngestManifest] = {}
+        self._state_lock = threading.Lock()
+        self._caption_cache: Optional[CaptionCache] = None
+        self._caption_agent = None
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        for lane, q in self._queues.items():
+            thread = threading.Thread(target=self._run_lane, args=(q,), name=f"ingest-{lane}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print("🏭 [IngestWorker] 入库 worker 已启动")
+        self._resume_jobs()
+
+    def _enqueue(self, job: IngestJob):
+        job.jobs_dir = self.jobs_dir
+        with self._state_lock:
+            self._jobs[job.id] = job
+            # 只保留最近的任务记录
+            finished = [j for j in self._jobs.values() if j.finished_at]
+            for old in finished[: max(0, len(self._jobs) - MAX_JOB_HISTORY)]:
+                self._jobs.pop(old.id, None)
+                try:
+                    os.remove(os.path.join(self.jobs_dir, f"{old.id}.json"))
+                except OSError:
+                    pass
+        job.save()
+        lane = "background" if job.image_only else "text"
+        self._queues[lane].put(job)
+
+    def _resume_jobs(self):
+        """重新排队上次进程退出时仍在排队或运行中的任务"""
+        if not os.path.isdir(self.jobs_dir):
+            return
+        records = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    records.append(json.load(f))
+            except Exception as e:
+                print(f"⚠️ 任务记录读取失败 {name}: {e}")
+
+        for data in sorted(records, key=lambda d: d.get("submitted_at", "")):
+            job = IngestJob.from_dict(data)
+            if job.status in ("done", "failed"):
+                job.jobs_dir = self.jobs_dir
+                with self._state_lock:
+                    self._jobs[job.id] = job
+                continue
+            # 已开始运行的全量任务在中断前清空过旧数据，恢复时按增量继续，不再重复清空；
+            # 仍在排队的任务从未开始，按原参数执行
+            if job.status == "running":
+                job.incremental = True
+            job.status = "queued"
+            job.resumed = True
+            print(f"⏯️ [IngestWorker] 恢复未完成的任务 {job.id} ({job.theme})")
+            self._enqueue(job)
+
+    def submit(
+        self,
+        theme: str,
+        incremental: bool = True,
+        text_only: bool = False,
+        image_only: bool = False,
+        file_paths: Optional[List[str]] = None,
+    ) -> IngestJob:
+        """提交任务并立即返回；调用方可 await asyncio.wrap_future(job.future) 等待结果
+
+        file_paths 不为空时只处理这些文件 (上传场景)，否则处理整个主题目录
+        """
+        self.start()
+        job = IngestJob(
+            theme, incremental=incremental, text_only=text_only, image_only=image_only, file_paths=file_paths
+        )
+        self._enqueue(job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestJob]:
+        with self._state_lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self, job_id: str) -> Optional[Dict]:
+        """任务状态与进度快照，供界面轮询"""
+        job = self.get_job(job_id)
+        return job.to_dict() if job else None
+
+    def list_jobs(self, theme: Optional[str] = None) -> List[Dict]:
+        with self._state_lock:
+            jobs = list(self._jobs.values())
+        return [j.to_dict() for j in jobs if theme is None or j.theme == theme]
+
+    def _warm_state(self, theme: str):
+        """获取主题对应的 VectorStore 与 (首次创建的) 常驻清单"""
+        # 不在 worker 中另行持有 VectorStore：每个任务都从注册表获取，与之后打开该主题的会话共用实例，
+        # 也不会绕过注册表的 VECTOR_STORE_CACHE_SIZE 上限
+        vector_store = get_vector_store(theme, db_path=self.db_path)
+        with self._state_lock:
+            if theme not in self._manifests:
+                self._manifests[theme] = IngestManifest(theme)
+            if self._caption_cache is None:
+                self._caption_cache = CaptionCache()
+            return vector_store, self._manifests[theme]
+
+    def _get_caption_agent(self, theme: str):
+        with self._state_lock:
+            if self._caption_agent is None:
+                from rag_agent import RAGAgent
+                self._caption_agent = RAGAgent(initial_theme=theme)
+            return self._caption_agent
+
+    def _run_lane(self, q: queue.Queue):
+        while True:
+            job = q.get()
+            job.status = "running"
+            job.save()
+            try:
+                vector_store, manifest = self._warm_state(job.theme)
+                pipeline = IngestPipeline(
+                    theme_name=job.theme,
+                    target_dir=os.path.join(self.data_dir, job.theme),
+                    vector_store=vector_store,
+                    manifest=manifest,
+                    caption_agent=None if job.text_only else self._get_caption_agent(job.theme),
+                    caption_cache=self._caption_cache,
+                    progress_callback=job.update_progress,
+                )
+                job.stats = pipeline.run(
+                    incremental=job.incremental,
+                    text_only=job.text_only,
+                    image_only=job.image_only,
+                    file_paths=job.file_paths,
+                )
+                job.status = "done"
+                job.finished_at = datetime.now().isoformat()
+                job.save()
+                job.future.set_result(job.stats)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.now().isoformat()
+                job.save()
+                print(f"❌ [IngestWorker] 任务 {job.id} ({job.theme}) 失败: {e}")
+                job.future.set_exception(e)
+
+
+_worker: Optional[IngestWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_ingest_worker() -> IngestWorker:
+    """进程级单例"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = IngestWorker()
+            _worker.start()
+        return _worker
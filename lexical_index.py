@@ -0,0 +1,177 @@
+# lexical_index.py
+import os
+import re
+import math
+import heapq
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from config import BM25_K1, BM25_B, RRF_K
+
+# SQLite 单条语句的参数个数有上限，批量删除时分段
+_QUERY_CHUNK = 500
+
+# 英文/数字/下划线组成的词 (函数名、缩写如 PCB、LRU) 与连续的中日韩汉字
+_TOKEN_PATTERN = re.compile(r"[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    检索用分词：英文按词 (小写)，中文按相邻二字 (bigram) 切分，单个汉字保持原样。
+    例如 "银行家算法" -> ["银行", "行家", "家算", "算法"]，无需中文词典。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        word = match.group()
+        if word[0].isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def bm25_scores(query: str, documents: List[str], k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """以 documents 本身为语料计算每个文档对 query 的 BM25 分数 (用于少量候选的重排序)"""
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    if not documents or not query_terms:
+        return np.zeros(len(documents), dtype=np.float32)
+
+    term_index = {term: j for j, term in enumerate(query_terms)}
+    tf = np.zeros((len(documents), len(query_terms)), dtype=np.float32)
+    doc_len = np.zeros(len(documents), dtype=np.float32)
+    for i, doc in enumerate(documents):
+        tokens = tokenize(doc)
+        doc_len[i] = len(tokens)
+        for term, count in Counter(tokens).items():
+            j = term_index.get(term)
+            if j is not None:
+                tf[i, j] = count
+
+    n_docs = len(documents)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avg_len = doc_len.mean() or 1.0
+    norm = k1 * (1 - b + b * doc_len / avg_len)
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int = RRF_K) -> List[Dict]:
+    """
+    RRF 融合多路检索结果：每条结果得分为 Σ 1 / (k + 名次)，按 "id" 去重。
+    返回的结果保留首次出现时的字段，并附加 rrf_score。
+    """
+    scores: Dict[str, float] = {}
+    merged: Dict[str, Dict] = {}
+    for results in ranked_lists:
+        for rank, res in enumerate(results, 1):
+            key = res.get("id") or res["content"]
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            merged.setdefault(key, res)
+    order = sorted(scores, key=scores.get, reverse=True)
+    return [dict(merged[key], rrf_score=scores[key]) for key in order]
+
+
+class LexicalIndex:
+    """
+    每个主题一份的倒排索引 (SQLite)，与 Chroma 存放在同一目录下。
+    VectorStore 写入/删除/清空集合时同步更新，因此增量入库无需重建；
+    只保存词频与文档长度，正文和元数据仍从 Chroma 读取。
+    """
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # 入库进程写、聊天进程读，依靠 WAL 互不阻塞
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc_id);
+            CREATE INDEX IF NOT EXISTS idx_docs_filename ON docs (filename);
+            """
+        )
+        self._conn.commit()
+
+    def _remove(self, doc_ids: List[str]) -> None:
+        for start in range(0, len(doc_ids), _QUERY_CHUNK):
+            part = doc_ids[start : start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", part)
+            self._conn.execute(f"DELETE FROM docs WHERE doc_id IN ({placeholders})", part)
+
+    def add(self, doc_ids: List[str], documents: List[str], filenames: List[str]) -> None:
+        """写入/覆盖文档 (与 Chroma 的 upsert 语义一致)"""
+        docs_rows = []
+        posting_rows = []
+        for doc_id, text, filename in zip(doc_ids, documents, filenames):
+            counts = Counter(tokenize(text))
+            docs_rows.append((doc_id, filename, sum(counts.values())))
+            posting_rows.extend((term, doc_id, tf) for term, tf in counts.items())
+        with self._lock:
+            self._remove(list(doc_ids))
+            self._conn.executemany("INSERT INTO docs VALUES (?, ?, ?)", docs_rows)
+            self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", posting_rows)
+            self._conn.commit()
+
+    def delete(self, doc_ids: List[str]) -> None:
+        with self._lock:
+            self._remove(list(doc_ids))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """BM25 检索，返回 [(doc_id, score), ...]，按分数从高到低"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        scores: Dict[str, float] = {}
+        with self._lock:
+            n_docs, total_len = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            avg_len = total_len / n_docs or 1.0
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log1p((n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
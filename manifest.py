@@ -0,0 +1,169 @@
+# manifest.py
+import os
+import json
+import hashlib
+import time
+import threading
+from datetime import datetime
+from typing import List, Dict, Optional, Set
+
+from config import MANIFEST_DIR, MANIFEST_CHECKPOINT_INTERVAL
+
+# 图片块的块序号前缀 (文本块为数字)，用于区分断点记录属于哪个阶段
+IMAGE_CHUNK_PREFIX = "img_"
+
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """计算文件内容的 sha256 (分块读取，避免大文件一次性载入内存)"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_key(file_path: str) -> str:
+    """清单与向量库中标识文件的键 (规范化路径，不同子目录下的同名文件互不冲突)"""
+    return os.path.normpath(file_path)
+
+
+def chunk_key(chunk: Dict) -> str:
+    """文件内的块标识 (页码:块序号)，用于断点记录"""
+    return f"{chunk['page_number']}:{chunk['chunk_id']}"
+
+
+def _chunk_stage(key: str) -> str:
+    return "images" if key.split(":", 1)[-1].startswith(IMAGE_CHUNK_PREFIX) else "text"
+
+
+def make_chunk_id(file_digest: str, page_number, chunk_id) -> str:
+    """由 (文件哈希, 页码, 块序号) 生成确定性的 Chroma ID，重复入库时可直接 upsert 覆盖"""
+    key = f"{file_digest}:{page_number}:{chunk_id}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    每个主题一份的入库清单，记录文件内容哈希以及已完成的处理阶段 ("text" / "images")。
+    文件内容未变且阶段已完成 -> 跳过；内容变化 -> 清除旧数据后重新入库。
+    阶段未完成的文件还会记录已写入的块 (按页码:块序号，逐个 Embedding 批次更新)，
+    任务中断后重新运行时只补写剩余的页面、图片和批次；阶段完成后该阶段的断点记录随即清除。
+    实例可被多个入库线程共享 (文本与图片任务并行时)，读写均加锁。
+    """
+
+    def __init__(self, theme: str, manifest_dir: str = MANIFEST_DIR, checkpoint_interval: float = MANIFEST_CHECKPOINT_INTERVAL):
+        os.makedirs(manifest_dir, exist_ok=True)
+        self.theme = theme
+        self.path = os.path.join(manifest_dir, f"{theme}.json")
+        self.files: Dict[str, Dict] = {}
+        self.checkpoint_interval = checkpoint_interval
+        self._last_saved = 0.0
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except Exception as e:
+            print(f"⚠️ 清单读取失败，将视为全新主题: {e}")
+            self.files = {}
+
+    def save(self):
+        with self._lock:
+            data = {
+                "theme": self.theme,
+                "updated_at": datetime.now().isoformat(),
+                "files": self.files,
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._last_saved = time.monotonic()
+
+    def save_checkpoint(self):
+        """逐批次的断点写盘，距上次写盘不足 checkpoint_interval 秒时跳过 (中断后最多重写这段时间内的批次)"""
+        with self._lock:
+            if time.monotonic() - self._last_saved >= self.checkpoint_interval:
+                self.save()
+
+    def clear(self):
+        """全量重建时调用"""
+        with self._lock:
+            self.files = {}
+            self.save()
+
+    def _key(self, file_path: str) -> str:
+        return file_key(file_path)
+
+    def get_hash(self, file_path: str) -> Optional[str]:
+        with self._lock:
+            entry = self.files.get(self._key(file_path))
+            return entry["sha256"] if entry else None
+
+    def is_changed(self, file_path: str, digest: str) -> bool:
+        """文件是否新增或内容发生变化"""
+        return self.get_hash(file_path) != digest
+
+    def is_done(self, file_path: str, digest: str, stage: str) -> bool:
+        """文件内容未变且该阶段已处理过"""
+        with self._lock:
+            entry = self.files.get(self._key(file_path))
+            return bool(entry) and entry["sha256"] == digest and stage in entry.get("stages", [])
+
+    def reset(self, file_path: str, digest: str):
+        """文件内容变化：记录新哈希并清空已完成阶段"""
+        with self._lock:
+            self.files[self._key(file_path)] = {
+                "sha256": digest,
+                "filename": os.path.basename(file_path),
+                "stages": [],
+                "written": [],
+            }
+
+    def mark_done(self, file_path: str, digest: str, stage: str):
+        """标记阶段完成；若期间文件已被替换为新版本 (哈希不符)，则忽略这次过期的结果"""
+        with self._lock:
+            entry = self.files.get(self._key(file_path))
+            if not entry or entry["sha256"] != digest:
+                return
+            if stage not in entry["stages"]:
+                entry["stages"].append(stage)
+            # 该阶段已完整写入，不再需要逐块的断点
+            entry["written"] = [k for k in entry.get("written", []) if _chunk_stage(k) != stage]
+
+    def written_chunks(self, file_path: str, digest: str) -> Set[str]:
+        """断点：该版本文件中已成功写入的块"""
+        with self._lock:
+            entry = self.files.get(self._key(file_path))
+            if not entry or entry["sha256"] != digest:
+                return set()
+            return set(entry.get("written", []))
+
+    def mark_written(self, file_path: str, digest: str, keys: List[str]):
+        """记录一批写入成功的块；文件已被替换为新版本时忽略"""
+        with self._lock:
+            entry = self.files.get(self._key(file_path))
+            if not entry or entry["sha256"] != digest:
+                return
+            written = entry.setdefault("written", [])
+            known = set(written)
+            written.extend(k for k in keys if k not in known)
+
+    def get_filename(self, file_path: str) -> str:
+        with self._lock:
+            entry = self.files.get(self._key(file_path))
+            return entry["filename"] if entry else os.path.basename(file_path)
+
+    def missing_files(self, existing_paths: List[str]) -> List[str]:
+        """清单中有记录但磁盘上已不存在的文件"""
+        existing = {self._key(p) for p in existing_paths}
+        with self._lock:
+            return [p for p in self.files if p not in existing]
+
+    def remove(self, file_path: str):
+        with self._lock:
+            self.files.pop(self._key(file_path), None)
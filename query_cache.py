@@ -0,0 +1,130 @@
+# query_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, THEME_VERSION_DIR
+from embedding_cache import normalize_text
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """查询缓存键：合并空白并忽略大小写 ("What is a process" 与 "what is a  process" 视为同一问题)"""
+    return normalize_text(query).casefold()
+
+
+class TTLCache:
+    """线程安全的内存 LRU 缓存，条目超过 ttl 秒后失效"""
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires_at, value = item
+                if expires_at >= time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class ThemeVersions:
+    """
+    每个主题的数据版本号，写入/删除数据时递增。
+    版本号存放在文件中，命令行入库 (另一个进程) 的更新也能被聊天进程看到；
+    检索结果缓存的键包含版本号，新资料入库后旧结果自然不再命中。
+    每次检索都要取版本号，读取结果缓存在内存中，只用一次 stat 判断文件是否被替换过。
+    """
+
+    def __init__(self, version_dir: str = THEME_VERSION_DIR):
+        os.makedirs(version_dir, exist_ok=True)
+        self.version_dir = version_dir
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[Tuple[int, int], int]] = {}  # 主题 -> ((inode, mtime), 版本号)
+
+    def _path(self, theme: str) -> str:
+        return os.path.join(self.version_dir, f"{theme}.txt")
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int]]:
+        # bump 通过 os.replace 换入新文件，inode 随之改变，不受 mtime 精度影响
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def get(self, theme: str) -> int:
+        path = self._path(theme)
+        stamp = self._stamp(path)
+        if stamp is None:
+            return 0
+        cached = self._cache.get(theme)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                version = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        self._cache[theme] = (stamp, version)
+        return version
+
+    def bump(self, theme: str) -> int:
+        with self._lock:
+            version = self.get(theme) + 1
+            tmp_path = self._path(theme) + f".{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(version))
+            os.replace(tmp_path, self._path(theme))
+            stamp = self._stamp(self._path(theme))
+            if stamp is not None:
+                self._cache[theme] = (stamp, version)
+            return version
+
+
+# 进程级共享实例
+query_embedding_cache = TTLCache()
+search_result_cache = TTLCache()
+theme_versions = ThemeVersions()
+
+
+def query_cache_stats() -> Dict[str, Dict]:
+    """查询侧缓存的命中率"""
+    return {
+        "query_embedding": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+    }
@@ -1,7 +1,7 @@
 # rag_agent.py
-import re
-from typing import List, Dict, Optional, Tuple
-from openai import OpenAI
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import List, Dict, Optional, Tuple, Iterator, AsyncIterator
 from config import (
     OPENAI_API_KEY,
     OPENAI_API_BASE,
@@ -10,29 +10,72 @@ from config import (
     VISION_API_BASE,   # 视觉Base
     VISION_MODEL_NAME, # 视觉模型
     TOP_K,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_MIN_QUERY_CHARS,
+    RERANKER,
+    HYBRID_SEARCH,
+    SPECULATIVE_RETRIEVAL,
+    SPECULATIVE_REUSE_SIMILARITY,
+    REWRITE_TIMEOUT,
+    SPECULATIVE_WORKERS,
 )
-from vector_store import VectorStore
+from vector_store import get_vector_store
+from clients import get_openai, get_async_openai, run_storage
+from answer_cache import get_answer_cache
+from query_cache import theme_versions, normalize_query
+from embedding_cache import normalize_text
+from reranker import get_reranker
+from lexical_index import reciprocal_rank_fusion, tokenize
+
+# 入库时图片描述使用的提示词。修改提示词时请同步提升版本号，使图片描述缓存失效
+VISION_ANALYSIS_PROMPT = """
+你是一个辅助检索系统。请详细分析这张图片，生成搜索关键词。
+1. 若包含文字（题目、文档）：请完整提取文字。
+2. 若是图表/架构图：请详细描述视觉内容、核心概念及组件关系。
+要求：直接输出分析结果。
+"""
+VISION_PROMPT_VERSION = "1"
+
+# 问题重写与预检索共用的线程池 (所有会话共享，线程数有上限)
+_speculation_pool = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculate")
+
+
+def _queries_close(original: str, rewritten: str) -> bool:
+    """重写后的问题与原问题是否几乎一致 (可直接复用原问题的检索结果)"""
+    if normalize_query(original) == normalize_query(rewritten):
+        return True
+    a, b = set(tokenize(original)), set(tokenize(rewritten))
+    if not a or not b:
+        return False
+    return len(a & b) / len(a | b) >= SPECULATIVE_REUSE_SIMILARITY
 
 class RAGAgent:
     def __init__(self,initial_theme: str = "Default"):
         # 1. 初始化文本专用客户端 (使用原 Key)
         # 用于: Embedding, 纯文本问答
-        self.text_client = OpenAI(
-            api_key=OPENAI_API_KEY, 
-            base_url=OPENAI_API_BASE
-        )
+        # 客户端在进程内共享 (每个端点一个连接池)，新建会话无需重新建立连接
+        self.text_client = get_openai(OPENAI_API_KEY, OPENAI_API_BASE)
         self.text_model = TEXT_MODEL_NAME
 
         # 2. 初始化视觉专用客户端 (用于: 图片分析)
-        self.vision_client = OpenAI(
-            api_key=VISION_API_KEY, 
-            base_url=VISION_API_BASE
-        )
+        self.vision_client = get_openai(VISION_API_KEY, VISION_API_BASE)
         self.vision_model = VISION_MODEL_NAME
 
+        # 3. 异步客户端 (Chainlit 中直接 await，共用进程内的 HTTP 连接池)
+        self.async_text_client = get_async_openai(OPENAI_API_KEY, OPENAI_API_BASE)
+        self.async_vision_client = get_async_openai(VISION_API_KEY, VISION_API_BASE)
+
         # 初始化向量库
         self.current_theme = initial_theme
-        self.vector_store = VectorStore(collection_name=initial_theme)
+        self.vector_store = get_vector_store(initial_theme)
+
+        # 检索结果重排序器 (默认本地 BM25，config.RERANKER="llm" 时沿用大模型挑选)
+        self.reranker = get_reranker(
+            RERANKER,
+            llm_client=self.text_client,
+            llm_model=self.text_model,
+            llm_async_client=self.async_text_client,
+        )
 
         # 🚀 升级点 3: 思维链 (CoT) System Prompt
         self.system_prompt = """你是一名专业的计算机科学课程助教。你的目标是“教会学生思考”，并善于利用图文结合的方式进行讲解。
@@ -65,36 +108,38 @@ class RAGAgent:
 **语气要求**：亲切、专业、循循善诱。
 """
 
-    def understand_image(self, image_base64: str) -> str:
+    @staticmethod
+    def _vision_messages(image_base64: str, image_mime: str) -> List[Dict]:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": VISION_ANALYSIS_PROMPT},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{image_mime};base64,{image_base64}"}
+                    }
+                ]
+            }
+        ]
+
+    def understand_image(self, image_base64: str, raise_on_error: bool = False, image_mime: str = "image/jpeg") -> str:
         """
         [保留原有功能] 视觉分析
+        raise_on_error=True 时将异常抛给调用方 (供入库时的重试逻辑判断 429/5xx)
+        image_base64 / image_mime 建议由 image_utils.prepare_image 生成
         """
         print("📸 [Agent] 正在进行深度视觉理解与描述...")
-        vision_analysis_prompt = """
-你是一个辅助检索系统。请详细分析这张图片，生成搜索关键词。
-1. 若包含文字（题目、文档）：请完整提取文字。
-2. 若是图表/架构图：请详细描述视觉内容、核心概念及组件关系。
-要求：直接输出分析结果。
-"""
         try:
             response = self.vision_client.chat.completions.create(
                 model=self.vision_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": vision_analysis_prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                            }
-                        ]
-                    }
-                ],
+                messages=self._vision_messages(image_base64, image_mime),
                 max_tokens=1000
             )
             return response.choices[0].message.content
         except Exception as e:
+            if raise_on_error:
+                raise
             print(f"❌ 视觉分析失败: {e}")
             return ""
 
@@ -106,25 +151,11 @@ class RAGAgent:
         if not chat_history:
             return query
 
-        # 取最近两轮对话作为参考
-        recent_history = chat_history[-4:]
-        
-        rewrite_prompt = f"""
-你是一个查询重写助手。基于以下对话历史，将用户的最新问题重写为一个独立、语义完整的搜索语句。
-重点：替换代词（如"它"、"这个"）为具体名词。
-
-历史对话：
-{recent_history}
-
-用户最新问题：{query}
-
-请直接输出重写后的问题，不要包含任何解释。
-"""
         try:
             # print("🤔 正在理解上下文...", end="\r")
             response = self.text_client.chat.completions.create(
                 model=self.text_model,
-                messages=[{"role": "user", "content": rewrite_prompt}],
+                messages=[{"role": "user", "content": self._rewrite_prompt(query, chat_history)}],
                 temperature=0.1
             )
             new_query = response.choices[0].message.content.strip()
@@ -134,66 +165,42 @@ class RAGAgent:
             print(f"⚠️ 重写失败: {e}")
             return query
 
-    def rerank_results(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
-        """
-        🚀 升级点 2: 检索结果重排序 (LLM Rerank)
-        让大模型从初筛结果中挑出最相关的
-        """
-        if not results:
-            return []
-            
-        print(f"⚖️ [Agent] 正在对 {len(results)} 条检索结果进行精选...")
+    @staticmethod
+    def _rewrite_prompt(query: str, chat_history: List[Dict]) -> str:
+        # 取最近两轮对话作为参考
+        recent_history = chat_history[-4:]
         
-        # 构造给 LLM 看的候选列表 (只截取前200字节省Token)
-        candidates_str = ""
-        for i, res in enumerate(results):
-            candidates_str += f"[ID:{i}] 内容: {res['content'][:200]}...\n\n"
+        return f"""
+你是一个查询重写助手。基于以下对话历史，将用户的最新问题重写为一个独立、语义完整的搜索语句。
+重点：替换代词（如"它"、"这个"）为具体名词。
+
+历史对话：
+{recent_history}
 
-        rerank_prompt = f"""
-请针对问题：“{query}”
-从以下候选片段中，选出最能回答该问题的 {top_k} 个片段的ID。
-要求：只输出ID列表，格式如 [0, 2, 5]。不要输出其他文字。
+用户最新问题：{query}
 
-{candidates_str}
+请直接输出重写后的问题，不要包含任何解释。
 """
-        try:
-            response = self.text_client.chat.completions.create(
-                model=self.text_model,
-                messages=[{"role": "user", "content": rerank_prompt}],
-                temperature=0
-            )
-            content = response.choices[0].message.content
-            # 提取数字 ID
-            selected_ids = [int(d) for d in re.findall(r'\d+', content)]
-            
-            # 根据 ID 获取对应的文档
-            final_results = [results[i] for i in selected_ids if i < len(results)]
-            
-            # 兜底：如果筛选结果为空，回退到默认前K个
-            if not final_results:
-                return results[:top_k]
-                
-            return final_results
-        except Exception as e:
-            print(f"⚠️ 重排序失败，使用默认排序: {e}")
-            return results[:top_k]
 
-    def retrieve_context(
-        self, query: str, top_k: int = TOP_K
-    ) -> Tuple[str, List[Dict]]:
-        """检索并构建上下文 (包含 Rerank 逻辑)"""
-        
-        # 1. 扩大检索范围 (检索 2 倍数量，用于筛选)
-        initial_k = top_k * 2
-        initial_results = self.vector_store.search(query, top_k=initial_k)
-        
-        # 2. 智能重排序
-        final_results = self.rerank_results(query, initial_results, top_k)
-        
-    
-        # 3. 格式化上下文 (🚀 关键修改在这里)
+    def rerank_results(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        """
+        🚀 升级点 2: 检索结果重排序
+        从初筛结果中挑出最相关的 top_k 条，具体实现见 reranker.py
+        """
+        return self.reranker(query, results, top_k)
+
+    def _retrieve_candidates(self, query: str, initial_k: int) -> List[Dict]:
+        """初筛候选：向量检索，开启混合检索时与词法 (BM25) 结果按 RRF 融合"""
+        results = self.vector_store.search(query, top_k=initial_k)
+        if HYBRID_SEARCH:
+            lexical_results = self.vector_store.lexical_search(query, top_k=initial_k)
+            results = reciprocal_rank_fusion([results, lexical_results])[:initial_k]
+        return results
+
+    def _format_context(self, results: List[Dict]) -> str:
+        # 格式化上下文 (🚀 关键修改在这里)
         context_parts = []
-        for i, res in enumerate(final_results, 1):
+        for i, res in enumerate(results, 1):
             meta = res["metadata"]
             source_info = f"来源: {meta['filename']}"
             if meta.get('page_number') > 0:
@@ -208,16 +215,73 @@ class RAGAgent:
             context_str = f"--- 文档片段 {i} ---\n{source_info}\n内容:\n{res['content']}{image_hint}\n"
             context_parts.append(context_str)
             
-        return "\n".join(context_parts), final_results
+        return "\n".join(context_parts)
 
-    def generate_response(
+    def retrieve_context(
+        self, query: str, top_k: int = TOP_K
+    ) -> Tuple[str, List[Dict]]:
+        """检索并构建上下文 (包含 Rerank 逻辑)"""
+        
+        # 1. 扩大检索范围 (检索 2 倍数量，用于筛选)
+        initial_results = self._retrieve_candidates(query, top_k * 2)
+        
+        # 2. 智能重排序
+        final_results = self.rerank_results(query, initial_results, top_k)
+
+        # 3. 格式化上下文
+        return self._format_context(final_results), final_results
+
+    def retrieve_with_rewrite(
+        self, query: str, chat_history: Optional[List[Dict]], top_k: int = TOP_K
+    ) -> Tuple[str, str, List[Dict]]:
+        """
+        意图重写 + 检索，返回 (检索用的问题, 上下文, 检索结果)。
+        有对话历史时，重写 (一次 LLM 调用) 与原问题的预检索并行进行：
+        - 重写结果与原问题几乎一致：直接复用预检索的候选
+        - 否则用重写后的问题重新检索，并与已完成的预检索候选按 RRF 合并；预检索若尚未开始则取消
+        - 重写超过 REWRITE_TIMEOUT 秒：放弃等待，按原问题继续
+        """
+        if not chat_history:
+            context, results = self.retrieve_context(query, top_k=top_k)
+            return query, context, results
+        if not SPECULATIVE_RETRIEVAL:
+            search_query = self.rewrite_query(query, chat_history)
+            context, results = self.retrieve_context(search_query, top_k=top_k)
+            return search_query, context, results
+
+        initial_k = top_k * 2
+        rewrite_future = _speculation_pool.submit(self.rewrite_query, query, chat_history)
+        speculative_future = _speculation_pool.submit(self._retrieve_candidates, query, initial_k)
+
+        try:
+            search_query = rewrite_future.result(timeout=REWRITE_TIMEOUT)
+        except FuturesTimeout:
+            # 已发出的请求无法中断，结果直接丢弃
+            rewrite_future.cancel()
+            print(f"⏱️ [Agent] 问题重写超过 {REWRITE_TIMEOUT}s，使用原问题继续")
+            search_query = query
+
+        if _queries_close(query, search_query):
+            print("⚡ [Agent] 重写后的问题与原问题一致，复用预检索结果")
+            candidates = speculative_future.result()
+        else:
+            speculative_future.cancel()
+            candidates = self._retrieve_candidates(search_query, initial_k)
+            if speculative_future.done() and not speculative_future.cancelled() and speculative_future.exception() is None:
+                candidates = reciprocal_rank_fusion([candidates, speculative_future.result()])[:initial_k]
+
+        final_results = self.rerank_results(search_query, candidates, top_k)
+        return search_query, self._format_context(final_results), final_results
+
+    def _generation_messages(
         self,
         query: str,
         context: str,
-        chat_history: Optional[List[Dict]] = None,
-        image_base64: Optional[str] = None
-    ) -> str:
-        """生成回答：支持思维链 + 多模态"""
+        chat_history: Optional[List[Dict]],
+        image_base64: Optional[str],
+        image_mime: str,
+    ) -> Tuple[str, List[Dict]]:
+        """构造生成回答的消息列表，返回 (模型名, messages)；同步/异步生成共用"""
 
         # === 核心修改 1: 检测 Context 中是否真的包含图片标记 ===
         has_images = "[IMAGE_REF]" in context
@@ -262,18 +326,27 @@ class RAGAgent:
 
         # 3. 路由逻辑 (有图用 Vision 模型，无图用 Text 模型)
         if image_base64:
-            client = self.vision_client
-            model_to_use = self.vision_model
             # 构造多模态消息
             content_payload = [
                 {"type": "text", "text": user_input_template},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                {"type": "image_url", "image_url": {"url": f"data:{image_mime};base64,{image_base64}"}}
             ]
             messages.append({"role": "user", "content": content_payload})
-        else:
-            client = self.text_client
-            model_to_use = self.text_model
-            messages.append({"role": "user", "content": user_input_template})
+            return self.vision_model, messages
+        messages.append({"role": "user", "content": user_input_template})
+        return self.text_model, messages
+
+    def generate_response(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]] = None,
+        image_base64: Optional[str] = None,
+        image_mime: str = "image/jpeg",
+    ) -> str:
+        """生成回答：支持思维链 + 多模态"""
+        model_to_use, messages = self._generation_messages(query, context, chat_history, image_base64, image_mime)
+        client = self.vision_client if image_base64 else self.text_client
 
         try:
             response = client.chat.completions.create(
@@ -284,25 +357,121 @@ class RAGAgent:
             )
             return response.choices[0].message.content
         except Exception as e:
-            error_msg = str(e)
-            print(f"❌ 模型调用出错 ({model_to_use}): {error_msg}")
-            # 降级保护：如果 vision 模型挂了，尝试用 text 模型回复文字部分
-            if image_base64 and "text" in str(model_to_use): 
-                 return f"视觉模型调用失败: {error_msg}。"
-            return f"生成回答时出错: {error_msg}"
+            return self._generation_error(e, model_to_use, image_base64)
+
+    def generate_response_stream(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]] = None,
+        image_base64: Optional[str] = None,
+        image_mime: str = "image/jpeg",
+    ) -> Iterator[str]:
+        """generate_response 的流式版本：模型每返回一段增量文本就立即 yield"""
+        model_to_use, messages = self._generation_messages(query, context, chat_history, image_base64, image_mime)
+        client = self.vision_client if image_base64 else self.text_client
+        produced = False
+        try:
+            stream = client.chat.completions.create(
+                model=model_to_use,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000,
+                stream=True,
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    produced = True
+                    yield delta
+        except Exception as e:
+            error_msg = self._generation_error(e, model_to_use, image_base64)
+            yield f"\n\n{error_msg}" if produced else error_msg
+
+    @staticmethod
+    def _generation_error(e: Exception, model_to_use: str, image_base64: Optional[str]) -> str:
+        error_msg = str(e)
+        print(f"❌ 模型调用出错 ({model_to_use}): {error_msg}")
+        # 降级保护：如果 vision 模型挂了，尝试用 text 模型回复文字部分
+        if image_base64 and "text" in str(model_to_use): 
+             return f"视觉模型调用失败: {error_msg}。"
+        return f"生成回答时出错: {error_msg}"
+
+    def _answer_cache_usable(self, query: str) -> bool:
+        if not ANSWER_CACHE_ENABLED:
+            return False
+        if len(normalize_text(query)) < ANSWER_CACHE_MIN_QUERY_CHARS:
+            return False
+        # 集合与当前 Embedding 模型不一致时交给检索环节报错
+        return self.vector_store.collection_model == self.vector_store.embedder.name
+
+    def _answer_cache_lookup(self, embedding: List[float]) -> Optional[Dict]:
+        hit = get_answer_cache(self.vector_store.collection_name).lookup(
+            embedding,
+            version=theme_versions.get(self.vector_store.collection_name),
+            model=self.vector_store.embedder.name,
+        )
+        if hit:
+            print(f"⚡ [AnswerCache] 命中缓存 (相似度 {hit['similarity']:.3f}): '{hit['query']}'")
+        return hit
+
+    def _answer_cache_put(self, query: str, embedding: List[float], answer: str, sources: List[Dict]) -> None:
+        get_answer_cache(self.vector_store.collection_name).put(
+            query,
+            embedding,
+            answer,
+            sources,
+            version=theme_versions.get(self.vector_store.collection_name),
+            model=self.vector_store.embedder.name,
+        )
+
+    def _should_cache_answer(self, query: str, answer: str, sources: List[Dict]) -> bool:
+        if not sources or not self._answer_cache_usable(query):
+            return False
+        # 流式输出中途出错时，错误提示追加在已生成的内容之后
+        return not any(marker in answer for marker in ("生成回答时出错", "视觉模型调用失败"))
+
+    def lookup_cached_answer(self, query: str) -> Optional[Dict]:
+        """
+        语义答案缓存：当前主题下有足够相似的问题时返回 {query, answer, sources, similarity}，否则返回 None。
+        query 应是独立完整的问题 (带图片的提问不应走缓存)。
+        """
+        if not self._answer_cache_usable(query):
+            return None
+        try:
+            return self._answer_cache_lookup(self.vector_store.get_embedding(query))
+        except Exception as e:
+            print(f"⚠️ [AnswerCache] 查询失败: {e}")
+            return None
+
+    def cache_answer(self, query: str, answer: str, sources: List[Dict]) -> None:
+        """把生成成功的回答写入当前主题的语义答案缓存"""
+        if not self._should_cache_answer(query, answer, sources):
+            return
+        try:
+            self._answer_cache_put(query, self.vector_store.get_embedding(query), answer, sources)
+        except Exception as e:
+            print(f"⚠️ [AnswerCache] 写入失败: {e}")
 
     def answer_question(
         self, query: str, chat_history: Optional[List[Dict]] = None, top_k: int = TOP_K
     ) -> str:
         """回答问题主入口"""
         
-        # 1. 意图重写 (Query Rewrite)
-        search_query = query
-        if chat_history:
-            search_query = self.rewrite_query(query, chat_history)
+        # 没有上下文的问题本身语义完整，先查语义答案缓存，命中则无需检索
+        if not chat_history:
+            cached = self.lookup_cached_answer(query)
+            if cached:
+                return cached["answer"]
 
-        # 2. 检索 (包含 Rerank)
-        context, retrieved_docs = self.retrieve_context(search_query, top_k=top_k)
+        # 1. 意图重写 (Query Rewrite) + 2. 检索 (包含 Rerank)，两者并行
+        search_query, context, retrieved_docs = self.retrieve_with_rewrite(query, chat_history, top_k=top_k)
+
+        # 追问要等重写成独立完整的问题后才能查缓存
+        if chat_history:
+            cached = self.lookup_cached_answer(search_query)
+            if cached:
+                return cached["answer"]
 
         # 兜底策略
         if not context:
@@ -310,6 +479,7 @@ class RAGAgent:
 
         # 3. 生成回答
         answer = self.generate_response(query, context, chat_history)
+        self.cache_answer(search_query, answer, retrieved_docs)
 
         return answer
 
@@ -358,5 +528,196 @@ class RAGAgent:
 
         print(f"🔄 [Agent] 正在切换知识库: {self.current_theme} -> {theme_name}")
         self.current_theme = theme_name
-        # 重新实例化 VectorStore，指向新的 Collection
-        self.vector_store = VectorStore(collection_name=theme_name)
\ No newline at end of file
+        # 从进程内注册表取该主题已打开的 VectorStore (首次使用时才连接集合)
+        self.vector_store = get_vector_store(theme_name)
+
+    # ==========================================
+    # 异步接口 (Chainlit 中直接 await)
+    # LLM / Embedding 请求走 AsyncOpenAI，Chroma 与 SQLite 访问在有界的存储线程池中执行，
+    # 并发量只受上游 API 限制，不再为每个请求占用一个工作线程
+    # ==========================================
+    async def aunderstand_image(self, image_base64: str, image_mime: str = "image/jpeg") -> str:
+        """understand_image 的异步版本"""
+        print("📸 [Agent] 正在进行深度视觉理解与描述...")
+        try:
+            response = await self.async_vision_client.chat.completions.create(
+                model=self.vision_model,
+                messages=self._vision_messages(image_base64, image_mime),
+                max_tokens=1000
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            print(f"❌ 视觉分析失败: {e}")
+            return ""
+
+    async def arewrite_query(self, query: str, chat_history: List[Dict]) -> str:
+        """rewrite_query 的异步版本"""
+        if not chat_history:
+            return query
+        try:
+            response = await self.async_text_client.chat.completions.create(
+                model=self.text_model,
+                messages=[{"role": "user", "content": self._rewrite_prompt(query, chat_history)}],
+                temperature=0.1
+            )
+            new_query = response.choices[0].message.content.strip()
+            print(f"🔄 [Agent] 问题重写: '{query}' -> '{new_query}'")
+            return new_query
+        except Exception as e:
+            print(f"⚠️ 重写失败: {e}")
+            return query
+
+    async def _aretrieve_candidates(self, query: str, initial_k: int) -> List[Dict]:
+        """_retrieve_candidates 的异步版本，向量与词法两路检索并发进行"""
+        if not HYBRID_SEARCH:
+            return await self.vector_store.asearch(query, top_k=initial_k)
+        results, lexical_results = await asyncio.gather(
+            self.vector_store.asearch(query, top_k=initial_k),
+            self.vector_store.alexical_search(query, top_k=initial_k),
+        )
+        return reciprocal_rank_fusion([results, lexical_results])[:initial_k]
+
+    async def aretrieve_context(self, query: str, top_k: int = TOP_K) -> Tuple[str, List[Dict]]:
+        """retrieve_context 的异步版本"""
+        initial_results = await self._aretrieve_candidates(query, top_k * 2)
+        final_results = await self.reranker.arerank(query, initial_results, top_k)
+        return self._format_context(final_results), final_results
+
+    async def aretrieve_with_rewrite(
+        self, query: str, chat_history: Optional[List[Dict]], top_k: int = TOP_K
+    ) -> Tuple[str, str, List[Dict]]:
+        """
+        retrieve_with_rewrite 的异步版本。重写与预检索是两个 asyncio 任务：
+        重写超时、预检索不再需要、或调用方本身被取消时，未完成的任务会被真正取消 (连同其 HTTP 请求)。
+        """
+        if not chat_history:
+            context, results = await self.aretrieve_context(query, top_k=top_k)
+            return query, context, results
+        if not SPECULATIVE_RETRIEVAL:
+            search_query = await self.arewrite_query(query, chat_history)
+            context, results = await self.aretrieve_context(search_query, top_k=top_k)
+            return search_query, context, results
+
+        initial_k = top_k * 2
+        rewrite_task = asyncio.create_task(self.arewrite_query(query, chat_history))
+        speculative_task = asyncio.create_task(self._aretrieve_candidates(query, initial_k))
+        try:
+            try:
+                # 超时后 wait_for 会取消重写任务
+                search_query = await asyncio.wait_for(rewrite_task, timeout=REWRITE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"⏱️ [Agent] 问题重写超过 {REWRITE_TIMEOUT}s，使用原问题继续")
+                search_query = query
+
+            if _queries_close(query, search_query):
+                print("⚡ [Agent] 重写后的问题与原问题一致，复用预检索结果")
+                candidates = await speculative_task
+            else:
+                speculative_done = speculative_task.done() and not speculative_task.cancelled()
+                if not speculative_done:
+                    speculative_task.cancel()
+                candidates = await self._aretrieve_candidates(search_query, initial_k)
+                if speculative_done and speculative_task.exception() is None:
+                    candidates = reciprocal_rank_fusion([candidates, speculative_task.result()])[:initial_k]
+        finally:
+            for task in (rewrite_task, speculative_task):
+                if not task.done():
+                    task.cancel()
+
+        final_results = await self.reranker.arerank(search_query, candidates, top_k)
+        return search_query, self._format_context(final_results), final_results
+
+    async def agenerate_response(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]] = None,
+        image_base64: Optional[str] = None,
+        image_mime: str = "image/jpeg",
+    ) -> str:
+        """generate_response 的异步版本"""
+        model_to_use, messages = self._generation_messages(query, context, chat_history, image_base64, image_mime)
+        client = self.async_vision_client if image_base64 else self.async_text_client
+        try:
+            response = await client.chat.completions.create(
+                model=model_to_use,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            return self._generation_error(e, model_to_use, image_base64)
+
+    async def agenerate_response_stream(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]] = None,
+        image_base64: Optional[str] = None,
+        image_mime: str = "image/jpeg",
+    ) -> AsyncIterator[str]:
+        """generate_response_stream 的异步版本，增量文本到达即 yield"""
+        model_to_use, messages = self._generation_messages(query, context, chat_history, image_base64, image_mime)
+        client = self.async_vision_client if image_base64 else self.async_text_client
+        produced = False
+        try:
+            stream = await client.chat.completions.create(
+                model=model_to_use,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000,
+                stream=True,
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    produced = True
+                    yield delta
+        except Exception as e:
+            error_msg = self._generation_error(e, model_to_use, image_base64)
+            yield f"\n\n{error_msg}" if produced else error_msg
+
+    async def alookup_cached_answer(self, query: str) -> Optional[Dict]:
+        """lookup_cached_answer 的异步版本"""
+        if not self._answer_cache_usable(query):
+            return None
+        try:
+            embedding = await self.vector_store.aget_embedding(query)
+            return await run_storage(self._answer_cache_lookup, embedding)
+        except Exception as e:
+            print(f"⚠️ [AnswerCache] 查询失败: {e}")
+            return None
+
+    async def acache_answer(self, query: str, answer: str, sources: List[Dict]) -> None:
+        """cache_answer 的异步版本"""
+        if not self._should_cache_answer(query, answer, sources):
+            return
+        try:
+            embedding = await self.vector_store.aget_embedding(query)
+            await run_storage(self._answer_cache_put, query, embedding, answer, sources)
+        except Exception as e:
+            print(f"⚠️ [AnswerCache] 写入失败: {e}")
+
+    async def aanswer_question(
+        self, query: str, chat_history: Optional[List[Dict]] = None, top_k: int = TOP_K
+    ) -> str:
+        """answer_question 的异步版本"""
+        if not chat_history:
+            cached = await self.alookup_cached_answer(query)
+            if cached:
+                return cached["answer"]
+
+        search_query, context, retrieved_docs = await self.aretrieve_with_rewrite(query, chat_history, top_k=top_k)
+
+        if chat_history:
+            cached = await self.alookup_cached_answer(search_query)
+            if cached:
+                return cached["answer"]
+
+        if not context:
+            context = "（未检索到特别相关的课程材料，请根据通用知识谨慎回答，并告知学生资料库中无此内容）"
+
+        answer = await self.agenerate_response(query, context, chat_history)
+        await self.acache_answer(search_query, answer, retrieved_docs)
+        return answer
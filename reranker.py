@@ -0,0 +1,214 @@
+# reranker.py
+import asyncio
+import re
+import time
+import threading
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from config import (
+    RERANKER,
+    RERANK_LEXICAL_WEIGHT,
+    CROSS_ENCODER_MODEL,
+    CROSS_ENCODER_BATCH_SIZE,
+    CROSS_ENCODER_MAX_LENGTH,
+)
+from lexical_index import bm25_scores
+
+
+def _minmax(scores: np.ndarray) -> np.ndarray:
+    span = scores.max() - scores.min() if len(scores) else 0
+    if span <= 0:
+        return np.zeros_like(scores, dtype=np.float32)
+    return (scores - scores.min()) / span
+
+
+def _retrieval_prior(results: List[Dict]) -> np.ndarray:
+    """候选在初筛阶段的相关度，归一化到 [0, 1] (越大越相关)"""
+    if all("rrf_score" in res for res in results):
+        # 混合检索 / 预检索合并后的 RRF 融合分
+        return _minmax(np.array([res["rrf_score"] for res in results], dtype=np.float32))
+    if all("score" in res for res in results):
+        # 纯向量检索的 score 是距离，越小越相关
+        return _minmax(-np.array([res["score"] for res in results], dtype=np.float32))
+    # 没有分数时按名次换算成 (0, 1] 的分数
+    return 1.0 / (1.0 + np.arange(len(results), dtype=np.float32))
+
+
+class Reranker:
+    """
+    检索结果重排序接口：从初筛的候选 (按向量相似度排序) 中选出最相关的 top_k 条。
+    RAGAgent.rerank_results 只通过这里调用，具体实现由 config.RERANKER 决定。
+    """
+
+    name: str = ""
+
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        raise NotImplementedError
+
+    async def _arerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        """异步实现，默认在线程中执行 rerank (本地计算不阻塞事件循环)"""
+        return await asyncio.to_thread(self.rerank, query, results, top_k)
+
+    def _log(self, start: float, n_in: int, n_out: int) -> None:
+        print(f"⚖️ [Rerank] {self.name}: {n_in} -> {n_out} 条，耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def __call__(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        if not results:
+            return []
+        start = time.perf_counter()
+        final_results = self.rerank(query, results, top_k)
+        self._log(start, len(results), len(final_results))
+        return final_results
+
+    async def arerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        if not results:
+            return []
+        start = time.perf_counter()
+        final_results = await self._arerank(query, results, top_k)
+        self._log(start, len(results), len(final_results))
+        return final_results
+
+
+class LLMReranker(Reranker):
+    """原有方案：让大模型从候选中挑出最相关片段的 ID (每次查询多一轮 LLM 调用)"""
+
+    name = "llm"
+
+    def __init__(self, client, model: str, async_client=None):
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+
+    @staticmethod
+    def _prompt(query: str, results: List[Dict], top_k: int) -> str:
+        # 构造给 LLM 看的候选列表 (只截取前200字节省Token)
+        candidates_str = ""
+        for i, res in enumerate(results):
+            candidates_str += f"[ID:{i}] 内容: {res['content'][:200]}...\n\n"
+
+        return f"""
+请针对问题：“{query}”
+从以下候选片段中，选出最能回答该问题的 {top_k} 个片段的ID。
+要求：只输出ID列表，格式如 [0, 2, 5]。不要输出其他文字。
+
+{candidates_str}
+"""
+
+    @staticmethod
+    def _select(content: str, results: List[Dict], top_k: int) -> List[Dict]:
+        # 提取数字 ID
+        selected_ids = [int(d) for d in re.findall(r'\d+', content)]
+
+        # 根据 ID 获取对应的文档
+        final_results = [results[i] for i in selected_ids if i < len(results)]
+
+        # 兜底：如果筛选结果为空，回退到默认前K个
+        if not final_results:
+            return results[:top_k]
+
+        return final_results
+
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": self._prompt(query, results, top_k)}],
+                temperature=0
+            )
+            return self._select(response.choices[0].message.content, results, top_k)
+        except Exception as e:
+            print(f"⚠️ 重排序失败，使用默认排序: {e}")
+            return results[:top_k]
+
+    async def _arerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        if self.async_client is None:
+            return await super()._arerank(query, results, top_k)
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": self._prompt(query, results, top_k)}],
+                temperature=0
+            )
+            return self._select(response.choices[0].message.content, results, top_k)
+        except Exception as e:
+            print(f"⚠️ 重排序失败，使用默认排序: {e}")
+            return results[:top_k]
+
+
+class BM25Reranker(Reranker):
+    """
+    本地词法重排序：候选全文的 BM25 分数与初筛分数按权重融合，毫秒级完成。
+    初筛分数优先取 RRF 融合分 (混合检索)，否则取向量距离，不再按名次估算，
+    以免混合检索时候选顺序中已包含的词法信号被重复计算。
+    对课程术语、缩写、函数名这类精确匹配比纯向量检索更敏感。
+    """
+
+    name = "bm25"
+
+    def __init__(self, lexical_weight: float = RERANK_LEXICAL_WEIGHT):
+        self.lexical_weight = lexical_weight
+
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        lexical = _minmax(bm25_scores(query, [res["content"] for res in results]))
+        prior = _retrieval_prior(results)
+        combined = self.lexical_weight * lexical + (1 - self.lexical_weight) * prior
+        order = np.argsort(-combined, kind="stable")[:top_k]
+        return [results[i] for i in order]
+
+
+class CrossEncoderReranker(Reranker):
+    """本地 CPU 上的 cross-encoder 模型 (如 bge-reranker)，逐对打分，批量推理"""
+
+    name = "cross_encoder"
+
+    def __init__(
+        self,
+        model_name: str = CROSS_ENCODER_MODEL,
+        batch_size: int = CROSS_ENCODER_BATCH_SIZE,
+        max_length: int = CROSS_ENCODER_MAX_LENGTH,
+    ):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("cross-encoder 重排序需要安装 sentence-transformers: pip install sentence-transformers") from e
+
+        print(f"🧮 [Rerank] 正在加载本地重排序模型: {model_name}")
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        scores = self.model.predict(
+            [(query, res["content"]) for res in results],
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [results[i] for i in order]
+
+
+_local_rerankers: Dict[str, Reranker] = {}
+_local_rerankers_lock = threading.Lock()
+
+
+def get_reranker(name: str = RERANKER, llm_client=None, llm_model: Optional[str] = None, llm_async_client=None) -> Reranker:
+    """
+    按名称返回重排序器："bm25" (默认) / "cross_encoder" / "llm"。
+    本地模型在进程内只加载一次；"llm" 使用调用方传入的客户端 (及可选的异步客户端) 与模型。
+    """
+    if name == "llm":
+        if llm_client is None or not llm_model:
+            raise ValueError("LLM 重排序需要提供 llm_client 与 llm_model")
+        return LLMReranker(llm_client, llm_model, async_client=llm_async_client)
+
+    with _local_rerankers_lock:
+        if name not in _local_rerankers:
+            if name == "bm25":
+                _local_rerankers[name] = BM25Reranker()
+            elif name == "cross_encoder":
+                _local_rerankers[name] = CrossEncoderReranker()
+            else:
+                raise ValueError(f"未知的 RERANKER: {name} (可选 bm25 / cross_encoder / llm)")
+        return _local_rerankers[name]
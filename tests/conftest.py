@@ -0,0 +1,11 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 各模块的状态目录 (ingest_state/、chat/ 等) 都是相对当前目录的路径，
+# 在临时目录中运行测试，不污染仓库
+os.chdir(tempfile.mkdtemp(prefix="rag-tests-"))
@@ -0,0 +1,62 @@
+# tests/test_answer_cache.py
+import pytest
+
+from answer_cache import SemanticAnswerCache
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "answers.sqlite3")
+
+
+def _cache(db_path, **kwargs) -> SemanticAnswerCache:
+    kwargs.setdefault("threshold", 0.95)
+    kwargs.setdefault("max_entries", 10)
+    return SemanticAnswerCache("T", db_path=db_path, **kwargs)
+
+
+def test_hit_above_threshold_only(db_path):
+    cache = _cache(db_path)
+    cache.put("什么是进程", [1.0, 0.0, 0.0], "进程是…", [{"filename": "a.pdf"}], version=1, model="m")
+
+    hit = cache.lookup([0.99, 0.05, 0.0], version=1, model="m")
+    assert hit["answer"] == "进程是…"
+    assert hit["sources"] == [{"filename": "a.pdf"}]
+    assert hit["similarity"] >= 0.95
+    assert cache.lookup([0.7, 0.7, 0.0], version=1, model="m") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_new_theme_version_or_model_invalidates(db_path):
+    cache = _cache(db_path)
+    cache.put("q", [1.0, 0.0], "a", [], version=1, model="m")
+    assert cache.lookup([1.0, 0.0], version=1, model="other") is None
+    assert cache.lookup([1.0, 0.0], version=2, model="m") is None
+    # 旧版本条目已被清除，回到旧版本也不会再命中
+    assert cache.lookup([1.0, 0.0], version=1, model="m") is None
+
+
+def test_persists_across_instances(db_path):
+    _cache(db_path).put("q", [0.0, 1.0], "a", [], version=3, model="m")
+    assert _cache(db_path).lookup([0.0, 1.0], version=3, model="m")["answer"] == "a"
+
+
+def test_evicts_least_recently_used(db_path):
+    cache = _cache(db_path, max_entries=2)
+    cache.put("a", [1.0, 0.0, 0.0], "A", [], version=1, model="m")
+    cache.put("b", [0.0, 1.0, 0.0], "B", [], version=1, model="m")
+    assert cache.lookup([1.0, 0.0, 0.0], version=1, model="m")["answer"] == "A"
+    cache.put("c", [0.0, 0.0, 1.0], "C", [], version=1, model="m")
+
+    assert cache.lookup([0.0, 1.0, 0.0], version=1, model="m") is None
+    assert cache.lookup([1.0, 0.0, 0.0], version=1, model="m")["answer"] == "A"
+    assert cache.lookup([0.0, 0.0, 1.0], version=1, model="m")["answer"] == "C"
+
+
+def test_empty_inputs_are_ignored(db_path):
+    cache = _cache(db_path)
+    cache.put("q", [], "a", [], version=1, model="m")
+    cache.put("q", [1.0], "", [], version=1, model="m")
+    assert cache.lookup([], version=1, model="m") is None
+    assert cache.lookup([1.0], version=1, model="m") is None
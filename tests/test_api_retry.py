@@ -0,0 +1,67 @@
+# tests/test_api_retry.py
+import time
+
+import pytest
+
+from api_retry import RateLimiter, call_with_backoff, is_retryable
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def _flaky(errors):
+    calls = []
+
+    def func(value):
+        calls.append(value)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return value * 2
+
+    return func, calls
+
+
+def test_is_retryable():
+    assert is_retryable(_StatusError(429))
+    assert is_retryable(_StatusError(503))
+    assert not is_retryable(_StatusError(400))
+    assert not is_retryable(ValueError("bad input"))
+
+
+def test_retries_rate_limit_errors_until_success():
+    func, calls = _flaky([_StatusError(429), _StatusError(500)])
+    assert call_with_backoff(func, 21, max_retries=3, base_delay=0) == 42
+    assert calls == [21, 21, 21]
+
+
+def test_gives_up_after_max_retries():
+    func, calls = _flaky([_StatusError(429)] * 5)
+    with pytest.raises(_StatusError):
+        call_with_backoff(func, 1, max_retries=2, base_delay=0)
+    assert len(calls) == 3
+
+
+def test_does_not_retry_client_errors():
+    func, calls = _flaky([_StatusError(400)])
+    with pytest.raises(_StatusError):
+        call_with_backoff(func, 1, max_retries=5, base_delay=0)
+    assert len(calls) == 1
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rpm=1200)  # 每 50ms 一次
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.14
+
+
+def test_rate_limiter_disabled():
+    limiter = RateLimiter(rpm=0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.05
@@ -0,0 +1,39 @@
+# tests/test_caption_cache.py
+from caption_cache import CaptionCache, image_file_hash
+
+
+def test_key_includes_model_and_prompt_version(tmp_path):
+    cache = CaptionCache(db_path=str(tmp_path / "captions.sqlite3"))
+    cache.put("h", "vl-max", "v1", "一张流程图")
+
+    assert cache.get("h", "vl-max", "v1") == "一张流程图"
+    assert cache.get("h", "vl-max", "v2") is None
+    assert cache.get("h", "vl-plus", "v1") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    cache.close()
+
+
+def test_empty_caption_is_not_cached(tmp_path):
+    cache = CaptionCache(db_path=str(tmp_path / "captions.sqlite3"))
+    cache.put("h", "vl-max", "v1", "")
+    assert cache.get("h", "vl-max", "v1") is None
+    cache.close()
+
+
+def test_persists_across_instances(tmp_path):
+    db_path = str(tmp_path / "captions.sqlite3")
+    cache = CaptionCache(db_path=db_path)
+    cache.put("h", "vl-max", "v1", "描述")
+    cache.close()
+    assert CaptionCache(db_path=db_path).get("h", "vl-max", "v1") == "描述"
+
+
+def test_image_file_hash_depends_on_content(tmp_path):
+    first = tmp_path / "a.png"
+    second = tmp_path / "b.png"
+    first.write_bytes(b"same")
+    second.write_bytes(b"same")
+    assert image_file_hash(str(first)) == image_file_hash(str(second))
+    second.write_bytes(b"different")
+    assert image_file_hash(str(first)) != image_file_hash(str(second))
@@ -0,0 +1,56 @@
+# tests/test_captioner.py
+from caption_cache import CaptionCache
+from captioner import CaptionRetryList, ImageCaptioner, ImageCaptionStage
+from manifest import file_hash
+
+
+def _image_chunk(source, chunk_id: str) -> dict:
+    return {
+        "filepath": str(source),
+        "file_hash": file_hash(str(source)),
+        "filename": source.name,
+        "chunk_id": chunk_id,
+        "page_number": 1,
+        "image_path": "",
+    }
+
+
+def test_captioner_returns_failures_separately():
+    def caption(chunk):
+        if chunk["n"] == 1:
+            raise ValueError("bad image")
+        return f"caption {chunk['n']}"
+
+    succeeded, failed = ImageCaptioner(caption, concurrency=2, rpm=0, max_retries=0).run([{"n": i} for i in range(3)])
+    assert [(c["n"], text) for c, text in succeeded] == [(0, "caption 0"), (2, "caption 2")]
+    assert [c["n"] for c in failed] == [1]
+
+
+def test_retry_list_drops_entries_of_changed_files(tmp_path):
+    source = tmp_path / "a.pdf"
+    source.write_bytes(b"v1")
+    retry_list = CaptionRetryList("T", retry_dir=str(tmp_path / "retry"))
+    retry_list.save([_image_chunk(source, "img_0")])
+    assert len(retry_list.load()) == 1
+
+    source.write_bytes(b"v2")
+    assert retry_list.load() == []
+
+
+def test_close_keeps_failures_from_files_not_processed_this_run(tmp_path):
+    first = tmp_path / "a.pdf"
+    second = tmp_path / "b.pdf"
+    first.write_bytes(b"a")
+    second.write_bytes(b"b")
+    retry_list = CaptionRetryList("T", retry_dir=str(tmp_path / "retry"))
+    retry_list.save([_image_chunk(first, "img_0"), _image_chunk(second, "img_0")])
+
+    cache = CaptionCache(db_path=str(tmp_path / "captions.sqlite3"))
+    stage = ImageCaptionStage("T", triage=False, cache=cache)
+    stage.retry_list = retry_list
+    # 本次只处理了 b.pdf (图片文件不存在，直接跳过，视为已处理)
+    stage.process([_image_chunk(second, "img_0")])
+    stage.close()
+
+    assert [(c["filename"], c["chunk_id"]) for c in retry_list.load()] == [("a.pdf", "img_0")]
+    cache.close()
@@ -0,0 +1,161 @@
+# tests/test_chat_manager.py
+import json
+import os
+import threading
+
+import pytest
+
+import chat_manager
+from chat_manager import ChatLogWriter, ChatManager
+
+
+@pytest.fixture(autouse=True)
+def chat_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "chat")
+    monkeypatch.setattr(chat_manager, "CHAT_DIR", path)
+    monkeypatch.setattr(chat_manager, "COMPACT_EVERY", 3)
+    # 每个测试使用独立的写线程，序号等状态不跨测试共享
+    monkeypatch.setattr(chat_manager, "_writer", ChatLogWriter())
+    return path
+
+
+def _contents(messages):
+    return [m["content"] for m in messages]
+
+
+def _new_chat(name: str) -> ChatManager:
+    manager = ChatManager()
+    manager.create_new_chat(name)
+    return manager
+
+
+def test_append_then_load(chat_dir):
+    manager = _new_chat("A")
+    manager.append_message("user", "问题")
+    manager.append_message("assistant", "回答")
+
+    messages = ChatManager().load_chat_by_filename("A.json")
+    assert [(m["role"], m["content"]) for m in messages] == [("user", "问题"), ("assistant", "回答")]
+    assert all("seq" not in m for m in messages)
+
+
+def test_compaction_folds_log_into_snapshot(chat_dir):
+    manager = _new_chat("A")
+    for i in range(7):
+        manager.append_message("user", str(i))
+    chat_manager._writer.flush("A.json")
+
+    with open(os.path.join(chat_dir, "A.json"), encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert snapshot["seq"] == 6
+    assert _contents(snapshot["messages"]) == [str(i) for i in range(6)]
+    with open(os.path.join(chat_dir, "A.jsonl"), encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert _contents(ChatManager().load_chat_by_filename("A.json")) == [str(i) for i in range(7)]
+
+
+def test_concurrent_tabs_do_not_lose_messages(chat_dir):
+    first = _new_chat("A")
+    second = ChatManager()
+    second.load_chat_by_filename("A.json")
+
+    def write(manager, tag):
+        for i in range(25):
+            manager.append_message("user", f"{tag}{i}")
+
+    threads = [threading.Thread(target=write, args=args) for args in ((first, "a"), (second, "b"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    contents = _contents(ChatManager().load_chat_by_filename("A.json"))
+    assert sorted(contents) == sorted([f"a{i}" for i in range(25)] + [f"b{i}" for i in range(25)])
+    assert [c for c in contents if c.startswith("a")] == [f"a{i}" for i in range(25)]
+
+
+def test_interrupted_compaction_does_not_duplicate(chat_dir):
+    manager = _new_chat("A")
+    for i in range(3):
+        manager.append_message("user", str(i))
+    chat_manager._writer.flush("A.json")
+    # 模拟快照已替换、但日志尚未删除时进程退出
+    with open(os.path.join(chat_dir, "A.jsonl"), "w", encoding="utf-8") as f:
+        for seq in range(1, 4):
+            f.write(json.dumps({"role": "user", "content": str(seq - 1), "seq": seq}) + "\n")
+
+    assert _contents(ChatManager().load_chat_by_filename("A.json")) == ["0", "1", "2"]
+
+
+def test_torn_last_line_is_skipped(chat_dir, monkeypatch):
+    manager = _new_chat("A")
+    manager.append_message("user", "0")
+    chat_manager._writer.flush("A.json")
+    with open(os.path.join(chat_dir, "A.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"role": "user", "cont')
+
+    # 进程重启后继续追加
+    monkeypatch.setattr(chat_manager, "_writer", ChatLogWriter())
+    manager.append_message("user", "1")
+    assert _contents(ChatManager().load_chat_by_filename("A.json")) == ["0", "1"]
+
+
+def test_legacy_snapshot_without_log(chat_dir):
+    os.makedirs(chat_dir, exist_ok=True)
+    legacy = {"id": "x", "name": "Old", "created_at": "2024-01-01T00:00:00", "messages": [{"role": "user", "content": "旧消息"}]}
+    with open(os.path.join(chat_dir, "Old.json"), "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+
+    manager = ChatManager()
+    assert _contents(manager.load_chat_by_filename("Old.json")) == ["旧消息"]
+    manager.append_message("assistant", "新消息")
+    assert _contents(ChatManager().load_chat_by_filename("Old.json")) == ["旧消息", "新消息"]
+
+
+def test_rename_and_delete(chat_dir):
+    manager = _new_chat("A")
+    manager.append_message("user", "0")
+    assert manager.rename_chat("B")
+    assert manager.current_filename == "B.json"
+    assert sorted(os.listdir(chat_dir)) == ["B.json"]
+    assert _contents(ChatManager().load_chat_by_filename("B.json")) == ["0"]
+
+    manager.append_message("user", "1")
+    assert manager.delete_chat("B.json")
+    assert not any(name.startswith("B.") for name in os.listdir(chat_dir))
+
+
+def test_list_chats_sees_appended_messages(chat_dir):
+    manager = _new_chat("A")
+    created = manager.list_chats()[0]["updated_at"]
+    manager.append_message("user", "0")
+    chat_manager._writer.flush("A.json")
+    assert [c["filename"] for c in manager.list_chats()] == ["A.json"]
+    assert manager.list_chats()[0]["updated_at"] >= created
+
+
+def test_flush_waits_only_for_the_target_chat(chat_dir, monkeypatch):
+    _new_chat("A").append_message("user", "warmup")
+    other = _new_chat("B")
+    chat_manager._writer.flush()
+
+    release = threading.Event()
+    original = ChatLogWriter._append
+
+    def blocked_append(self, filename, entry):
+        if filename == "A.json":
+            release.wait(5)
+        original(self, filename, entry)
+
+    monkeypatch.setattr(ChatLogWriter, "_append", blocked_append)
+    writer_a = ChatManager()
+    writer_a.load_chat_by_filename("A.json")
+    writer_a.append_message("user", "slow")
+
+    # A 的写入被阻塞时，读取 B 不需要等待
+    done = threading.Event()
+    threading.Thread(target=lambda: (other.load_chat_by_filename("B.json"), done.set()), daemon=True).start()
+    assert done.wait(1)
+
+    release.set()
+    assert _contents(ChatManager().load_chat_by_filename("A.json")) == ["warmup", "slow"]
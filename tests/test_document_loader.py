@@ -0,0 +1,168 @@
+# tests/test_document_loader.py
+import io
+import os
+import threading
+
+import fitz
+from PIL import Image
+
+import document_loader
+from document_loader import DocumentLoader, image_digest, merge_image_refs
+
+
+def _write_pdf(path, pages: int):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i + 1} of {path.stem}")
+    doc.save(str(path))
+    doc.close()
+
+
+def _write_pdf_with_image(path, pages: int):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 30, 30)).save(buffer, "PNG")
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"page {i + 1}")
+        page.insert_image(fitz.Rect(72, 100, 136, 164), stream=buffer.getvalue())
+    doc.save(str(path))
+    doc.close()
+
+
+def _jpeg(mode: str = "RGB") -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, (32, 32), (10, 20, 30, 40)[: len(mode)]).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _data_dir(tmp_path):
+    theme_dir = tmp_path / "data" / "OS"
+    (theme_dir / "sub").mkdir(parents=True)
+    (theme_dir / "b.txt").write_text("second", encoding="utf-8")
+    (theme_dir / "a.txt").write_text("first", encoding="utf-8")
+    (theme_dir / "sub" / "c.txt").write_text("third", encoding="utf-8")
+    (theme_dir / "skip.md").write_text("unsupported", encoding="utf-8")
+    _write_pdf(theme_dir / "big.pdf", 5)
+    return theme_dir
+
+
+def _image(filepath: str, image_path: str, page: int) -> dict:
+    return {"is_image": True, "filepath": filepath, "image_path": image_path, "page_number": page, "page_refs": [page]}
+
+
+def _summary(docs):
+    return [(d["filename"], d["page_number"], d["content"]) for d in docs]
+
+
+def test_list_files_is_sorted_and_filtered(tmp_path):
+    theme_dir = _data_dir(tmp_path)
+    loader = DocumentLoader(data_dir=str(tmp_path / "data"))
+    names = [p.replace(str(theme_dir), "") for p in loader.list_files(str(theme_dir))]
+    assert names == ["/a.txt", "/b.txt", "/big.pdf", "/sub/c.txt"]
+
+
+def test_large_pdf_is_split_into_page_ranges(tmp_path, monkeypatch):
+    theme_dir = _data_dir(tmp_path)
+    monkeypatch.setattr(document_loader, "PDF_PAGES_PER_TASK", 2)
+    loader = DocumentLoader(data_dir=str(tmp_path / "data"))
+    tasks = loader._build_tasks([str(theme_dir / "a.txt"), str(theme_dir / "big.pdf")])
+    assert [t[1] for t in tasks] == [None, (0, 2), (2, 4), (4, 6)]
+
+
+def test_parallel_load_matches_serial_order(tmp_path, monkeypatch):
+    theme_dir = _data_dir(tmp_path)
+    monkeypatch.setattr(document_loader, "PDF_PAGES_PER_TASK", 2)
+    loader = DocumentLoader(data_dir=str(tmp_path / "data"))
+
+    serial = loader.load_all_documents(specific_dir=str(theme_dir))
+    parallel = loader.load_all_documents(specific_dir=str(theme_dir), num_workers=3)
+    assert _summary(parallel) == _summary(serial)
+    assert [d["page_number"] for d in parallel if d["filename"] == "big.pdf"] == [1, 2, 3, 4, 5]
+
+
+def test_unreadable_file_yields_a_failure_marker(tmp_path, monkeypatch):
+    theme_dir = _data_dir(tmp_path)
+    (theme_dir / "broken.pdf").write_bytes(b"not a pdf")
+    monkeypatch.setattr(document_loader, "PDF_PAGES_PER_TASK", 2)
+    loader = DocumentLoader(data_dir=str(tmp_path / "data"))
+    file_paths = loader.list_files(str(theme_dir))
+
+    for num_workers in (1, 3):
+        loaded = dict(loader.iter_files(file_paths, "OS", num_workers=num_workers))
+        assert loaded[str(theme_dir / "broken.pdf")] is None
+        assert [d["page_number"] for d in loaded[str(theme_dir / "big.pdf")]] == [1, 2, 3, 4, 5]
+    # 一次性加载时跳过失败的文件
+    assert "broken.pdf" not in {d["filename"] for d in loader.load_all_documents(specific_dir=str(theme_dir))}
+
+
+def test_stop_event_ends_loading_early(tmp_path, monkeypatch):
+    theme_dir = _data_dir(tmp_path)
+    monkeypatch.setattr(document_loader, "PDF_PAGES_PER_TASK", 2)
+    loader = DocumentLoader(data_dir=str(tmp_path / "data"))
+    file_paths = loader.list_files(str(theme_dir))
+
+    for num_workers in (1, 3):
+        stop = threading.Event()
+        files = loader.iter_files(file_paths, "OS", num_workers=num_workers, stop_event=stop)
+        assert next(files)[0] == file_paths[0]
+        stop.set()
+        assert list(files) == []
+
+
+def test_image_digest_is_content_addressed():
+    assert image_digest(b"abc") == image_digest(b"abc")
+    assert image_digest(b"abc") != image_digest(b"abd")
+
+
+def test_repeated_pdf_image_becomes_one_chunk(tmp_path):
+    path = tmp_path / "slides.pdf"
+    _write_pdf_with_image(path, 3)
+    docs = DocumentLoader(data_dir=str(tmp_path)).load_document(str(path), theme="dedupe")
+
+    images = [d for d in docs if d.get("is_image")]
+    assert len(images) == 1
+    assert images[0]["page_refs"] == [1, 2, 3]
+    assert os.listdir(os.path.dirname(images[0]["image_path"])) == [os.path.basename(images[0]["image_path"])]
+    assert all(d["images"] == [images[0]["image_path"]] for d in docs if not d.get("is_image"))
+
+
+def test_web_safe_image_keeps_original_bytes():
+    loader = DocumentLoader()
+    data = _jpeg()
+    path = loader._save_image(data, "original", ext="jpeg")
+    assert path.endswith(".jpg")
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+    assert loader._save_image(data, "original", ext="jpeg") == path
+    assert loader.image_stats["saved"] == 1 and loader.image_stats["reused"] == 1
+    assert loader.image_stats["converted"] == 0
+
+
+def test_cmyk_and_unknown_formats_are_converted_to_png():
+    loader = DocumentLoader()
+    assert loader._save_image(_jpeg("CMYK"), "convert", ext="jpeg").endswith(".png")
+    assert loader._save_image(_jpeg(), "convert", ext="jbig2").endswith(".png")
+    assert loader.image_stats["converted"] == 2
+
+
+def test_reencode_mode_always_writes_png():
+    loader = DocumentLoader(keep_original_images=False)
+    path = loader._save_image(_jpeg(), "reencode", ext="jpeg")
+    assert path.endswith(".png")
+    assert Image.open(path).format == "PNG"
+
+
+def test_same_image_in_one_file_is_merged():
+    text = {"is_image": False, "filepath": "a.pdf", "content": "x"}
+    docs = [_image("a.pdf", "img/1.png", 1), text, _image("a.pdf", "img/1.png", 41), _image("a.pdf", "img/1.png", 1)]
+
+    merged = merge_image_refs(docs)
+    assert merged == [docs[0], text]
+    assert merged[0]["page_refs"] == [1, 41]
+
+
+def test_same_image_in_different_files_is_kept():
+    docs = [_image("a.pdf", "img/1.png", 1), _image("b.pdf", "img/1.png", 3)]
+    assert len(merge_image_refs(docs)) == 2
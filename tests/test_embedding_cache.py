@@ -0,0 +1,43 @@
+# tests/test_embedding_cache.py
+import pytest
+
+from embedding_cache import EmbeddingCache, normalize_text, text_hash
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(db_path=str(tmp_path / "embeddings.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_normalized_text_shares_a_key():
+    assert normalize_text("  进程  调度\n算法 ") == "进程 调度 算法"
+    assert text_hash("a  b\n") == text_hash("a b")
+    assert text_hash("a b") != text_hash("a c")
+
+
+def test_get_many_preserves_order_and_misses(cache):
+    cache.put_many(["a", "c"], [[1.0, 2.0], [3.0, 4.0]], "m1")
+    assert cache.get_many(["c", "b", "a", "c"], "m1") == [[3.0, 4.0], None, [1.0, 2.0], [3.0, 4.0]]
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_model_is_part_of_the_key(cache):
+    cache.put("a", [0.5], "m1")
+    assert cache.get("a", "m2") is None
+    assert cache.get(" a ", "m1") == [0.5]
+
+
+def test_empty_vectors_are_not_cached(cache):
+    cache.put_many(["a", "b"], [[], [1.0]], "m1")
+    assert cache.get_many(["a", "b"], "m1") == [None, [1.0]]
+
+
+def test_persists_across_instances(tmp_path):
+    db_path = str(tmp_path / "embeddings.sqlite3")
+    first = EmbeddingCache(db_path=db_path)
+    first.put("a", [0.25, -1.5], "m1")
+    first.close()
+    assert EmbeddingCache(db_path=db_path).get("a", "m1") == [0.25, -1.5]
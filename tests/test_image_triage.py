@@ -0,0 +1,64 @@
+# tests/test_image_triage.py
+import random
+
+from PIL import Image
+
+from image_triage import ImageTriage, image_metrics
+
+TRIAGE = ImageTriage(min_edge=48, max_aspect=8.0, min_bytes=4096, min_entropy=3.0, min_stddev=6.0)
+
+
+def _metrics(width=400, height=300, size=50_000, entropy=6.0, stddev=40.0) -> dict:
+    return {"width": width, "height": height, "bytes": size, "entropy": entropy, "stddev": stddev}
+
+
+def _noise_image(path, width=200, height=150) -> str:
+    rng = random.Random(0)
+    image = Image.new("RGB", (width, height))
+    image.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(width * height)])
+    image.save(path)
+    return str(path)
+
+
+def test_content_image_is_kept():
+    assert TRIAGE.classify(_metrics()) == []
+
+
+def test_each_decorative_rule():
+    assert TRIAGE.classify(_metrics(width=32, height=32)) == ["too_small"]
+    assert TRIAGE.classify(_metrics(width=900, height=100)) == ["strip"]
+    assert TRIAGE.classify(_metrics(stddev=2.0)) == ["flat_color"]
+    assert TRIAGE.classify(_metrics(entropy=1.0, size=1000)) == ["low_information"]
+
+
+def test_low_entropy_alone_is_not_decorative():
+    # 简洁的线框图熵很低，但文件不小，应交给视觉模型
+    assert TRIAGE.classify(_metrics(entropy=1.0, size=20_000)) == []
+
+
+def test_boundaries_are_exclusive():
+    assert TRIAGE.classify(_metrics(width=48, height=48 * 8)) == []
+
+
+def test_split_on_real_images(tmp_path):
+    flat = tmp_path / "flat.png"
+    Image.new("RGB", (200, 150), (250, 250, 250)).save(flat)
+    photo = _noise_image(tmp_path / "photo.png")
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+
+    chunks = [{"image_path": str(flat), "page_number": 2}, {"image_path": photo}, {"image_path": str(broken)}]
+    keep, skipped = TRIAGE.split(chunks)
+
+    # 无法分析的图片不丢弃
+    assert [c["image_path"] for c in keep] == [photo, str(broken)]
+    assert skipped[0]["image_path"] == str(flat)
+    assert "flat_color" in skipped[0]["reasons"]
+    assert skipped[0]["page_refs"] == [2]
+
+
+def test_image_metrics(tmp_path):
+    metrics = image_metrics(_noise_image(tmp_path / "photo.png", width=300, height=100))
+    assert (metrics["width"], metrics["height"]) == (300, 100)
+    assert metrics["entropy"] > TRIAGE.min_entropy
+    assert metrics["stddev"] > TRIAGE.min_stddev
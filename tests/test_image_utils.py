@@ -0,0 +1,48 @@
+# tests/test_image_utils.py
+import base64
+import io
+
+from PIL import Image
+
+from image_utils import prepare_image
+
+
+def _png(width: int, height: int, mode: str = "RGB") -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), (10, 120, 200, 128) if mode == "RGBA" else (10, 120, 200)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _decode(data: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def test_small_image_is_sent_as_is():
+    raw = _png(100, 80)
+    data, mime = prepare_image(raw, max_edge=512, passthrough_bytes=1 << 20)
+    assert mime == "image/png"
+    assert base64.b64decode(data) == raw
+
+
+def test_large_image_is_downscaled_to_jpeg():
+    data, mime = prepare_image(_png(2000, 1000), max_edge=512, passthrough_bytes=1 << 20)
+    assert mime == "image/jpeg"
+    assert _decode(data).size == (512, 256)
+
+
+def test_transparent_image_stays_png():
+    data, mime = prepare_image(_png(2000, 1000, mode="RGBA"), max_edge=512)
+    assert mime == "image/png"
+    assert max(_decode(data).size) == 512
+
+
+def test_unreadable_data_is_passed_through():
+    data, mime = prepare_image(b"not an image")
+    assert base64.b64decode(data) == b"not an image"
+    assert mime == "image/jpeg"
+
+
+def test_reads_from_path(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(_png(10, 10))
+    assert prepare_image(str(path), max_edge=512)[1] == "image/png"
@@ -0,0 +1,198 @@
+# tests/test_ingest_pipeline.py
+import os
+import threading
+
+import pytest
+
+from ingest_pipeline import IngestPipeline
+from manifest import file_key
+
+
+class _NoCache:
+    @staticmethod
+    def stats():
+        return {"hits": 0, "misses": 0, "hit_rate": 0.0}
+
+
+class _FakeStore:
+    """只记录写入与删除的向量库替身：文件名包含 fail_on 的块写入失败，
+    limit 不为 None 时每次调用只写入前 limit 个块 (模拟写到一半中断)"""
+
+    def __init__(self, fail_on: str = None, limit: int = None):
+        self.fail_on = fail_on
+        self.limit = limit
+        self.written = []
+        self.failed = []
+        self.deleted = []
+        self.cleared = False
+        self.retry_pending = []
+        self.embedding_cache = _NoCache()
+
+    def add_documents(self, chunks, show_progress=True, on_batch=None):
+        failed = [c for c in chunks if self.fail_on and self.fail_on in c["filename"]]
+        written = [c for c in chunks if c not in failed]
+        if self.limit is not None:
+            failed, written = failed + written[self.limit :], written[: self.limit]
+        self.written.extend(written)
+        self.failed.extend(failed)
+        if on_batch and written:
+            on_batch(written)
+        return failed
+
+    def retry_failed_batches(self, on_batch=None, show_progress=False):
+        pending, self.retry_pending = self.retry_pending, []
+        return len(pending) - len(self.add_documents(pending, on_batch=on_batch))
+
+    def check_embedding_model(self):
+        pass
+
+    def delete_file(self, filepath):
+        self.deleted.append(filepath)
+
+    def clear_collection(self):
+        self.cleared = True
+
+
+def _theme_dir(tmp_path, names=("a.txt", "b.txt", "c.txt")):
+    theme_dir = tmp_path / tmp_path.name
+    theme_dir.mkdir()
+    for name in names:
+        (theme_dir / name).write_text(f"content of {name}", encoding="utf-8")
+    return theme_dir
+
+
+def _pipeline(theme_dir, store) -> IngestPipeline:
+    return IngestPipeline(theme_dir.name, str(theme_dir), vector_store=store, queue_size=1)
+
+
+def _run(theme_dir, store, **kwargs):
+    return _pipeline(theme_dir, store).run(text_only=True, **kwargs)
+
+
+def test_streams_every_file_and_skips_them_next_time(tmp_path):
+    theme_dir = _theme_dir(tmp_path)
+    store = _FakeStore()
+    stats = _run(theme_dir, store, incremental=False)
+    assert stats["files"] == 3
+    assert sorted({c["filename"] for c in store.written}) == ["a.txt", "b.txt", "c.txt"]
+
+    again = _FakeStore()
+    stats = _run(theme_dir, again)
+    assert stats["files"] == 0 and stats["skipped_files"] == 3
+    assert again.written == []
+
+
+def test_failed_file_is_retried_on_next_run(tmp_path):
+    theme_dir = _theme_dir(tmp_path)
+    stats = _run(theme_dir, _FakeStore(fail_on="b.txt"), incremental=False)
+    assert stats["files"] == 2 and stats["failed_files"] == 1
+
+    retry = _FakeStore()
+    stats = _run(theme_dir, retry)
+    assert stats["files"] == 1
+    assert {c["filename"] for c in retry.written} == {"b.txt"}
+
+
+def test_file_that_fails_to_load_is_retried_on_next_run(tmp_path):
+    theme_dir = _theme_dir(tmp_path)
+    pipeline = _pipeline(theme_dir, _FakeStore())
+    load_document = pipeline.loader.load_document
+
+    def flaky_load(file_path, theme="default", page_range=None):
+        if file_path.endswith("b.txt"):
+            raise OSError("文件被占用")
+        return load_document(file_path, theme=theme)
+
+    pipeline.loader.load_document = flaky_load
+    stats = pipeline.run(text_only=True, incremental=False)
+    assert stats["files"] == 2 and stats["failed_files"] == 1
+
+    retry = _FakeStore()
+    stats = _run(theme_dir, retry)
+    assert stats["files"] == 1
+    assert {c["filename"] for c in retry.written} == {"b.txt"}
+
+
+def test_failed_build_stops_the_loader_thread(tmp_path):
+    theme_dir = _theme_dir(tmp_path, names=[f"{i}.txt" for i in range(20)])
+    pipeline = _pipeline(theme_dir, _FakeStore())
+    loaded = []
+    load_document = pipeline.loader.load_document
+
+    def counting_load(file_path, theme="default", page_range=None):
+        loaded.append(file_path)
+        return load_document(file_path, theme=theme)
+
+    def broken_build(file_path, docs, plan, caption_stage):
+        raise RuntimeError("切分失败")
+
+    pipeline.loader.load_document = counting_load
+    pipeline._build_chunks = broken_build
+    threads = threading.active_count()
+    with pytest.raises(RuntimeError):
+        pipeline.run(text_only=True, incremental=False)
+
+    # 加载线程已退出，且没有继续加载剩余的文件
+    assert threading.active_count() == threads
+    assert len(loaded) < 20
+
+
+def test_changed_file_replaces_old_chunks(tmp_path):
+    theme_dir = _theme_dir(tmp_path)
+    _run(theme_dir, _FakeStore(), incremental=False)
+    (theme_dir / "a.txt").write_text("new content", encoding="utf-8")
+    os.remove(theme_dir / "c.txt")
+
+    store = _FakeStore()
+    stats = _run(theme_dir, store)
+    assert stats["files"] == 1
+    assert sorted(store.deleted) == [file_key(theme_dir / "a.txt"), file_key(theme_dir / "c.txt")]
+
+
+def test_file_list_limits_the_run_to_those_files(tmp_path):
+    theme_dir = _theme_dir(tmp_path)
+    _run(theme_dir, _FakeStore(), incremental=False)
+    (theme_dir / "a.txt").write_text("changed", encoding="utf-8")
+    (theme_dir / "d.txt").write_text("uploaded", encoding="utf-8")
+    (theme_dir / "e.md").write_text("unsupported", encoding="utf-8")
+    os.remove(theme_dir / "c.txt")
+
+    store = _FakeStore()
+    file_paths = [str(theme_dir / name) for name in ("d.txt", "e.md", "missing.txt")]
+    stats = _run(theme_dir, store, incremental=False, file_paths=file_paths)
+
+    assert stats["files"] == 1
+    assert {c["filename"] for c in store.written} == {"d.txt"}
+    # 指定文件时不清空主题、不扫描目录：a.txt 的变化与 c.txt 的删除留给下次全目录运行
+    assert not store.cleared
+    # 清单中没有记录的新文件也先按路径清理，避免与旧版本写入的数据重复
+    assert store.deleted == [file_key(theme_dir / "d.txt")]
+
+
+def test_interrupted_file_resumes_from_written_batches(tmp_path):
+    theme_dir = _theme_dir(tmp_path, names=())
+    (theme_dir / "long.txt").write_text("".join(f"第 {i} 句，用来凑够多个块的长度。\n" for i in range(300)), encoding="utf-8")
+
+    stats = _run(theme_dir, _FakeStore(limit=2), incremental=False)
+    assert stats["failed_files"] == 1
+
+    store = _FakeStore()
+    pipeline = _pipeline(theme_dir, store)
+    stats = pipeline.run(text_only=True)
+    assert stats["files"] == 1
+    assert pipeline.progress["chunks_resumed"] == 2
+    assert pipeline.progress["chunks_written"] == len(store.written)
+    assert pipeline.progress["phase"] == "done"
+
+
+def test_failed_batches_are_retried_before_the_file_pass(tmp_path):
+    theme_dir = _theme_dir(tmp_path, names=("a.txt",))
+    first = _FakeStore(fail_on="a.txt")
+    _run(theme_dir, first, incremental=False)
+
+    store = _FakeStore()
+    store.retry_pending = list(first.failed)
+    stats = _run(theme_dir, store)
+    # 重试列表中的块写入后记入断点，文件阶段不再重复 Embedding
+    assert stats["files"] == 1
+    assert len(store.written) == len(first.failed)
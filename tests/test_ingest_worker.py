@@ -0,0 +1,99 @@
+# tests/test_ingest_worker.py
+import json
+import threading
+
+import pytest
+
+import ingest_worker
+from ingest_worker import IngestJob, IngestWorker
+
+
+class _FakePipeline:
+    """记录调用的流水线替身：图片任务等待 gate，主题 "bad" 抛出异常"""
+
+    gate = threading.Event()
+    calls = []
+
+    def __init__(self, theme_name, **kwargs):
+        self.theme = theme_name
+
+    def run(self, incremental=True, text_only=False, image_only=False, **kwargs):
+        _FakePipeline.calls.append((self.theme, image_only))
+        if image_only:
+            assert _FakePipeline.gate.wait(5)
+        if self.theme == "bad":
+            raise ValueError("boom")
+        return {"files": 1}
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    _FakePipeline.gate = threading.Event()
+    _FakePipeline.calls = []
+    monkeypatch.setattr(ingest_worker, "IngestPipeline", _FakePipeline)
+    monkeypatch.setattr(ingest_worker, "get_vector_store", lambda theme, db_path=None: object())
+    monkeypatch.setattr(ingest_worker, "CaptionCache", lambda: object())
+    worker = IngestWorker(data_dir=str(tmp_path / "data"))
+    monkeypatch.setattr(worker, "_get_caption_agent", lambda theme: None)
+    return worker
+
+
+def test_text_lane_is_not_blocked_by_background_job(worker):
+    background = worker.submit("T", image_only=True)
+    text = worker.submit("T", text_only=True)
+
+    assert text.future.result(timeout=5) == {"files": 1}
+    assert text.status == "done"
+    assert background.status == "running"
+
+    _FakePipeline.gate.set()
+    assert background.future.result(timeout=5) == {"files": 1}
+    assert [j["status"] for j in worker.list_jobs("T")] == ["done", "done"]
+
+
+def test_failed_job_reports_its_error(worker):
+    job = worker.submit("bad", text_only=True)
+    with pytest.raises(ValueError):
+        job.future.result(timeout=5)
+    assert job.status == "failed"
+    assert worker.get_job(job.id).error == "boom"
+
+
+def test_every_job_gets_its_store_from_the_registry(worker, monkeypatch):
+    opened = []
+    monkeypatch.setattr(ingest_worker, "get_vector_store", lambda theme, db_path=None: opened.append(theme))
+    for _ in range(2):
+        worker.submit("T", text_only=True).future.result(timeout=5)
+    # 注册表淘汰主题后，下一个任务重新打开的实例与会话共用
+    assert opened == ["T", "T"]
+
+
+def _record(jobs_dir, job_id: str, status: str, incremental: bool):
+    data = {"id": job_id, "theme": "T", "status": status, "incremental": incremental, "submitted_at": job_id}
+    (jobs_dir / f"{job_id}.json").write_text(json.dumps(data), encoding="utf-8")
+
+
+def test_resume_forces_incremental_only_for_started_jobs(tmp_path, monkeypatch):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    _record(jobs_dir, "1-queued", "queued", False)
+    _record(jobs_dir, "2-running", "running", False)
+    _record(jobs_dir, "3-done", "done", False)
+
+    resumed = []
+    monkeypatch.setattr(IngestWorker, "_enqueue", lambda self, job: resumed.append(job))
+    worker = IngestWorker(data_dir=str(tmp_path / "data"), jobs_dir=str(jobs_dir))
+    worker._resume_jobs()
+
+    # 未开始的全量任务照常全量执行；已开始的中断前清空过旧数据，恢复时按增量继续
+    assert [(job.id, job.incremental, job.status, job.resumed) for job in resumed] == [
+        ("1-queued", False, "queued", True),
+        ("2-running", True, "queued", True),
+    ]
+    assert worker.get_status("3-done")["status"] == "done"
+
+
+def test_job_round_trips_through_its_record():
+    job = IngestJob("T", incremental=False, text_only=True, file_paths=["data/T/a.pdf"])
+    restored = IngestJob.from_dict(job.to_dict())
+    assert restored.to_dict() == job.to_dict()
@@ -0,0 +1,64 @@
+# tests/test_lexical_index.py
+import pytest
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical" / "T.sqlite3"))
+    index.add(
+        ["d1", "d2", "d3"],
+        ["银行家算法用于避免死锁", "进程调度算法", "页面置换 LRU"],
+        ["a.pdf", "a.pdf", "b.pdf"],
+    )
+    yield index
+    index.close()
+
+
+def test_search_ranks_by_bm25(index):
+    hits = index.search("银行家算法", top_k=3)
+    assert [doc_id for doc_id, _ in hits][:2] == ["d1", "d2"]
+    assert hits[0][1] > hits[1][1]
+    assert index.search("lru", top_k=3)[0][0] == "d3"
+    assert index.search("不存在的词", top_k=3) == []
+
+
+def test_add_overwrites_existing_documents(index):
+    index.add(["d1"], ["内存分段"], ["a.pdf"])
+    assert index.count() == 3
+    assert all(doc_id != "d1" for doc_id, _ in index.search("银行家", top_k=3))
+    assert index.search("分段", top_k=3)[0][0] == "d1"
+
+
+def test_delete_and_clear(index):
+    index.delete(["d1", "d3"])
+    assert index.count() == 1
+    assert index.search("lru", top_k=3) == []
+    index.clear()
+    assert index.count() == 0
+    assert index.search("进程", top_k=3) == []
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "T.sqlite3")
+    first = LexicalIndex(path)
+    first.add(["d1"], ["死锁"], ["a.pdf"])
+    first.close()
+    assert LexicalIndex(path).search("死锁", top_k=1)[0][0] == "d1"
+
+
+def test_rrf_merges_by_id_and_rewards_agreement():
+    vector = [{"id": "a", "content": "A", "score": 0.1}, {"id": "b", "content": "B", "score": 0.2}]
+    lexical = [{"id": "b", "content": "B", "score": 9.0}, {"id": "c", "content": "C", "score": 5.0}]
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+
+    assert [r["id"] for r in fused] == ["b", "a", "c"]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    # 保留首次出现时的字段
+    assert fused[0]["score"] == 0.2
+
+
+def test_rrf_without_ids_falls_back_to_content():
+    fused = reciprocal_rank_fusion([[{"content": "x"}], [{"content": "x"}, {"content": "y"}]])
+    assert [r["content"] for r in fused] == ["x", "y"]
@@ -0,0 +1,124 @@
+# tests/test_manifest.py
+import os
+
+from manifest import IngestManifest, file_hash, file_key, make_chunk_id
+
+
+def _write(path, text: str) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _manifest(tmp_path) -> IngestManifest:
+    return IngestManifest("T", manifest_dir=str(tmp_path / "manifests"))
+
+
+def test_new_file_then_done_then_changed(tmp_path):
+    path = _write(tmp_path / "data" / "a.txt", "v1")
+    manifest = _manifest(tmp_path)
+    digest = file_hash(path)
+    assert manifest.is_changed(path, digest)
+
+    manifest.reset(path, digest)
+    manifest.mark_done(path, digest, "text")
+    assert not manifest.is_changed(path, digest)
+    assert manifest.is_done(path, digest, "text")
+    assert not manifest.is_done(path, digest, "images")
+
+    _write(tmp_path / "data" / "a.txt", "v2")
+    new_digest = file_hash(path)
+    assert manifest.is_changed(path, new_digest)
+    assert not manifest.is_done(path, new_digest, "text")
+
+
+def test_save_and_reload(tmp_path):
+    path = _write(tmp_path / "data" / "a.txt", "v1")
+    manifest = _manifest(tmp_path)
+    digest = file_hash(path)
+    manifest.reset(path, digest)
+    manifest.mark_done(path, digest, "text")
+    manifest.save()
+
+    reloaded = _manifest(tmp_path)
+    assert reloaded.is_done(path, digest, "text")
+    assert reloaded.get_filename(path) == "a.txt"
+
+
+def test_mark_done_for_replaced_version_is_ignored(tmp_path):
+    path = _write(tmp_path / "data" / "a.txt", "v1")
+    manifest = _manifest(tmp_path)
+    manifest.reset(path, "old")
+    manifest.reset(path, "new")
+    manifest.mark_done(path, "old", "text")
+    assert not manifest.is_done(path, "new", "text")
+    assert not manifest.is_done(path, "old", "text")
+
+
+def test_missing_files_and_remove(tmp_path):
+    kept = _write(tmp_path / "data" / "a.txt", "a")
+    gone = _write(tmp_path / "data" / "b.txt", "b")
+    manifest = _manifest(tmp_path)
+    manifest.reset(kept, file_hash(kept))
+    manifest.reset(gone, file_hash(gone))
+
+    assert manifest.missing_files([kept]) == [file_key(gone)]
+    manifest.remove(gone)
+    assert manifest.missing_files([kept]) == []
+
+
+def test_same_name_in_subdirectories_are_separate(tmp_path):
+    first = _write(tmp_path / "data" / "a" / "notes.txt", "a")
+    second = _write(tmp_path / "data" / "b" / "notes.txt", "b")
+    manifest = _manifest(tmp_path)
+    manifest.reset(first, file_hash(first))
+    manifest.mark_done(first, file_hash(first), "text")
+
+    assert manifest.is_changed(second, file_hash(second))
+    assert manifest.is_done(os.path.join(str(tmp_path), "data", ".", "a", "notes.txt"), file_hash(first), "text")
+
+
+def test_make_chunk_id_is_deterministic():
+    assert make_chunk_id("h", 1, 0) == make_chunk_id("h", 1, 0)
+    assert make_chunk_id("h", 1, 0) != make_chunk_id("h", 1, 1)
+    assert make_chunk_id("h", 1, 0) != make_chunk_id("other", 1, 0)
+
+
+def test_written_chunks_belong_to_one_version(tmp_path):
+    path = _write(tmp_path / "data" / "a.txt", "v1")
+    manifest = _manifest(tmp_path)
+    manifest.reset(path, "h1")
+    manifest.mark_written(path, "h1", ["0:0", "0:1"])
+    manifest.mark_written(path, "h1", ["0:1", "0:2"])
+    manifest.mark_written(path, "stale", ["0:9"])
+
+    assert manifest.written_chunks(path, "h1") == {"0:0", "0:1", "0:2"}
+    assert manifest.written_chunks(path, "h2") == set()
+    manifest.reset(path, "h2")
+    assert manifest.written_chunks(path, "h2") == set()
+
+
+def test_mark_done_drops_only_that_stages_checkpoints(tmp_path):
+    path = _write(tmp_path / "data" / "a.pdf", "v1")
+    manifest = _manifest(tmp_path)
+    manifest.reset(path, "h")
+    manifest.mark_written(path, "h", ["1:0", "2:0", "1:img_0"])
+
+    manifest.mark_done(path, "h", "text")
+    assert manifest.written_chunks(path, "h") == {"1:img_0"}
+    manifest.mark_done(path, "h", "images")
+    assert manifest.written_chunks(path, "h") == set()
+
+
+def test_save_checkpoint_is_throttled(tmp_path):
+    path = _write(tmp_path / "data" / "a.txt", "v1")
+    manifest = IngestManifest("T", manifest_dir=str(tmp_path / "manifests"), checkpoint_interval=3600)
+    manifest.reset(path, "h")
+    manifest.save()
+    manifest.mark_written(path, "h", ["0:0"])
+    manifest.save_checkpoint()
+    assert _manifest(tmp_path).written_chunks(path, "h") == set()
+
+    manifest.checkpoint_interval = 0
+    manifest.save_checkpoint()
+    assert _manifest(tmp_path).written_chunks(path, "h") == {"0:0"}
@@ -0,0 +1,67 @@
+# tests/test_query_cache.py
+import builtins
+import time
+
+import query_cache
+from query_cache import TTLCache, ThemeVersions, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("What is  a\nProcess ") == normalize_query("what is a process")
+
+
+def test_ttl_cache_hit_and_miss():
+    cache = TTLCache(maxsize=4, ttl=60)
+    cache.put("k", [1, 2])
+    assert cache.get("k") == [1, 2]
+    assert cache.get("missing", "default") == "default"
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_entries_expire():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.put("a", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_theme_versions_bump_and_share_state(tmp_path):
+    versions = ThemeVersions(version_dir=str(tmp_path))
+    assert versions.get("T") == 0
+    assert versions.bump("T") == 1
+    assert versions.bump("T") == 2
+    assert versions.get("Other") == 0
+    # 另一个进程 (另一个实例) 读取同一目录也能看到更新
+    assert ThemeVersions(version_dir=str(tmp_path)).get("T") == 2
+
+
+def test_theme_version_is_read_from_disk_only_when_the_file_changes(tmp_path, monkeypatch):
+    versions = ThemeVersions(version_dir=str(tmp_path))
+    versions.bump("T")
+    reads = []
+
+    def counting_open(path, *args, **kwargs):
+        reads.append(path)
+        return builtins.open(path, *args, **kwargs)
+
+    monkeypatch.setattr(query_cache, "open", counting_open, raising=False)
+    assert [versions.get("T") for _ in range(3)] == [1, 1, 1]
+    assert reads == []
+
+    # 另一个进程入库后递增版本号，本进程的下一次检索即可看到
+    ThemeVersions(version_dir=str(tmp_path)).bump("T")
+    reads.clear()
+    assert versions.get("T") == 2
+    assert reads == [str(tmp_path / "T.txt")]
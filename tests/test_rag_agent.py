@@ -0,0 +1,191 @@
+# tests/test_rag_agent.py
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import rag_agent
+from rag_agent import RAGAgent, _queries_close
+
+
+def _result(doc_id: str) -> dict:
+    return {"id": doc_id, "content": f"内容 {doc_id}", "metadata": {"filename": "a.pdf", "page_number": 1}}
+
+
+def _agent(rewrite, candidates):
+    """不连接任何服务的 RAGAgent：重写与初筛由测试提供，重排序保持原顺序"""
+    agent = RAGAgent.__new__(RAGAgent)
+    agent.searched = []
+
+    def retrieve(query, initial_k):
+        agent.searched.append(query)
+        return [_result(doc_id) for doc_id in candidates[query]]
+
+    agent.rewrite_query = rewrite
+    agent._retrieve_candidates = retrieve
+    agent.rerank_results = lambda query, results, top_k: results[:top_k]
+    return agent
+
+
+HISTORY = [{"role": "user", "content": "什么是死锁"}, {"role": "assistant", "content": "..."}]
+
+
+def test_queries_close():
+    assert _queries_close("什么是死锁？", "什么是死锁")
+    assert not _queries_close("它的必要条件", "死锁的四个必要条件是什么")
+
+
+def test_equivalent_rewrite_reuses_speculative_retrieval():
+    agent = _agent(lambda query, history: "银行家算法是什么", {"银行家算法是什么？": ["d1", "d2"]})
+    search_query, context, results = agent.retrieve_with_rewrite("银行家算法是什么？", HISTORY, top_k=2)
+
+    assert search_query == "银行家算法是什么"
+    assert agent.searched == ["银行家算法是什么？"]
+    assert [r["id"] for r in results] == ["d1", "d2"]
+    assert "内容 d1" in context
+
+
+def test_different_rewrite_searches_again_and_merges_finished_speculation():
+    speculated = threading.Event()
+    candidates = {"它的必要条件": ["d9", "d1"], "死锁的四个必要条件是什么": ["d1", "d2"]}
+    agent = _agent(lambda query, history: speculated.wait(5) and "死锁的四个必要条件是什么", candidates)
+    retrieve = agent._retrieve_candidates
+
+    def retrieve_and_signal(query, initial_k):
+        results = retrieve(query, initial_k)
+        speculated.set()
+        return results
+
+    agent._retrieve_candidates = retrieve_and_signal
+    search_query, _, results = agent.retrieve_with_rewrite("它的必要条件", HISTORY, top_k=3)
+
+    assert search_query == "死锁的四个必要条件是什么"
+    assert agent.searched == ["它的必要条件", "死锁的四个必要条件是什么"]
+    # 两路都命中的 d1 排在最前
+    assert [r["id"] for r in results] == ["d1", "d9", "d2"]
+
+
+def test_slow_rewrite_falls_back_to_the_original_question(monkeypatch):
+    monkeypatch.setattr(rag_agent, "REWRITE_TIMEOUT", 0.05)
+
+    def slow_rewrite(query, history):
+        time.sleep(0.5)
+        return "不会被使用的重写"
+
+    agent = _agent(slow_rewrite, {"它的必要条件": ["d1"]})
+    search_query, _, results = agent.retrieve_with_rewrite("它的必要条件", HISTORY, top_k=1)
+    assert search_query == "它的必要条件"
+    assert [r["id"] for r in results] == ["d1"]
+
+
+def _async_agent(rewrite, candidates):
+    """_agent 的异步版本：重写与初筛都是协程"""
+    agent = RAGAgent.__new__(RAGAgent)
+    agent.searched = []
+
+    async def retrieve(query, initial_k):
+        agent.searched.append(query)
+        return [_result(doc_id) for doc_id in candidates[query]]
+
+    class _Reranker:
+        async def arerank(self, query, results, top_k):
+            return results[:top_k]
+
+    agent.arewrite_query = rewrite
+    agent._aretrieve_candidates = retrieve
+    agent.reranker = _Reranker()
+    return agent
+
+
+def test_async_equivalent_rewrite_reuses_speculative_retrieval():
+    async def rewrite(query, history):
+        return "银行家算法是什么"
+
+    agent = _async_agent(rewrite, {"银行家算法是什么？": ["d1", "d2"]})
+    search_query, _, results = asyncio.run(agent.aretrieve_with_rewrite("银行家算法是什么？", HISTORY, top_k=2))
+    assert search_query == "银行家算法是什么"
+    assert agent.searched == ["银行家算法是什么？"]
+    assert [r["id"] for r in results] == ["d1", "d2"]
+
+
+def test_async_slow_rewrite_is_cancelled(monkeypatch):
+    monkeypatch.setattr(rag_agent, "REWRITE_TIMEOUT", 0.05)
+    cancelled = []
+
+    async def slow_rewrite(query, history):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+        return "不会被使用的重写"
+
+    agent = _async_agent(slow_rewrite, {"它的必要条件": ["d1"]})
+    search_query, _, results = asyncio.run(agent.aretrieve_with_rewrite("它的必要条件", HISTORY, top_k=1))
+    assert search_query == "它的必要条件"
+    assert cancelled == ["它的必要条件"]
+    assert [r["id"] for r in results] == ["d1"]
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def _stream(pieces, fail_after=None):
+    for i, piece in enumerate(pieces):
+        if i == fail_after:
+            raise RuntimeError("连接中断")
+        yield _chunk(piece)
+
+
+def _streaming_agent(create):
+    agent = RAGAgent.__new__(RAGAgent)
+    agent.system_prompt = "系统提示"
+    agent.text_model = "text-model"
+    agent.text_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return agent
+
+
+def test_stream_yields_each_delta_as_it_arrives():
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return _stream(["死锁", None, "是指……"])
+
+    agent = _streaming_agent(create)
+    assert list(agent.generate_response_stream("什么是死锁", "材料")) == ["死锁", "是指……"]
+    assert requests[0]["stream"] is True
+    assert requests[0]["model"] == "text-model"
+
+
+def test_stream_error_is_appended_after_partial_output():
+    agent = _streaming_agent(lambda **kwargs: _stream(["死锁", "是指"], fail_after=1))
+    pieces = list(agent.generate_response_stream("什么是死锁", "材料"))
+    assert pieces[0] == "死锁"
+    assert pieces[1].startswith("\n\n生成回答时出错")
+
+
+def test_stream_error_before_output_yields_the_fallback_message():
+    def create(**kwargs):
+        raise RuntimeError("401")
+
+    agent = _streaming_agent(create)
+    assert list(agent.generate_response_stream("什么是死锁", "材料")) == ["生成回答时出错: 401"]
+
+
+def test_async_stream_yields_each_delta():
+    async def create(**kwargs):
+        async def stream():
+            for piece in ["死锁", "是指……"]:
+                yield _chunk(piece)
+
+        return stream()
+
+    agent = _streaming_agent(None)
+    agent.async_text_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def collect():
+        return [delta async for delta in agent.agenerate_response_stream("什么是死锁", "材料")]
+
+    assert asyncio.run(collect()) == ["死锁", "是指……"]
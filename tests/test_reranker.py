@@ -0,0 +1,59 @@
+# tests/test_reranker.py
+import pytest
+
+from lexical_index import bm25_scores, tokenize
+from reranker import BM25Reranker, get_reranker
+
+
+def test_tokenize_words_and_chinese_bigrams():
+    assert tokenize("银行家算法 LRU_cache") == ["银行", "行家", "家算", "算法", "lru_cache"]
+    assert tokenize("栈") == ["栈"]
+
+
+def test_bm25_prefers_documents_with_query_terms():
+    docs = ["进程调度的基本概念", "银行家算法用于避免死锁", "内存分页"]
+    scores = bm25_scores("银行家算法", docs)
+    assert scores.argmax() == 1
+    assert scores[0] == 0 and scores[2] == 0
+
+
+def test_bm25_without_query_terms():
+    assert list(bm25_scores("!!!", ["a", "b"])) == [0, 0]
+    assert len(bm25_scores("a", [])) == 0
+
+
+def test_rerank_uses_rrf_scores_as_prior():
+    reranker = BM25Reranker(lexical_weight=0.5)
+    candidates = [
+        {"content": "死锁的四个必要条件", "rrf_score": 0.032},
+        {"content": "页面置换", "rrf_score": 0.031},
+        {"content": "无关内容", "rrf_score": 0.010},
+    ]
+    # 没有词法匹配时，完全按 RRF 融合分排序
+    assert [c["content"] for c in reranker.rerank("调度", candidates, 2)] == ["死锁的四个必要条件", "页面置换"]
+    # 词法匹配可以把融合分接近的候选提上来
+    assert reranker.rerank("页面置换", candidates, 1)[0]["content"] == "页面置换"
+
+
+def test_rerank_treats_vector_scores_as_distances():
+    reranker = BM25Reranker(lexical_weight=0.0)
+    candidates = [{"content": "far", "score": 0.9}, {"content": "near", "score": 0.1}]
+    assert [c["content"] for c in reranker.rerank("x", candidates, 2)] == ["near", "far"]
+
+
+def test_rerank_falls_back_to_rank_without_scores():
+    reranker = BM25Reranker(lexical_weight=0.0)
+    candidates = [{"content": "first"}, {"content": "second"}]
+    assert [c["content"] for c in reranker.rerank("x", candidates, 2)] == ["first", "second"]
+
+
+def test_call_handles_empty_candidates():
+    assert BM25Reranker()("query", [], 3) == []
+
+
+def test_get_reranker():
+    assert get_reranker("bm25") is get_reranker("bm25")
+    with pytest.raises(ValueError):
+        get_reranker("llm")
+    with pytest.raises(ValueError):
+        get_reranker("unknown")
@@ -0,0 +1,122 @@
+# tests/test_text_splitter.py
+import random
+
+import pytest
+
+import text_splitter
+from config import CHUNK_OVERLAP, CHUNK_SIZE
+from text_splitter import TextSplitter, count_tokens_batch
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # 使用内置估算 (中文 1 字 1 token，其余约 4 字符 1 token)，结果不依赖 tiktoken 词表
+    monkeypatch.setattr(text_splitter, "_get_encoder", lambda: None)
+
+
+def _sentences(n: int) -> str:
+    return "".join(f"这是第{i}个句子的内容。" for i in range(n))
+
+
+def test_split_sentences_keeps_punctuation_and_decimals():
+    text = "进程是什么？它是程序的一次执行。Pi is 3.14 roughly. Next one!\n\n新段落"
+    assert TextSplitter.split_sentences(text) == [
+        "进程是什么？",
+        "它是程序的一次执行。",
+        "Pi is 3.14 roughly. ",
+        "Next one!\n\n",
+        "新段落",
+    ]
+
+
+def test_empty_text():
+    assert TextSplitter(100, 20).split_text("") == []
+    assert TextSplitter(100, 20).split_text("  \n ") == []
+
+
+def test_chunks_respect_size_and_cover_text():
+    splitter = TextSplitter(chunk_size=50, chunk_overlap=15)
+    text = _sentences(60)
+    chunks = splitter.split_text(text)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert sum(count_tokens_batch(splitter.split_sentences(chunk))) <= 50
+    assert text.startswith(chunks[0])
+    assert text.endswith(chunks[-1])
+    for sentence in splitter.split_sentences(text):
+        assert any(sentence in chunk for chunk in chunks)
+
+
+def test_adjacent_chunks_overlap_by_whole_sentences():
+    splitter = TextSplitter(chunk_size=50, chunk_overlap=15)
+    chunks = splitter.split_text(_sentences(60))
+    for prev, nxt in zip(chunks, chunks[1:]):
+        first_sentence = splitter.split_sentences(nxt)[0]
+        assert prev.endswith(first_sentence)
+
+
+def test_no_overlap():
+    splitter = TextSplitter(chunk_size=50, chunk_overlap=0)
+    text = _sentences(60)
+    assert "".join(splitter.split_text(text)) == text
+
+
+def test_oversized_sentence_is_hard_split():
+    splitter = TextSplitter(chunk_size=20, chunk_overlap=5)
+    text = "无标点的超长文本" * 30
+    chunks = splitter.split_text(text)
+    assert len(chunks) > 1
+    assert all(count_tokens_batch([c])[0] <= 20 for c in chunks)
+    assert text.startswith(chunks[0])
+    assert text.endswith(chunks[-1])
+
+
+def _mixed_line(length: int, seed: int = 0) -> str:
+    """无标点的中英文混排长行：前半段以英文为主、后半段以中文为主，token 密度前后不均"""
+    rng = random.Random(seed)
+    half = length // 2
+    ascii_part = "".join(rng.choice("abcdefghij0123456789 ") if rng.random() < 0.9 else "表" for _ in range(half))
+    wide_part = "".join(rng.choice("进程线程调度内存") if rng.random() < 0.9 else "x" for _ in range(length - half))
+    return ascii_part + wide_part
+
+
+@pytest.mark.parametrize(
+    "line", ["x" * 3000, "无标点的超长文本" * 375, _mixed_line(3000)], ids=["ascii", "chinese", "mixed"]
+)
+def test_long_unpunctuated_line_stays_within_chunk_size(line):
+    splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_text(line)
+
+    assert len(line) == 3000 and len(chunks) > 1
+    assert max(count_tokens_batch(chunks)) <= CHUNK_SIZE
+    assert line.startswith(chunks[0])
+    assert line.endswith(chunks[-1])
+
+
+def test_hard_split_chunks_keep_the_overlap():
+    line = _mixed_line(3000, seed=1)
+    splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_text(line)
+
+    rebuilt = chunks[0]
+    for prev, nxt in zip(chunks, chunks[1:]):
+        overlap = max(k for k in range(len(nxt)) if prev.endswith(nxt[:k]))
+        # 相邻块仍有重叠，且重叠不超过 CHUNK_OVERLAP
+        assert 0 < count_tokens_batch([nxt[:overlap]])[0] <= CHUNK_OVERLAP
+        rebuilt += nxt[overlap:]
+    # 去掉重叠后按顺序拼回原文
+    assert rebuilt == line
+
+
+def test_short_pdf_page_is_one_chunk_long_page_is_split():
+    splitter = TextSplitter(chunk_size=50, chunk_overlap=10, page_max_tokens=200)
+    docs = [
+        {"content": _sentences(3), "filetype": ".pdf", "filename": "a.pdf", "page_number": 1},
+        {"content": _sentences(40), "filetype": ".pdf", "filename": "a.pdf", "page_number": 2},
+    ]
+    chunks = splitter.split_documents(docs, show_progress=False)
+    assert [c["page_number"] for c in chunks].count(1) == 1
+    page_two = [c for c in chunks if c["page_number"] == 2]
+    assert len(page_two) > 1
+    assert [c["chunk_id"] for c in page_two] == list(range(len(page_two)))
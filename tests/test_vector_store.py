@@ -0,0 +1,244 @@
+# tests/test_vector_store.py
+import asyncio
+import os
+from collections import OrderedDict
+
+import pytest
+
+import vector_store
+
+from embedding_cache import EmbeddingCache
+from embedding_provider import EmbeddingModelMismatch, EmbeddingProvider, get_embedding_provider
+from manifest import file_hash
+from vector_store import EmbeddingRetryList, VectorStore, get_vector_store, pack_batches
+
+
+def _spans(batches):
+    return [(b.start, b.stop) for b in batches]
+
+
+def test_pack_batches_by_item_limit():
+    assert _spans(pack_batches([1] * 5, max_items=2, max_tokens=100)) == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_pack_batches_by_token_limit():
+    assert _spans(pack_batches([4, 4, 4, 1], max_items=10, max_tokens=8)) == [(0, 2), (2, 4)]
+
+
+def test_oversized_item_gets_its_own_batch():
+    assert _spans(pack_batches([3, 20, 3], max_items=10, max_tokens=8)) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_pack_batches_covers_every_item_in_order():
+    counts = [(i * 7) % 13 + 1 for i in range(200)]
+    batches = pack_batches(counts, max_items=25, max_tokens=60)
+    assert [i for b in batches for i in b] == list(range(200))
+    for b in batches:
+        assert len(b) <= 25
+        assert len(b) == 1 or sum(counts[i] for i in b) <= 60
+
+
+def test_pack_batches_empty():
+    assert pack_batches([], max_items=10, max_tokens=100) == []
+
+
+def _failed_chunk(source, chunk_id: int, content: str = "text") -> dict:
+    return {
+        "content": content,
+        "filename": source.name,
+        "filepath": str(source),
+        "file_hash": file_hash(str(source)),
+        "page_number": 0,
+        "chunk_id": chunk_id,
+    }
+
+
+def test_retry_list_keeps_latest_copy_of_each_chunk(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("v1", encoding="utf-8")
+    retry_list = EmbeddingRetryList("T", retry_dir=str(tmp_path / "retry"))
+    retry_list.add([_failed_chunk(source, 0, "old"), _failed_chunk(source, 1)])
+    retry_list.add([_failed_chunk(source, 0, "new")])
+
+    entries = sorted(retry_list.pop_all(), key=lambda c: c["chunk_id"])
+    assert [(c["chunk_id"], c["content"]) for c in entries] == [(0, "new"), (1, "text")]
+    assert not retry_list.has_entries()
+
+
+def test_retry_list_drops_chunks_of_changed_or_deleted_files(tmp_path):
+    changed = tmp_path / "a.txt"
+    deleted = tmp_path / "b.txt"
+    kept = tmp_path / "c.txt"
+    for path in (changed, deleted, kept):
+        path.write_text("v1", encoding="utf-8")
+    retry_list = EmbeddingRetryList("T", retry_dir=str(tmp_path / "retry"))
+    retry_list.add([_failed_chunk(changed, 0), _failed_chunk(deleted, 0), _failed_chunk(kept, 0)])
+
+    changed.write_text("v2", encoding="utf-8")
+    deleted.unlink()
+    assert [c["filename"] for c in retry_list.pop_all()] == ["c.txt"]
+
+
+class _FakeEmbedder(EmbeddingProvider):
+    name = "fake-embedding"
+    max_batch_items = 16
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+
+def _store(tmp_path, embedder=None) -> VectorStore:
+    return VectorStore(
+        db_path=str(tmp_path / "db"),
+        collection_name=tmp_path.name,
+        embedding_provider=embedder or _FakeEmbedder(),
+        embedding_cache=EmbeddingCache(db_path=str(tmp_path / "embeddings.sqlite3")),
+    )
+
+
+def _chunks(filepath: str, digest: str, n: int = 2):
+    return [
+        {
+            "content": f"{filepath} 第 {i} 块" + "内容" * i,
+            "filename": filepath.rsplit("/", 1)[-1],
+            "filepath": filepath,
+            "filetype": ".txt",
+            "page_number": 0,
+            "chunk_id": i,
+            "file_hash": digest,
+        }
+        for i in range(n)
+    ]
+
+
+def test_add_and_search_with_a_pluggable_embedder(tmp_path):
+    store = _store(tmp_path)
+    assert store.add_documents(_chunks("data/T/a.txt", "h", n=3), show_progress=False) == []
+    assert store.collection.count() == 3
+    assert store.collection.metadata["embedding_model"] == "fake-embedding"
+
+    results = store.search("data/T/a.txt 第 0 块", top_k=2)
+    assert len(results) == 2
+    assert results[0]["metadata"]["filename"] == "a.txt"
+
+
+def test_rewriting_the_same_chunks_uses_the_embedding_cache(tmp_path):
+    embedder = _FakeEmbedder()
+    store = _store(tmp_path, embedder)
+    store.add_documents(_chunks("data/T/a.txt", "h"), show_progress=False)
+    calls = embedder.calls
+    store.add_documents(_chunks("data/T/a.txt", "h"), show_progress=False)
+    assert embedder.calls == calls
+    assert store.collection.count() == 2
+
+
+def test_collection_refuses_a_different_embedding_model(tmp_path):
+    _store(tmp_path).add_documents(_chunks("data/T/a.txt", "h"), show_progress=False)
+
+    other = _FakeEmbedder()
+    other.name = "other-embedding"
+    store = _store(tmp_path, other)
+    with pytest.raises(EmbeddingModelMismatch):
+        store.search("问题")
+    with pytest.raises(EmbeddingModelMismatch):
+        store.add_documents(_chunks("data/T/b.txt", "h"), show_progress=False)
+
+    # 全量重建后集合改由当前模型构建
+    store.clear_collection()
+    assert store.add_documents(_chunks("data/T/b.txt", "h"), show_progress=False) == []
+
+
+def test_lexical_search_finds_exact_terms(tmp_path):
+    store = _store(tmp_path)
+    chunks = _chunks("data/T/a.txt", "h", n=3)
+    chunks[2]["content"] = "页面置换算法 LRU"
+    store.add_documents(chunks, show_progress=False)
+
+    hits = store.lexical_search("LRU", top_k=3)
+    assert [h["content"] for h in hits] == ["页面置换算法 LRU"]
+    assert hits[0]["metadata"]["filename"] == "a.txt"
+
+
+def test_lexical_index_is_backfilled_for_existing_collections(tmp_path):
+    chunks = _chunks("data/T/a.txt", "h", n=3)
+    chunks[1]["content"] = "银行家算法"
+    store = _store(tmp_path)
+    store.add_documents(chunks, show_progress=False)
+    store.lexical_index.clear()
+
+    assert _store(tmp_path).lexical_search("银行家", top_k=3)[0]["content"] == "银行家算法"
+
+
+def test_async_search_matches_sync_search(tmp_path):
+    store = _store(tmp_path)
+    chunks = _chunks("data/T/a.txt", "h", n=3)
+    chunks[2]["content"] = "页面置换算法 LRU"
+    store.add_documents(chunks, show_progress=False)
+
+    async def search_both():
+        return await asyncio.gather(
+            store.asearch("data/T/a.txt 第 0 块", top_k=2),
+            store.alexical_search("LRU", top_k=3),
+        )
+
+    results, hits = asyncio.run(search_both())
+    assert results == store.search("data/T/a.txt 第 0 块", top_k=2)
+    assert hits == store.lexical_search("LRU", top_k=3)
+
+
+def _filepaths(store):
+    return sorted(meta["filepath"] for meta in store.collection.get(include=["metadatas"])["metadatas"])
+
+
+def test_delete_file_keeps_same_named_file_in_other_directory(tmp_path):
+    store = _store(tmp_path)
+    first = os.path.join("data", "T", "a", "notes.txt")
+    second = os.path.join("data", "T", "b", "notes.txt")
+    assert store.add_documents(_chunks(first, "h1") + _chunks(second, "h2"), show_progress=False) == []
+
+    store.delete_file(os.path.join("data", "T", "a", ".", "notes.txt"))
+    assert _filepaths(store) == [second, second]
+    assert store.lexical_index.count() == 2
+
+
+def test_delete_file_removes_legacy_rows_without_filepath(tmp_path):
+    store = _store(tmp_path)
+    store.collection.upsert(
+        ids=["legacy-uuid"],
+        embeddings=[[1.0, 1.0, 1.0]],
+        documents=["旧版本写入的块"],
+        metadatas=[{"filename": "notes.txt", "page_number": 0, "chunk_id": 0}],
+    )
+    kept = os.path.join("data", "T", "b", "notes.txt")
+    store.add_documents(_chunks(kept, "h2"), show_progress=False)
+
+    store.delete_file(os.path.join("data", "T", "a", "notes.txt"))
+    assert store.collection.get(ids=["legacy-uuid"])["ids"] == []
+    assert _filepaths(store) == [kept, kept]
+
+
+def test_open_stores_are_shared_and_evicted_lru(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "_open_stores", OrderedDict())
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_CACHE_SIZE", 2)
+    monkeypatch.setattr(vector_store, "VectorStore", lambda db_path, collection_name: object())
+    db_path = str(tmp_path / "db")
+
+    os_store = get_vector_store("操作系统", db_path=db_path)
+    assert get_vector_store("操作系统", db_path=db_path) is os_store
+    # 清洗后名称相同的主题共用一个实例
+    assert get_vector_store("data mining", db_path=db_path) is get_vector_store("data-mining", db_path=db_path)
+
+    get_vector_store("操作系统", db_path=db_path)
+    get_vector_store("编译原理", db_path=db_path)
+    # 超出上限时淘汰最久未使用的 data_mining，最近用过的保留
+    assert get_vector_store("操作系统", db_path=db_path) is os_store
+    assert [name for _, name in vector_store._open_stores] == ["编译原理", "操作系统"]
+
+
+def test_unknown_embedding_provider_is_rejected():
+    with pytest.raises(ValueError):
+        get_embedding_provider("nope")
@@ -1,108 +1,183 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from tqdm import tqdm
 import re
 
+from config import PAGE_MAX_TOKENS, TOKENIZER_ENCODING
+
+# 句子边界 (中英文混排)，句末的空白一并归入前一句：
+# - 中文句末标点 。！？；… 及其后的右引号/右括号
+# - 英文 .!? 后跟空白或文本结尾 (避免切开 3.14、e.g.x 这类写法)
+# - 空行 (段落边界)
+# 以标点字符集开头，正则引擎可直接跳到候选位置，再用前后断言区分三种边界
+SENTENCE_BOUNDARY = re.compile(
+    r"([。！？；….!?\n]"
+    r"(?:(?<=[。！？；…])|(?<=[.!?])(?=[\s”’\"')]|$)|(?<=\n)(?=[ \t]*\n))"
+    r"[。！？；….!?”’」』）)\"']*\s*)"
+)
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    """懒加载 tiktoken 编码器；未安装或离线无法下载词表时返回 None"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            print(f"⚠️ tiktoken 不可用，按字符估算 token 数: {e}")
+            _encoder = None
+    return _encoder
+
+
+def _estimate_tokens_batch(texts: List[str]) -> List[int]:
+    """无 tiktoken 时的估算：中文约 1 字 1 token，其余约 4 字符 1 token
+
+    中文字符的 UTF-8 编码为 3 字节、ASCII 为 1 字节，由字节数与字符数之差即可得到中文字数，
+    不需要逐字符匹配
+    """
+    result = []
+    for chars, size in zip(map(len, texts), map(len, map(str.encode, texts))):
+        wide = (size - chars) // 2
+        result.append(wide + (chars - wide + 3) // 4)
+    return result
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """批量计算 token 数 (tiktoken 的批量编码在 Rust 侧并行执行)"""
+    encoder = _get_encoder()
+    if encoder is None:
+        return _estimate_tokens_batch(texts)
+    return [len(ids) for ids in encoder.encode_ordinary_batch(texts)]
+
+
+def count_tokens(text: str) -> int:
+    return count_tokens_batch([text])[0]
+
 
 class TextSplitter:
-    def __init__(self, chunk_size: int, chunk_overlap: int):
+    """
+    按 Embedding 模型 token 数切分文本。
+    单次扫描切出句子，一次批量计算各句 token 数，再按前缀和二分确定每块的边界与重叠，
+    整体耗时与文本长度成线性关系。
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, page_max_tokens: int = PAGE_MAX_TOKENS):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.page_max_tokens = page_max_tokens
+
+    @staticmethod
+    def split_sentences(text: str) -> List[str]:
+        """按中英文句子边界切分，句末标点保留在句子末尾"""
+        # re.split 带捕获组时返回 [句子, 边界, 句子, 边界, ..., 句子]，一次扫描完成
+        parts = SENTENCE_BOUNDARY.split(text)
+        parts.append("")
+        return [s for s in map("".join, zip(parts[0::2], parts[1::2])) if s.strip()]
+
+    def _hard_split(self, sentence: str, tokens: int) -> List[Tuple[str, int]]:
+        """超过 chunk_size 的超长句子 (表格、代码、无标点文本) 按字符比例切开
+
+        片段不超过 chunk_overlap 个 token (无重叠时为 chunk_size)，组块时相邻块之间仍能保留重叠
+        """
+        limit = self.chunk_overlap if 0 < self.chunk_overlap < self.chunk_size else self.chunk_size
+        return self._split_to_limit(sentence, tokens, limit)
+
+    def _split_to_limit(self, text: str, tokens: int, limit: int) -> List[Tuple[str, int]]:
+        window = max(1, len(text) * limit // tokens)
+        pieces = [text[i : i + window] for i in range(0, len(text), window)]
+        result = []
+        for piece, n in zip(pieces, count_tokens_batch(pieces)):
+            if n > limit and len(piece) > 1:
+                # 中英文混排时 token 密度不均，按平均比例切出的片段可能仍超长，继续细分
+                result.extend(self._split_to_limit(piece, n, limit))
+            else:
+                result.append((piece, n))
+        return result
 
     def split_text(self, text: str) -> List[str]:
         """将文本切分为块
 
-        TODO: 实现文本切分算法
-        要求：
-        1. 将文本按照chunk_size切分为多个块
-        2. 相邻块之间要有chunk_overlap的重叠（用于保持上下文连续性）
-        3. 尽量在句子边界处切分（查找句子结束符：。！？.!?\n\n）
-        4. 返回切分后的文本块列表
+        1. 每块不超过 chunk_size 个 token
+        2. 相邻块之间有约 chunk_overlap 个 token 的重叠 (以整句为单位)
+        3. 在句子边界处切分，超长句子才会被截断
         """
-        if not text:
+        if not text or not text.strip():
             return []
-    # 1. 首先按句子切分
-        # 正则说明：匹配 。！？.!? 后面可能跟的引号，然后是空格或行尾
-        sentence_endings = r'([。！？.!?]+[\"\']?(\s|$))'
-        parts = re.split(sentence_endings, text)
-        
-        sentences = []
-        current_sent = ""
-        for part in parts:
-            current_sent += part
-            # 只有当包含结束符，或者字符串很长时，才视为一个句子结束
-            if re.search(r'[。！？.!?]', part) or len(part.strip()) == 0:
-                if current_sent.strip():
-                    sentences.append(current_sent)
-                current_sent = ""
-        # 处理最后剩余的部分
-        if current_sent.strip():
-            sentences.append(current_sent)
-
-        # 2. 组合句子为 Chunk (实现滑动窗口重叠)
+
+        sentences = self.split_sentences(text)
+        tokens = count_tokens_batch(sentences)
+        oversized = [i for i, n in enumerate(tokens) if n > self.chunk_size]
+        if oversized:
+            # 超长句子很少，只替换这几处，其余部分按切片整体拷贝
+            new_sentences, new_tokens = [], []
+            prev = 0
+            for i in oversized:
+                new_sentences.extend(sentences[prev:i])
+                new_tokens.extend(tokens[prev:i])
+                for piece, n in self._hard_split(sentences[i], tokens[i]):
+                    new_sentences.append(piece)
+                    new_tokens.append(n)
+                prev = i + 1
+            new_sentences.extend(sentences[prev:])
+            new_tokens.extend(tokens[prev:])
+            sentences, tokens = new_sentences, new_tokens
+
+        # prefix[i] 为前 i 句的 token 总数；块 sentences[start:end] 的长度为 prefix[end] - prefix[start]。
+        # 块的结束位置和重叠的起点都用二分查找确定，Python 层的循环次数只与块数有关
+        prefix = [0, *accumulate(tokens)]
+        total = len(sentences)
         chunks = []
-        current_chunk_sentences = [] # 当前块包含的句子列表
-        current_len = 0 # 当前块的总长度
-
-        for sentence in sentences:
-            sent_len = len(sentence)
-
-            # 如果加入新句子会超过 chunk_size
-            if current_len + sent_len > self.chunk_size:
-                # A. 先保存当前这满的一块
-                if current_chunk_sentences:
-                    chunk_text = "".join(current_chunk_sentences)
-                    chunks.append(chunk_text)
-
-                # B. 实现 Overlap：回溯，保留上一块末尾的内容
-                # 我们要从 current_chunk_sentences 的末尾往回找，
-                # 凑够 chunk_overlap 长度的句子，作为新块的开头
-                overlap_buffer = []
-                overlap_len = 0
-                
-                # 倒序遍历当前块的句子
-                for old_sent in reversed(current_chunk_sentences):
-                    if overlap_len + len(old_sent) <= self.chunk_overlap:
-                        overlap_buffer.insert(0, old_sent) # 插到最前面
-                        overlap_len += len(old_sent)
-                    else:
-                        break # 凑够了，停止
-                
-                # C. 重置当前块：Overlap的内容 + 当前这句新句子
-                current_chunk_sentences = overlap_buffer
-                current_len = overlap_len
-            
-            # 将新句子加入当前块
-            current_chunk_sentences.append(sentence)
-            current_len += sent_len
-
-        # 3. 处理最后一个块
-        if current_chunk_sentences:
-            chunks.append("".join(current_chunk_sentences))
+        start = 0
+        while start < total:
+            # 尽量多放句子，但每块至少一句
+            end = max(start + 1, bisect_right(prefix, prefix[start] + self.chunk_size, start + 1) - 1)
+            chunks.append("".join(sentences[start:end]))
+            if end >= total:
+                break
+            # 重叠：当前块末尾不超过 chunk_overlap 的若干句 (至少前进一句，保证不会原地循环)
+            overlap_start = bisect_left(prefix, prefix[end] - self.chunk_overlap, start + 1, end)
+            # 重叠 + 下一句仍超长时放弃重叠，保证块不超过 chunk_size
+            if prefix[end + 1] - prefix[overlap_start] > self.chunk_size:
+                overlap_start = end
+            start = overlap_start
 
         return chunks
 
-    def split_documents(self, documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    def split_documents(self, documents: List[Dict[str, str]], show_progress: bool = True) -> List[Dict[str, str]]:
         """切分多个文档。
-        对于PDF和PPT，已经按页/幻灯片分割，不再进行二次切分
+        对于PDF和PPT，已经按页/幻灯片分割，单页不超过 page_max_tokens 时整页作为一块，否则二次切分
         对于DOCX和TXT，进行文本切分
+        show_progress=False 时不打印进度 (流式入库时逐文件调用)
         """
         chunks_with_metadata = []
 
-        for doc in tqdm(documents, desc="处理文档", unit="文档"):
+        for doc in tqdm(documents, desc="处理文档", unit="文档", disable=not show_progress):
             content = doc.get("content", "")
             filetype = doc.get("filetype", "")
 
             if filetype in [".pdf", ".pptx"]:
-                chunk_data = {
-                    "content": content,
-                    "filename": doc.get("filename", "unknown"),
-                    "filepath": doc.get("filepath", ""),
-                    "filetype": filetype,
-                    "page_number": doc.get("page_number", 0),
-                    "chunk_id": 0,
-                    "images": doc.get("images", []),
-                }
-                chunks_with_metadata.append(chunk_data)
+                if count_tokens(content) <= self.page_max_tokens:
+                    page_chunks = [content]
+                else:
+                    page_chunks = self.split_text(content)
+                for i, chunk in enumerate(page_chunks):
+                    chunk_data = {
+                        "content": chunk,
+                        "filename": doc.get("filename", "unknown"),
+                        "filepath": doc.get("filepath", ""),
+                        "filetype": filetype,
+                        "page_number": doc.get("page_number", 0),
+                        "chunk_id": i,
+                        "images": doc.get("images", []),
+                        "file_hash": doc.get("file_hash", ""),
+                    }
+                    chunks_with_metadata.append(chunk_data)
 
             elif filetype in [".docx", ".txt"]:
                 chunks = self.split_text(content)
@@ -115,8 +190,10 @@ class TextSplitter:
                         "page_number": 0,
                         "chunk_id": i,
                         "images": [],
+                        "file_hash": doc.get("file_hash", ""),
                     }
                     chunks_with_metadata.append(chunk_data)
 
-        print(f"\n文档处理完成，共 {len(chunks_with_metadata)} 个块")
+        if show_progress:
+            print(f"\n文档处理完成，共 {len(chunks_with_metadata)} 个块")
         return chunks_with_metadata
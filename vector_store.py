@@ -1,10 +1,10 @@
 import os
-from typing import List, Dict
-import uuid
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Callable
 
-import chromadb
-from chromadb.config import Settings
-from openai import OpenAI
 from tqdm import tqdm
 
 from config import (
@@ -13,8 +13,107 @@ from config import (
     OPENAI_API_KEY,
     OPENAI_API_BASE,
     OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_RETRY_DIR,
     TOP_K,
+    VECTOR_STORE_CACHE_SIZE,
 )
+from manifest import make_chunk_id, file_hash, file_key
+from api_retry import RateLimiter, call_with_backoff
+from text_splitter import count_tokens_batch
+from embedding_cache import EmbeddingCache, get_shared_embedding_cache
+from embedding_provider import EmbeddingProvider, EmbeddingModelMismatch, get_embedding_provider
+from query_cache import normalize_query, query_embedding_cache, search_result_cache, theme_versions
+from lexical_index import LexicalIndex
+from clients import run_storage, get_chroma_client
+
+
+# 命中缓存的块直接写入 Chroma 时每批的条数
+CACHED_UPSERT_BATCH = 100
+# 为已有集合补建词法索引时，每次从 Chroma 读取的条数
+LEXICAL_BACKFILL_BATCH = 1000
+
+
+def pack_batches(token_counts: List[int], max_items: int, max_tokens: int) -> List[range]:
+    """按单次请求的条数与 token 上限把文本顺序打包，返回每批的下标区间 (单条超限的文本单独成批)"""
+    batches = []
+    start = 0
+    tokens = 0
+    for i, n in enumerate(token_counts):
+        if i > start and (i - start >= max_items or tokens + n > max_tokens):
+            batches.append(range(start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(token_counts):
+        batches.append(range(start, len(token_counts)))
+    return batches
+
+
+class EmbeddingRetryList:
+    """持久化的 Embedding 失败块 (重试耗尽后)，下次入库时优先重试"""
+
+    def __init__(self, collection_name: str, retry_dir: str = EMBEDDING_RETRY_DIR):
+        os.makedirs(retry_dir, exist_ok=True)
+        self.path = os.path.join(retry_dir, f"{collection_name}.json")
+        self._lock = threading.Lock()
+
+    def has_entries(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _read(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Embedding 重试列表读取失败: {e}")
+            return []
+
+    def _write(self, chunks: List[Dict]):
+        if not chunks:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(chunk: Dict) -> str:
+        return make_chunk_id(chunk.get("file_hash") or chunk["filename"], chunk["page_number"], chunk["chunk_id"])
+
+    def add(self, chunks: List[Dict]):
+        """追加失败的块 (同一块只保留最新一份)"""
+        with self._lock:
+            entries = {self._key(c): c for c in self._read()}
+            entries.update((self._key(c), c) for c in chunks)
+            self._write(list(entries.values()))
+
+    def pop_all(self) -> List[Dict]:
+        """取出全部仍然有效的条目并清空列表 (源文件已删除或内容已变化的条目会被丢弃)"""
+        with self._lock:
+            entries = self._read()
+            self._write([])
+
+        current_hashes = {}
+        valid = []
+        for chunk in entries:
+            filepath = chunk.get("filepath", "")
+            if not filepath or not chunk.get("file_hash"):
+                valid.append(chunk)
+                continue
+            if filepath not in current_hashes:
+                current_hashes[filepath] = file_hash(filepath) if os.path.exists(filepath) else None
+            if current_hashes[filepath] == chunk["file_hash"]:
+                valid.append(chunk)
+        return valid
+
+
+def sanitize_collection_name(name: str) -> str:
+    """Chroma 要求名称不能含空格等特殊字符，这里将空格和连字符替换为下划线"""
+    return name.strip().replace(" ", "_").replace("-", "_")
 
 
 class VectorStore:
@@ -25,63 +124,144 @@ class VectorStore:
         collection_name: str = COLLECTION_NAME, # 默认值保留，但允许覆盖
         api_key: str = OPENAI_API_KEY,
         api_base: str = OPENAI_API_BASE,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding_provider: Optional[EmbeddingProvider] = None,
     ):
         self.db_path = db_path
         
         # 【关键修改】对 collection_name 进行简单清洗，Chroma 要求名称不能含空格等特殊字符
         # 这里我们将空格替换为下划线，确保兼容性
-        safe_name = collection_name.strip().replace(" ", "_").replace("-", "_")
+        safe_name = sanitize_collection_name(collection_name)
         self.collection_name = safe_name
 
-        self.client = OpenAI(api_key=api_key, base_url=api_base)
+        # Embedding 后端由 config.EMBEDDING_PROVIDER 选择 (远程 API 或本地 CPU 模型)
+        self.embedder = embedding_provider or get_embedding_provider(api_key=api_key, api_base=api_base)
 
-        os.makedirs(db_path, exist_ok=True)
-        self.chroma_client = chromadb.PersistentClient(
-            path=db_path, settings=Settings(anonymized_telemetry=False)
-        )
+        # 同一数据库路径在进程内共用一个 Chroma 客户端
+        self.chroma_client = get_chroma_client(db_path)
 
         # 【关键修改】使用传入的 safe_name 创建或获取集合
         print(f"📚 [VectorStore] 正在连接集合: {self.collection_name}")
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=self.collection_name, 
-            metadata={"description": f"Theme: {collection_name}"}
-        )
+        # 已存在的集合直接获取 (部分 Chroma 版本的 get_or_create 会覆盖元数据，丢失模型记录)
+        try:
+            self.collection = self.chroma_client.get_collection(name=self.collection_name)
+        except Exception:
+            self.collection = self.chroma_client.get_or_create_collection(
+                name=self.collection_name, 
+                metadata={"description": f"Theme: {collection_name}", "embedding_model": self.embedder.name}
+            )
+        self.collection_model = self._resolve_collection_model()
+        if self.collection_model != self.embedder.name:
+            print(
+                f"⚠️ [VectorStore] 集合 {self.collection_name} 由 {self.collection_model} 构建，"
+                f"当前 Embedding 模型为 {self.embedder.name}，需全量重建后才能检索"
+            )
+        self.retry_list = EmbeddingRetryList(self.collection_name)
+        # 词法倒排索引，与集合同步写入/删除 (混合检索使用)
+        self.lexical_index = LexicalIndex(os.path.join(db_path, "lexical", f"{self.collection_name}.sqlite3"))
+        self._lexical_checked = False
+        self.rate_limiter = RateLimiter(self.embedder.rpm)
+        # Embedding 缓存跨主题共享，默认使用进程内共享的实例
+        self.embedding_cache = embedding_cache or get_shared_embedding_cache()
+
+    def _resolve_collection_model(self) -> str:
+        """集合记录的 Embedding 模型；早期版本创建的集合没有记录，视为由默认远程模型构建"""
+        metadata = dict(self.collection.metadata or {})
+        model = metadata.get("embedding_model")
+        if model:
+            return model
+        model = OPENAI_EMBEDDING_MODEL if self.collection.count() else self.embedder.name
+        metadata["embedding_model"] = model
+        try:
+            self.collection.modify(metadata=metadata)
+        except Exception as e:
+            print(f"⚠️ 无法记录集合的 Embedding 模型: {e}")
+        return model
+
+    def check_embedding_model(self):
+        """拒绝用不同的模型检索或写入 (向量空间不兼容，结果没有意义)"""
+        if self.collection_model != self.embedder.name:
+            raise EmbeddingModelMismatch(
+                f"集合 {self.collection_name} 由 Embedding 模型 {self.collection_model} 构建，"
+                f"当前配置为 {self.embedder.name}。请切换回原模型，或全量重建该主题 (不加 --incremental)。"
+            )
 
     def get_embedding(self, text: str) -> List[float]:
         """获取文本的向量表示
 
-        TODO: 使用OpenAI API获取文本的embedding向量
-
+        使用当前的 Embedding 后端 (见 config.EMBEDDING_PROVIDER) 计算查询向量
         """
         # 替换换行符以避免某些模型表现不佳
-        text = text.replace("\n", " ")
+        text = self.embedder.query_prefix + text.replace("\n", " ")
+        model = self.embedder.name
+        # 先查内存 LRU (同一问题短时间内反复出现)，再查磁盘缓存
+        memory_key = (model, normalize_query(text))
+        cached = query_embedding_cache.get(memory_key)
+        if cached is not None:
+            return cached
+        cached = self.embedding_cache.get(text, model)
+        if cached is not None:
+            query_embedding_cache.put(memory_key, cached)
+            return cached
         try:
-            response = self.client.embeddings.create(
-                input=[text],
-                model=OPENAI_EMBEDDING_MODEL
-            )
-            return response.data[0].embedding
+            embedding = self.embedder.embed([text])[0]
+            self.embedding_cache.put(text, embedding, model)
+            query_embedding_cache.put(memory_key, embedding)
+            return embedding
         except Exception as e:
             print(f"Error getting embedding: {e}")
             return []
 
-    def add_documents(self, chunks: List[Dict[str, str]]) -> None:
-        """添加文档块到向量数据库
-        TODO: 实现文档块添加到向量数据库
-        要求：
-        1. 遍历文档块
-        2. 获取文档块内容
-        3. 获取文档块元数据
-        5. 打印添加进度
+    async def aget_embedding(self, text: str) -> List[float]:
+        """get_embedding 的异步版本：Embedding 请求走异步客户端，磁盘缓存读写在存储线程池中执行"""
+        text = self.embedder.query_prefix + text.replace("\n", " ")
+        model = self.embedder.name
+        memory_key = (model, normalize_query(text))
+        cached = query_embedding_cache.get(memory_key)
+        if cached is not None:
+            return cached
+        cached = await run_storage(self.embedding_cache.get, text, model)
+        if cached is not None:
+            query_embedding_cache.put(memory_key, cached)
+            return cached
+        try:
+            embedding = (await self.embedder.aembed([text]))[0]
+            await run_storage(self.embedding_cache.put, text, embedding, model)
+            query_embedding_cache.put(memory_key, embedding)
+            return embedding
+        except Exception as e:
+            print(f"Error getting embedding: {e}")
+            return []
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.embedder.embed(texts)
+        self.embedding_cache.put_many(texts, embeddings, self.embedder.name)
+        return embeddings
+
+    def add_documents(
+        self,
+        chunks: List[Dict[str, str]],
+        show_progress: bool = True,
+        on_batch: Optional[Callable[[List[Dict]], None]] = None,
+    ) -> List[Dict]:
+        """添加文档块到向量数据库 (upsert 语义)
+
+        ID 由 (文件哈希, 页码, 块序号) 确定性生成，同一块重复写入会覆盖而不是追加。
+        返回写入失败的文档块，调用方据此决定是否将文件标记为已完成。
+        show_progress=False 时不打印进度 (流式入库时逐文件调用)
+        on_batch: 每批写入成功后以该批文档块回调，用于记录断点
+
+        先查 Embedding 缓存，命中的块直接写入；其余文本按服务商的单次条数/token 上限打包，
+        多个批次并发请求 Embedding (限并发、限速、429/5xx 指数退避)；重试耗尽的批次写入重试列表，
+        下次入库时通过 retry_failed_batches 重试。Chroma 的写入在调用线程中按批次完成顺序进行。
         """
-        batch_size = 10  # 每次处理50条，避免API超时
-        
 # --- 第一步：准备数据 (速度很快，不需要进度条，或者简单打印) ---
         ids = []
         documents = []
         metadatas = []
         
-        print(f"正在准备 {len(chunks)} 条文档数据...")
+        if show_progress:
+            print(f"正在准备 {len(chunks)} 条文档数据...")
         for chunk in chunks:
             # 构造元数据
             meta = {
@@ -89,42 +269,120 @@ class VectorStore:
                 "filetype": chunk["filetype"],
                 "page_number": chunk["page_number"],
                 "chunk_id": chunk["chunk_id"],
-                "image_path": chunk.get("image_path", "") 
+                "image_path": chunk.get("image_path", ""),
+                "file_hash": chunk.get("file_hash", ""),
+                "filepath": file_key(chunk["filepath"]) if chunk.get("filepath") else "",
+                # Chroma 元数据不支持列表，页码/图片引用以逗号拼接存储
+                "page_refs": ",".join(str(p) for p in chunk.get("page_refs", [])),
+                "image_refs": ",".join(chunk.get("images", [])),
             }
             
-            # ChromaDB 需要唯一的ID，这里使用 uuid
-            ids.append(str(uuid.uuid4()))
+            # 确定性 ID：没有文件哈希时退化为文件名
+            file_digest = chunk.get("file_hash") or chunk["filename"]
+            ids.append(make_chunk_id(file_digest, chunk["page_number"], chunk["chunk_id"]))
             documents.append(chunk["content"])
             metadatas.append(meta)
 
         # --- 第二步：分批调用 Embedding API 并存储 (这是最慢的步骤，加上进度条) ---
-        total_chunks = len(documents)
-        print("开始调用 Embedding API 并写入数据库...")
-        
-        # [关键修改] tqdm 加在这里，监控 API 调用进度
-        for i in tqdm(range(0, total_chunks, batch_size), desc="Embedding进度", unit="批"):
-            batch_docs = documents[i : i + batch_size]
-            batch_ids = ids[i : i + batch_size]
-            batch_metas = metadatas[i : i + batch_size]
-            
+        if not documents:
+            return []
+        self.check_embedding_model()
+
+        failed_chunks = []
+
+        def upsert(indices: List[int], get_embeddings: Callable[[], List[List[float]]]):
+            batch_chunks = [chunks[i] for i in indices]
             try:
-                # 1. 调用 OpenAI 获取向量
-                response = self.client.embeddings.create(
-                    input=batch_docs,
-                    model=OPENAI_EMBEDDING_MODEL
+                self.collection.upsert(
+                    ids=[ids[i] for i in indices],
+                    embeddings=get_embeddings(),
+                    documents=[documents[i] for i in indices],
+                    metadatas=[metadatas[i] for i in indices],
                 )
-                batch_embeddings = [data.embedding for data in response.data]
-                
-                # 2. 写入 ChromaDB
-                self.collection.add(
-                    ids=batch_ids,
-                    embeddings=batch_embeddings,
-                    documents=batch_docs,
-                    metadatas=batch_metas
+                self.lexical_index.add(
+                    [ids[i] for i in indices],
+                    [documents[i] for i in indices],
+                    [metadatas[i]["filename"] for i in indices],
                 )
             except Exception as e:
-                print(f"\n[Error] 第 {i} 到 {i+batch_size} 条数据处理失败: {e}")
-                # 可以在这里选择 continue 跳过，或者 break 停止
+                print(f"\n[Error] 第 {indices[0]} 到 {indices[-1] + 1} 条数据处理失败: {e}")
+                failed_chunks.extend(batch_chunks)
+                return
+            if on_batch is not None:
+                on_batch(batch_chunks)
+
+        # 命中缓存的块无需调用 API
+        cached = self.embedding_cache.get_many(documents, self.embedder.name)
+        hit_idx = [i for i, v in enumerate(cached) if v is not None]
+        miss_idx = [i for i, v in enumerate(cached) if v is None]
+        for start in range(0, len(hit_idx), CACHED_UPSERT_BATCH):
+            part = hit_idx[start : start + CACHED_UPSERT_BATCH]
+            upsert(part, lambda part=part: [cached[i] for i in part])
+
+        batches = [
+            [miss_idx[j] for j in batch]
+            for batch in pack_batches(
+                count_tokens_batch([documents[i] for i in miss_idx]),
+                self.embedder.max_batch_items,
+                self.embedder.max_batch_tokens,
+            )
+        ]
+        if show_progress:
+            print(
+                f"Embedding 缓存命中 {len(hit_idx)} 条；开始调用 Embedding API 并写入数据库 "
+                f"({len(batches)} 批，并发 {self.embedder.concurrency})..."
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, self.embedder.concurrency)) as executor:
+            futures = {
+                executor.submit(
+                    call_with_backoff,
+                    self._embed_batch,
+                    [documents[i] for i in batch],
+                    max_retries=EMBEDDING_MAX_RETRIES,
+                    rate_limiter=self.rate_limiter,
+                ): batch
+                for batch in batches
+            }
+            # [关键修改] tqdm 加在这里，监控 API 调用进度
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Embedding进度", unit="批", disable=not show_progress):
+                upsert(futures[future], future.result)
+
+        if len(failed_chunks) < len(chunks):
+            # 主题数据有变化，使检索结果缓存失效
+            theme_versions.bump(self.collection_name)
+
+        if failed_chunks:
+            self.retry_list.add(failed_chunks)
+            print(f"⚠️ {len(failed_chunks)} 条数据写入失败，已记录到重试列表: {self.retry_list.path}")
+        return failed_chunks
+
+    def retry_failed_batches(self, on_batch: Optional[Callable[[List[Dict]], None]] = None, show_progress: bool = False) -> int:
+        """重试之前写入失败的块，返回本次成功写入的条数 (仍然失败的会重新记录)"""
+        if not self.retry_list.has_entries():
+            return 0
+        chunks = self.retry_list.pop_all()
+        if not chunks:
+            return 0
+        print(f"🔁 重试 {len(chunks)} 条之前写入失败的数据...")
+        failed = self.add_documents(chunks, show_progress=show_progress, on_batch=on_batch)
+        return len(chunks) - len(failed)
+
+    def delete_file(self, file_path: str) -> None:
+        """删除某个文件的全部文档块 (文件内容变化或被删除时调用)
+
+        按规范化的文件路径匹配，不同子目录下的同名文件互不影响；
+        早期写入的块元数据中没有 filepath，按文件名匹配
+        """
+        doc_ids = self.collection.get(where={"filepath": file_key(file_path)}, include=[])["ids"]
+        legacy = self.collection.get(where={"filename": os.path.basename(file_path)}, include=["metadatas"])
+        doc_ids += [doc_id for doc_id, meta in zip(legacy["ids"], legacy["metadatas"]) if not meta.get("filepath")]
+        if not doc_ids:
+            return
+        self.collection.delete(ids=doc_ids)
+        self.lexical_index.delete(doc_ids)
+        theme_versions.bump(self.collection_name)
+
     def search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
         """搜索相关文档
 
@@ -138,6 +396,13 @@ class VectorStore:
         4. 返回格式化的结果列表
         """
 
+        # 结果缓存的键包含主题版本号，新资料入库后不会返回旧结果
+        self.check_embedding_model()
+        cache_key = (self.collection_name, theme_versions.get(self.collection_name), normalize_query(query), top_k)
+        cached = search_result_cache.get(cache_key)
+        if cached is not None:
+            return [dict(r) for r in cached]
+
         # 1. 获取查询向量
         query_embedding = self.get_embedding(query)
         if not query_embedding:
@@ -150,26 +415,132 @@ class VectorStore:
         )
 
         # 3. 格式化结果
+        formatted_results = self._format_query_results(results)
+        
+        search_result_cache.put(cache_key, [dict(r) for r in formatted_results])
+        return formatted_results
+
+    @staticmethod
+    def _format_query_results(results: Dict) -> List[Dict]:
         formatted_results = []
         if results["documents"]:
             # Chroma 返回的是列表的列表
             for i in range(len(results["documents"][0])):
                 formatted_results.append({
+                    "id": results["ids"][0][i],
                     "content": results["documents"][0][i],
                     "metadata": results["metadatas"][0][i],
                     "score": results["distances"][0][i] if "distances" in results else 0
                 })
-        
         return formatted_results
 
+    async def asearch(self, query: str, top_k: int = TOP_K) -> List[Dict]:
+        """search 的异步版本：查询向量异步获取，Chroma 查询在存储线程池中执行"""
+        self.check_embedding_model()
+        cache_key = (self.collection_name, theme_versions.get(self.collection_name), normalize_query(query), top_k)
+        cached = search_result_cache.get(cache_key)
+        if cached is not None:
+            return [dict(r) for r in cached]
+
+        query_embedding = await self.aget_embedding(query)
+        if not query_embedding:
+            return []
+        results = await run_storage(self.collection.query, query_embeddings=[query_embedding], n_results=top_k)
+        formatted_results = self._format_query_results(results)
+        search_result_cache.put(cache_key, [dict(r) for r in formatted_results])
+        return formatted_results
+
+    def _ensure_lexical_index(self) -> None:
+        """引入词法索引之前构建的集合：首次词法检索时从 Chroma 补建一次"""
+        if self._lexical_checked:
+            return
+        self._lexical_checked = True
+        total = self.collection.count()
+        if not total or self.lexical_index.count():
+            return
+        print(f"🔤 [VectorStore] 正在为集合 {self.collection_name} 补建词法索引 ({total} 条)...")
+        for offset in range(0, total, LEXICAL_BACKFILL_BATCH):
+            page = self.collection.get(
+                limit=LEXICAL_BACKFILL_BATCH, offset=offset, include=["documents", "metadatas"]
+            )
+            self.lexical_index.add(
+                page["ids"],
+                page["documents"],
+                [meta.get("filename", "") for meta in page["metadatas"]],
+            )
+
+    def lexical_search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
+        """词法 (BM25) 检索，返回格式与 search 相同，score 为 BM25 分数 (越大越相关)"""
+        cache_key = (self.collection_name, theme_versions.get(self.collection_name), "lexical", normalize_query(query), top_k)
+        cached = search_result_cache.get(cache_key)
+        if cached is not None:
+            return [dict(r) for r in cached]
+
+        self._ensure_lexical_index()
+        hits = self.lexical_index.search(query, top_k)
+        if not hits:
+            return []
+        page = self.collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+        found = {
+            doc_id: (document, metadata)
+            for doc_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        }
+        formatted_results = [
+            {"id": doc_id, "content": found[doc_id][0], "metadata": found[doc_id][1], "score": score}
+            for doc_id, score in hits
+            if doc_id in found
+        ]
+        search_result_cache.put(cache_key, [dict(r) for r in formatted_results])
+        return formatted_results
+
+    async def alexical_search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
+        """lexical_search 的异步版本 (索引与 Chroma 读取都在存储线程池中执行)"""
+        return await run_storage(self.lexical_search, query, top_k)
+
     def clear_collection(self) -> None:
         """清空collection"""
         self.chroma_client.delete_collection(name=self.collection_name)
         self.collection = self.chroma_client.create_collection(
-            name=self.collection_name, metadata={"description": "课程向量数据库"}
+            name=self.collection_name,
+            metadata={"description": "课程向量数据库", "embedding_model": self.embedder.name},
         )
+        self.lexical_index.clear()
+        # 全量重建后集合改由当前模型构建
+        self.collection_model = self.embedder.name
+        theme_versions.bump(self.collection_name)
         print("向量数据库已清空")
 
+    def cache_stats(self) -> Dict:
+        """查询侧缓存与 Embedding 磁盘缓存的命中率"""
+        return {
+            "query_embedding": query_embedding_cache.stats(),
+            "search_results": search_result_cache.stats(),
+            "embedding_disk": self.embedding_cache.stats(),
+        }
+
     def get_collection_count(self) -> int:
         """获取collection中的文档数量"""
         return self.collection.count()
+
+
+_open_stores: "OrderedDict[tuple, VectorStore]" = OrderedDict()
+_open_stores_lock = threading.Lock()
+
+
+def get_vector_store(collection_name: str, db_path: str = VECTOR_DB_PATH) -> VectorStore:
+    """
+    进程内共享的 VectorStore：同一主题的所有会话 (以及入库 worker) 复用一个已打开的实例，
+    切换主题时无需重新连接集合。最多保留 VECTOR_STORE_CACHE_SIZE 个，超出时淘汰最久未使用的；
+    已加载索引的内存总量由 Chroma 按 CHROMA_MEMORY_LIMIT_MB 控制。
+    """
+    key = (os.path.abspath(db_path), sanitize_collection_name(collection_name))
+    with _open_stores_lock:
+        store = _open_stores.get(key)
+        if store is None:
+            store = VectorStore(db_path=db_path, collection_name=collection_name)
+            _open_stores[key] = store
+        _open_stores.move_to_end(key)
+        while len(_open_stores) > VECTOR_STORE_CACHE_SIZE:
+            # 仍被会话引用的实例不受影响，只是不再由注册表保留
+            _open_stores.popitem(last=False)
+        return store